@@ -0,0 +1,66 @@
+"""
+Ключ корзины анонимного посетителя.
+
+Корзина анонимного посетителя привязана не к сессии Django, а к
+случайному ключу в подписанной cookie cart_id; строки CartItem хранят
+его в поле session_key. Ключ выдаётся только при первом добавлении
+товара (ensure_cart_key), cookie ставит CartIdentityMiddleware. Пока
+посетитель ничего не добавил, его корзина пуста и не стоит записей в
+базу: ни строки django_session, ни строк корзины, а счётчик в шапке
+не обращается ни к базе, ни к кэшу.
+
+Корзины, собранные до появления cookie, привязаны к ключу сессии;
+он используется, если cookie нет, а сессия у посетителя уже есть.
+"""
+
+import secrets
+
+from django.conf import settings
+
+CART_COOKIE_NAME = 'cart_id'
+CART_COOKIE_SALT = 'cart.identity'
+
+
+def get_cart_key(request):
+    """Ключ корзины анонимного посетителя или None, если корзины у него нет"""
+    if not hasattr(request, '_cart_key'):
+        key = request.get_signed_cookie(
+            CART_COOKIE_NAME, default=None, salt=CART_COOKIE_SALT, max_age=settings.SESSION_COOKIE_AGE
+        )
+        # session_key берётся из cookie сессии без обращения к базе
+        request._cart_key = key or request.session.session_key
+    return request._cart_key
+
+
+def ensure_cart_key(request):
+    """Ключ корзины; посетителю без корзины выдаётся новый"""
+    key = get_cart_key(request)
+    if key is None:
+        key = request._cart_key = secrets.token_urlsafe(24)
+        request.cart_key_issued = True
+    return key
+
+
+class CartIdentityMiddleware:
+    """
+    Запоминает ключ корзины до обработки запроса и ставит cookie
+    с ключом, выданным во время запроса
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Ключ запоминается до представления: login() меняет ключ сессии,
+        # а по нему найдутся корзины, собранные до появления cookie (cart.signals)
+        get_cart_key(request)
+        response = self.get_response(request)
+        if getattr(request, 'cart_key_issued', False):
+            response.set_signed_cookie(
+                CART_COOKIE_NAME, request._cart_key, salt=CART_COOKIE_SALT,
+                max_age=settings.SESSION_COOKIE_AGE,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+        return response
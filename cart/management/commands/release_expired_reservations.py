@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from cart.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Возвращает на склад просроченные резервы корзин (запускать по расписанию)'
+
+    def handle(self, *args, **options):
+        released = release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Освобождено резервов: {released}'))
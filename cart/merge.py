@@ -0,0 +1,46 @@
+"""
+Перенос анонимной корзины в корзину пользователя при входе.
+
+Перенос выполняется тремя командами в одной транзакции, независимо от
+размера корзин:
+
+1. строки пользователя, для которых в анонимной корзине есть строка того же
+   товара и типа единицы, увеличиваются на её количество и резерв;
+2. эти анонимные строки удаляются — их резерв уже перешёл к пользователю;
+3. остальные анонимные строки переходят пользователю.
+
+Резервы складываются, поэтому остатки на складе при переносе не меняются.
+Если параллельный запрос успел добавить пользователю строку с тем же
+товаром, третья команда нарушит ограничение cart_item_buyer_line_uniq:
+транзакция откатывается целиком, анонимная корзина остаётся как была.
+"""
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import CartItem
+from .reservations import RESERVATION_TTL
+
+
+def merge_cart(session_key, user):
+    """
+    Переносит анонимную корзину session_key в корзину пользователя user.
+    Возвращает количество анонимных строк, перенесённых или слитых.
+    """
+    anonymous = CartItem.objects.filter(buyer__isnull=True, session_key=session_key)
+    same_anonymous_line = anonymous.filter(product=OuterRef('product'), unit_type=OuterRef('unit_type'))
+    same_user_line = CartItem.objects.filter(buyer=user, product=OuterRef('product'), unit_type=OuterRef('unit_type'))
+    now = timezone.now()
+
+    with transaction.atomic():
+        merged = CartItem.objects.filter(Exists(same_anonymous_line), buyer=user).update(
+            quantity=F('quantity') + Subquery(same_anonymous_line.values('quantity')),
+            reserved_quantity=F('reserved_quantity') + Subquery(same_anonymous_line.values('reserved_quantity')),
+            reserved_until=now + RESERVATION_TTL,
+            updated_at=now,
+        )
+        if merged:
+            anonymous.filter(Exists(same_user_line)).delete()
+        moved = anonymous.update(buyer=user, session_key=None, updated_at=now)
+    return merged + moved
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    # Строки одного товара и типа единицы в корзине владельца сливаются в одну;
+    # резервы складываются, поэтому остатки на складе не меняются
+    CartItem = apps.get_model('cart', 'CartItem')
+    for owner, owned in (('buyer', Q(buyer__isnull=False)), ('session_key', Q(buyer__isnull=True))):
+        groups = (
+            CartItem.objects.filter(owned)
+            .values(owner, 'product', 'unit_type')
+            .annotate(lines=Count('id'))
+            .filter(lines__gt=1)
+        )
+        for group in groups:
+            items = list(CartItem.objects.filter(owned, **{
+                owner: group[owner], 'product': group['product'], 'unit_type': group['unit_type'],
+            }).order_by('id'))
+            kept, rest = items[0], items[1:]
+            kept.quantity = sum(item.quantity for item in items)
+            kept.reserved_quantity = sum(item.reserved_quantity for item in items)
+            kept.reserved_until = max((item.reserved_until for item in items if item.reserved_until), default=None)
+            kept.save(update_fields=['quantity', 'reserved_quantity', 'reserved_until'])
+            CartItem.objects.filter(pk__in=[item.pk for item in rest]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_cartitem_updated_at'),
+        ('products', '0017_product_rating'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('buyer__isnull', False)), fields=('buyer', 'product', 'unit_type'), name='cart_item_buyer_line_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('buyer__isnull', True)), fields=('session_key', 'product', 'unit_type'), name='cart_item_session_line_uniq'),
+        ),
+    ]
@@ -17,13 +17,35 @@ class CartItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     unit_type = models.CharField(max_length=10, choices=UNIT_CHOICES, default='unit', verbose_name='Тип единицы')
     added_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Сколько единиц товара удержано на складе под эту строку и до какого времени;
+    # просроченные резервы возвращаются на склад функцией release_expired (cart.reservations)
+    reserved_quantity = models.PositiveIntegerField(default=0, editable=False)
+    reserved_until = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
+        indexes = [
+            models.Index(fields=['reserved_until'], name='cartitem_reserved_until_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=models.Q(buyer__isnull=False) | models.Q(session_key__isnull=False),
                 name='cart_item_has_owner'
-            )
+            ),
+            # Одна строка на товар и тип единицы в корзине владельца;
+            # по этим ограничениям добавление в корзину выполняет
+            # INSERT ... ON CONFLICT (cart.reservations.add_to_cart_line)
+            models.UniqueConstraint(
+                fields=['buyer', 'product', 'unit_type'],
+                condition=models.Q(buyer__isnull=False),
+                name='cart_item_buyer_line_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['session_key', 'product', 'unit_type'],
+                condition=models.Q(buyer__isnull=True),
+                name='cart_item_session_line_uniq'
+            ),
         ]
 
     def get_price(self):
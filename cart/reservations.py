@@ -0,0 +1,253 @@
+"""
+Резервирование остатков товара (Product.stock) под корзины и заказы.
+
+Product.stock хранит количество, доступное для новых резервов. Остаток
+меняется только условным UPDATE вида
+``UPDATE ... SET stock = stock - n WHERE id = ... AND stock >= n``:
+проверка и списание выполняются одной командой, без предварительного
+чтения и без долгих блокировок строки товара, поэтому параллельные
+покупатели не могут продать больше, чем есть на складе.
+
+Добавление товара в корзину (add_to_cart_line) совмещает это условие
+со вставкой строки: INSERT ... ON CONFLICT DO UPDATE создаёт строку или
+увеличивает её количество.
+
+Резерв строки корзины действует RESERVATION_TTL с последнего изменения.
+Просроченные резервы возвращаются на склад функцией release_expired
+(команда release_expired_reservations, а также при нехватке остатка).
+При оформлении заказа резерв переходит в OrderItem.stock_quantity и
+возвращается на склад при отклонении или отмене заказа.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+RESERVATION_TTL = timedelta(minutes=30)
+
+# Сколько просроченных строк возвращается на склад за одну транзакцию
+RELEASE_BATCH_SIZE = 1000
+
+
+class InsufficientStock(Exception):
+    """Остатка на складе не хватает; products — товары, которых не хватило"""
+
+    def __init__(self, products):
+        self.products = products
+        super().__init__(', '.join(product.name for product in products))
+
+
+def stock_units(product, unit_type, quantity):
+    """Сколько единиц склада занимает строка корзины"""
+    if unit_type == 'package':
+        return quantity * max(product.quantity_in_package, 1)
+    return quantity
+
+
+def adjust_stock(deltas):
+    """
+    Списывает со склада deltas[product_id] единиц каждого товара
+    (отрицательное значение возвращает единицы на склад) одним UPDATE.
+
+    Возвращает False и ничего не меняет, если хотя бы одного товара
+    не хватает.
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return True
+    from products.models import Product
+
+    if len(deltas) == 1:
+        (product_id, delta), = deltas.items()
+        return Product.objects.filter(pk=product_id, stock__gte=delta).update(stock=F('stock') - delta, updated_at=timezone.now()) == 1
+
+    delta = Case(
+        *[When(pk=product_id, then=Value(value)) for product_id, value in deltas.items()],
+        output_field=IntegerField(),
+    )
+    with transaction.atomic():
+        updated = Product.objects.filter(pk__in=deltas, stock__gte=delta).update(stock=F('stock') - delta, updated_at=timezone.now())
+        if updated != len(deltas):
+            transaction.set_rollback(True)
+            return False
+    return True
+
+
+def find_shortages(deltas):
+    """Товары, остатка которых не хватает для списания deltas"""
+    from products.models import Product
+
+    return [
+        product for product in Product.objects.filter(pk__in=[pid for pid, delta in deltas.items() if delta > 0])
+        if product.stock < deltas[product.pk]
+    ]
+
+
+def _reserve(item, quantity):
+    from .models import CartItem
+
+    units = stock_units(item.product, item.unit_type, quantity)
+    with transaction.atomic():
+        if item.pk:
+            # Перечитываем резерв под блокировкой строки корзины, чтобы
+            # его не вернул на склад параллельный release_expired
+            item.reserved_quantity = (
+                CartItem.objects.select_for_update()
+                .values_list('reserved_quantity', flat=True)
+                .get(pk=item.pk)
+            )
+        if quantity <= item.quantity:
+            # Уменьшение не берёт остаток: истёкший резерв не восстанавливается,
+            # возвращается только лишнее
+            units = min(units, item.reserved_quantity)
+        if not adjust_stock({item.product_id: units - item.reserved_quantity}):
+            return False
+        item.quantity = quantity
+        item.reserved_quantity = units
+        item.reserved_until = timezone.now() + RESERVATION_TTL
+        item.save()
+    return True
+
+
+def reserve(item, quantity):
+    """
+    Устанавливает количество строки корзины quantity и резервирует под неё
+    остаток (списывает недостающее или возвращает лишнее). Сохраняет строку.
+    Возвращает False, если остатка не хватает; строка при этом не меняется.
+    Уменьшение количества всегда успешно.
+    """
+    if _reserve(item, quantity):
+        return True
+    # Возможно, остаток занят просроченными резервами других корзин
+    if release_expired(product_id=item.product_id):
+        return _reserve(item, quantity)
+    return False
+
+
+# Добавление в корзину: строка владельца создаётся или увеличивается по
+# ограничениям cart_item_buyer_line_uniq / cart_item_session_line_uniq
+_LINE_COLUMNS = 'buyer_id, session_key, product_id, unit_type, quantity, reserved_quantity, reserved_until, added_at, updated_at'
+
+
+def _upsert_line_sql(owner_column, rows):
+    condition = 'buyer_id IS NOT NULL' if owner_column == 'buyer_id' else 'buyer_id IS NULL'
+    return (
+        f'INSERT INTO cart_cartitem AS line ({_LINE_COLUMNS}) {rows} '
+        f'ON CONFLICT ({owner_column}, product_id, unit_type) WHERE {condition} DO UPDATE SET '
+        'quantity = line.quantity + EXCLUDED.quantity, '
+        'reserved_quantity = line.reserved_quantity + EXCLUDED.reserved_quantity, '
+        'reserved_until = EXCLUDED.reserved_until, '
+        'updated_at = EXCLUDED.updated_at '
+        'RETURNING quantity'
+    )
+
+
+def _add_to_cart_line(owner_data, product, unit_type, quantity):
+    units = stock_units(product, unit_type, quantity)
+    buyer = owner_data.get('buyer')
+    if buyer is not None:
+        owner_column, buyer_id, session_key = 'buyer_id', buyer.pk, None
+    else:
+        owner_column, buyer_id, session_key = 'session_key', None, owner_data['session_key']
+    now = timezone.now()
+    reserved_until, now = (connection.ops.adapt_datetimefield_value(value) for value in (now + RESERVATION_TTL, now))
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Списание остатка и запись строки — одна команда: строка
+            # вставляется, только если UPDATE товара прошёл по условию stock >= units
+            cursor.execute(
+                'WITH taken AS ('
+                '    UPDATE products_product SET stock = stock - %s, updated_at = %s'
+                '    WHERE id = %s AND stock >= %s RETURNING id'
+                ') '
+                + _upsert_line_sql(owner_column, (
+                    'SELECT %s::integer, %s::varchar, taken.id, %s::varchar, %s::integer, %s::integer, '
+                    '%s::timestamptz, %s::timestamptz, %s::timestamptz FROM taken'
+                )),
+                [units, now, product.pk, units,
+                 buyer_id, session_key, unit_type, quantity, units, reserved_until, now, now],
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+        # SQLite не поддерживает изменяющие запросы в WITH: те же две команды в одной транзакции
+        with transaction.atomic():
+            if not adjust_stock({product.pk: units}):
+                return None
+            cursor.execute(
+                _upsert_line_sql(owner_column, 'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)'),
+                [buyer_id, session_key, product.pk, unit_type, quantity, units, reserved_until, now, now],
+            )
+            return cursor.fetchone()[0]
+
+
+def add_to_cart_line(owner_data, product, unit_type, quantity):
+    """
+    Добавляет quantity товара в строку корзины владельца owner_data
+    (создаёт её или увеличивает количество) и резервирует под добавленное
+    остаток. Проверка остатка, списание и запись строки выполняются без
+    предварительного чтения строки, поэтому параллельные добавления не
+    создают дублей. Возвращает новое количество строки или None, если
+    остатка не хватает (ничего не меняется).
+    """
+    line_quantity = _add_to_cart_line(owner_data, product, unit_type, quantity)
+    # Возможно, остаток занят просроченными резервами других корзин
+    if line_quantity is None and release_expired(product_id=product.pk):
+        line_quantity = _add_to_cart_line(owner_data, product, unit_type, quantity)
+    return line_quantity
+
+
+def release(item):
+    """
+    Возвращает на склад резерв строки корзины перед её удалением;
+    вызывается в одной транзакции с удалением строки
+    """
+    from .models import CartItem
+
+    with transaction.atomic():
+        reserved = (
+            CartItem.objects.select_for_update()
+            .filter(pk=item.pk)
+            .values_list('reserved_quantity', flat=True)
+            .first()
+        )
+        if reserved:
+            CartItem.objects.filter(pk=item.pk).update(reserved_quantity=0, reserved_until=None, updated_at=timezone.now())
+            adjust_stock({item.product_id: -reserved})
+    item.reserved_quantity = 0
+    item.reserved_until = None
+
+
+def release_expired(now=None, product_id=None):
+    """
+    Возвращает на склад просроченные резервы корзин.
+    Строки, заблокированные другой транзакцией, пропускаются.
+    Возвращает количество освобождённых строк.
+    """
+    from .models import CartItem
+
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            expired = CartItem.objects.filter(reserved_quantity__gt=0, reserved_until__lt=now)
+            if product_id is not None:
+                expired = expired.filter(product_id=product_id)
+            rows = list(
+                expired.select_for_update(skip_locked=True)
+                .values_list('id', 'product_id', 'reserved_quantity')[:RELEASE_BATCH_SIZE]
+            )
+            if not rows:
+                return released
+            deltas = defaultdict(int)
+            for _, row_product_id, reserved in rows:
+                deltas[row_product_id] -= reserved
+            CartItem.objects.filter(id__in=[row[0] for row in rows]).update(reserved_quantity=0, reserved_until=None, updated_at=timezone.now())
+            adjust_stock(deltas)
+        released += len(rows)
+        if len(rows) < RELEASE_BATCH_SIZE:
+            return released
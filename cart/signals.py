@@ -0,0 +1,46 @@
+import logging
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import IntegrityError
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from products.models import Product
+
+from .identity import get_cart_key
+from .merge import merge_cart
+from .models import CartItem
+from .summary import forget_cart_summaries, forget_cart_summary, refresh_cart_summary
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    # Ключ корзины запомнен до входа (CartIdentityMiddleware): login() меняет ключ сессии
+    cart_key = get_cart_key(request) if request is not None else None
+    if not cart_key:
+        return
+    try:
+        if not merge_cart(cart_key, user):
+            return
+    except IntegrityError:
+        logger.warning('Корзина %s не перенесена пользователю %s: параллельное изменение корзины', cart_key, user.pk)
+        return
+    forget_cart_summary({'session_key': cart_key})
+    refresh_cart_summary({'buyer': user})
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance, **kwargs):
+    # Строки корзины удалятся каскадом, запоминаем их владельцев заранее
+    instance._cart_owners = list(
+        CartItem.objects.filter(product=instance).values_list('buyer_id', 'session_key').distinct()
+    )
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    owners = getattr(instance, '_cart_owners', None)
+    if owners:
+        forget_cart_summaries(owners)
@@ -0,0 +1,73 @@
+"""
+Сводка корзины (количество товаров) для каждого владельца.
+
+Сводка хранится в кэше и пересчитывается одним агрегирующим запросом
+при каждом изменении корзины, поэтому счётчик в шапке сайта читается
+без обращения к таблице cart_cartitem. Строки корзины удаляются и
+каскадом при удалении товара: сводки их владельцев сбрасывает
+cart.signals.
+"""
+
+from django.core.cache import cache
+from django.db.models import Sum
+
+from .identity import get_cart_key
+
+# Ограничивает жизнь сводки, если два параллельных изменения записали её не по порядку
+SUMMARY_TIMEOUT = 60 * 60
+
+
+def _owner_cache_key(buyer_id, session_key):
+    if buyer_id is not None:
+        return f'cart:summary:buyer:{buyer_id}'
+    return f'cart:summary:session:{session_key}'
+
+
+def _cache_key(owner_filter):
+    buyer = owner_filter.get('buyer')
+    return _owner_cache_key(buyer.pk if buyer is not None else None, owner_filter.get('session_key'))
+
+
+def compute_cart_summary(owner_filter):
+    from .models import CartItem
+
+    result = CartItem.objects.filter(**owner_filter).aggregate(count=Sum('quantity'))
+    return {'count': result['count'] or 0}
+
+
+def refresh_cart_summary(owner_filter):
+    """Пересчитывает сводку после изменения корзины и сохраняет её в кэш"""
+    summary = compute_cart_summary(owner_filter)
+    cache.set(_cache_key(owner_filter), summary, SUMMARY_TIMEOUT)
+    return summary
+
+
+def forget_cart_summary(owner_filter):
+    """Удаляет сводку из кэша (корзина перенесена другому владельцу)"""
+    cache.delete(_cache_key(owner_filter))
+
+
+def forget_cart_summaries(owners):
+    """Удаляет сводки владельцев, заданных парами (buyer_id, session_key)"""
+    cache.delete_many([_owner_cache_key(buyer_id, session_key) for buyer_id, session_key in owners])
+
+
+def get_cart_summary(owner_filter):
+    """Сводка из кэша; при промахе пересчитывается из базы"""
+    summary = cache.get(_cache_key(owner_filter))
+    if summary is None:
+        summary = refresh_cart_summary(owner_filter)
+    return summary
+
+
+def get_request_cart_count(request):
+    """
+    Количество товаров в корзине посетителя. Анонимный посетитель без
+    ключа корзины (cart.identity) ничего не добавлял: его корзина пуста.
+    """
+    if request.user.is_authenticated:
+        return get_cart_summary({'buyer': request.user})['count']
+    key = get_cart_key(request)
+    if not key:
+        return 0
+    return get_cart_summary({'session_key': key})['count']
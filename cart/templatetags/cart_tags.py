@@ -1,17 +1,15 @@
 from django import template
-from cart.models import CartItem
-from cart.views import get_cart_owner_info
+from cart.summary import get_request_cart_count
 
 register = template.Library()
 
 @register.simple_tag(takes_context=True)
 def cart_items_count(context):
-    """Возвращает количество товаров в корзине"""
+    """Возвращает количество товаров в корзине (из кэшированной сводки)"""
     request = context['request']
     
     try:
-        owner_filter, _ = get_cart_owner_info(request)
-        cart_items = CartItem.objects.filter(**owner_filter)
-        return sum(item.quantity for item in cart_items)
+        # Посетителю без корзины ни сессия, ни ключ корзины не создаются
+        return get_request_cart_count(request)
     except:
         return 0
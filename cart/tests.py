@@ -1,3 +1,350 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import DatabaseError, OperationalError, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from products.models import Product
+from .identity import CART_COOKIE_NAME
+from .merge import merge_cart
+from .models import CartItem
+from .reservations import add_to_cart_line, release, release_expired, reserve
+from .summary import get_request_cart_count, refresh_cart_summary
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.master = User.objects.create_user(username='master', role='master')
+        self.buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.product = Product.objects.create(
+            master=self.master, name='Товар', description='', price=1, stock=10, quantity_in_package=4
+        )
+
+    def stock(self):
+        self.product.refresh_from_db(fields=['stock'])
+        return self.product.stock
+
+    def test_reserve_takes_and_returns_difference(self):
+        item = CartItem(buyer=self.buyer, product=self.product, quantity=0)
+        self.assertTrue(reserve(item, 6))
+        self.assertEqual(self.stock(), 4)
+        self.assertTrue(reserve(item, 2))
+        self.assertEqual(self.stock(), 8)
+        release(item)
+        self.assertEqual(self.stock(), 10)
+
+    def test_reserve_fails_without_changes(self):
+        item = CartItem(buyer=self.buyer, product=self.product, quantity=0)
+        self.assertTrue(reserve(item, 3))
+        self.assertFalse(reserve(item, 11))
+        item.refresh_from_db()
+        self.assertEqual((item.quantity, item.reserved_quantity), (3, 3))
+        self.assertEqual(self.stock(), 7)
+
+    def test_package_reserves_units_in_package(self):
+        item = CartItem(buyer=self.buyer, product=self.product, quantity=0, unit_type='package')
+        self.assertTrue(reserve(item, 2))
+        self.assertEqual(self.stock(), 2)
+        self.assertFalse(reserve(item, 3))
+
+    def test_expired_reservation_is_released(self):
+        item = CartItem(buyer=self.buyer, product=self.product, quantity=0)
+        reserve(item, 10)
+        CartItem.objects.filter(pk=item.pk).update(reserved_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired(), 1)
+        self.assertEqual(self.stock(), 10)
+        item.refresh_from_db()
+        self.assertEqual((item.quantity, item.reserved_quantity), (10, 0))
+
+    def test_decrease_after_lapsed_reservation_takes_no_stock(self):
+        item = CartItem(buyer=self.buyer, product=self.product, quantity=0)
+        reserve(item, 5)
+        CartItem.objects.filter(pk=item.pk).update(reserved_until=timezone.now() - timedelta(seconds=1))
+        release_expired()
+        Product.objects.filter(pk=self.product.pk).update(stock=0)
+
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('cart:update_quantity', args=[item.pk, 'decrease']), follow=True)
+        self.assertEqual([message.tags for message in response.context['messages']], ['success'])
+        item.refresh_from_db()
+        self.assertEqual((item.quantity, item.reserved_quantity), (4, 0))
+        self.assertEqual(self.stock(), 0)
+
+    def test_failed_remove_keeps_reservation(self):
+        item = CartItem(buyer=self.buyer, product=self.product, quantity=0)
+        reserve(item, 3)
+        self.client.force_login(self.buyer)
+        with mock.patch.object(CartItem, 'delete', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.client.get(reverse('cart:remove_from_cart', args=[item.pk]))
+        item.refresh_from_db()
+        self.assertEqual(item.reserved_quantity, 3)
+        self.assertEqual(self.stock(), 7)
+
+    def test_expired_reservations_are_reclaimed_on_shortage(self):
+        other = User.objects.create_user(username='other', role='buyer')
+        stale = CartItem(buyer=other, product=self.product, quantity=0)
+        reserve(stale, 10)
+        CartItem.objects.filter(pk=stale.pk).update(reserved_until=timezone.now() - timedelta(seconds=1))
+        item = CartItem(buyer=self.buyer, product=self.product, quantity=0)
+        self.assertTrue(reserve(item, 5))
+        self.assertEqual(self.stock(), 5)
+
+
+class AddToCartLineTests(TestCase):
+    def setUp(self):
+        self.master = User.objects.create_user(username='master', role='master')
+        self.buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.product = Product.objects.create(
+            master=self.master, name='Товар', description='', price=1, stock=10, quantity_in_package=4
+        )
+
+    def test_adds_to_existing_line_of_owner(self):
+        owner = {'buyer': self.buyer}
+        self.assertEqual(add_to_cart_line(owner, self.product, 'unit', 2), 2)
+        self.assertEqual(add_to_cart_line(owner, self.product, 'unit', 3), 5)
+        self.assertEqual(add_to_cart_line(owner, self.product, 'package', 1), 1)
+        self.assertEqual(add_to_cart_line({'session_key': 'anon'}, self.product, 'unit', 1), 1)
+
+        lines = CartItem.objects.order_by('id').values_list('buyer', 'session_key', 'unit_type', 'quantity', 'reserved_quantity')
+        self.assertEqual(list(lines), [
+            (self.buyer.pk, None, 'unit', 5, 5),
+            (self.buyer.pk, None, 'package', 1, 4),
+            (None, 'anon', 'unit', 1, 1),
+        ])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+
+    def test_shortage_changes_nothing(self):
+        add_to_cart_line({'buyer': self.buyer}, self.product, 'unit', 8)
+        self.assertIsNone(add_to_cart_line({'buyer': self.buyer}, self.product, 'package', 1))
+        self.assertIsNone(add_to_cart_line({'buyer': self.buyer}, self.product, 'unit', 3))
+        self.assertEqual(list(CartItem.objects.values_list('quantity', flat=True)), [8])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+
+
+class MergeCartTests(TestCase):
+    """Анонимная корзина переходит пользователю при входе"""
+
+    def setUp(self):
+        cache.clear()
+        master = User.objects.create_user(username='master', role='master')
+        self.products = [
+            Product.objects.create(master=master, name=f'Товар {i}', description='', price=1, stock=100)
+            for i in range(20)
+        ]
+
+    def fill(self, owner, products, quantity):
+        for product in products:
+            add_to_cart_line(owner, product, 'unit', quantity)
+
+    def test_merges_same_lines_and_moves_the_rest(self):
+        buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.fill({'buyer': buyer}, self.products[:2], 1)
+        self.fill({'session_key': 'anon'}, self.products[1:3], 2)
+
+        self.assertEqual(merge_cart('anon', buyer), 2)
+        lines = CartItem.objects.order_by('product_id').values_list('buyer', 'session_key', 'quantity', 'reserved_quantity')
+        self.assertEqual(list(lines), [(buyer.pk, None, 1, 1), (buyer.pk, None, 3, 3), (buyer.pk, None, 2, 2)])
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=[p.pk for p in self.products[:3]]).order_by('pk').values_list('stock', flat=True)),
+            [99, 97, 98],
+        )
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        for size in (2, 20):
+            buyer = User.objects.create_user(username=f'buyer_{size}', role='buyer')
+            self.fill({'buyer': buyer}, self.products[:size // 2], 1)
+            self.fill({'session_key': f'anon_{size}'}, self.products[:size], 1)
+            # Три команды переноса и точка сохранения вокруг них
+            with self.assertNumQueries(5):
+                merge_cart(f'anon_{size}', buyer)
+            self.assertEqual(CartItem.objects.filter(buyer=buyer).count(), size)
+
+    def test_login_merges_cart_of_cookie(self):
+        buyer = User.objects.create_user(username='buyer', role='buyer', phone='992900000000')
+        self.fill({'buyer': buyer}, self.products[:1], 1)
+        self.client.post(reverse('cart:add_to_cart', args=[self.products[0].pk]), {'quantity': 2})
+        self.assertEqual(self.client.get(reverse('cart:get_cart_count')).json(), {'count': 2})
+
+        self.client.post(reverse('accounts:login'), {'phone': '+992 900 00 00 00'})
+        self.assertEqual(list(CartItem.objects.values_list('buyer', 'quantity')), [(buyer.pk, 3)])
+        self.assertEqual(self.client.get(reverse('cart:get_cart_count')).json(), {'count': 3})
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        master = User.objects.create_user(username='master', role='master')
+        self.product = Product.objects.create(master=master, name='Товар', description='', price=1, stock=10)
+        self.buyer = User.objects.create_user(username='buyer', role='buyer')
+
+    def make_request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = SessionStore()
+        return request
+
+    def test_cached_count_is_read_without_queries(self):
+        add_to_cart_line({'buyer': self.buyer}, self.product, 'unit', 2)
+        refresh_cart_summary({'buyer': self.buyer})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_request_cart_count(self.make_request(self.buyer)), 2)
+        # Посетитель без ключа корзины не обращается ни к базе, ни к кэшу
+        with self.assertNumQueries(0), mock.patch.object(cache, 'get', side_effect=AssertionError('cache.get')):
+            self.assertEqual(get_request_cart_count(self.make_request(AnonymousUser())), 0)
+
+    def test_product_delete_resets_summaries(self):
+        other = Product.objects.create(master=self.product.master, name='Другой', description='', price=1, stock=10)
+        for owner in ({'buyer': self.buyer}, {'session_key': 'anon'}):
+            add_to_cart_line(owner, self.product, 'unit', 2)
+            add_to_cart_line(owner, other, 'unit', 1)
+            self.assertEqual(refresh_cart_summary(owner), {'count': 3})
+
+        self.product.delete()
+        self.assertEqual(get_request_cart_count(self.make_request(self.buyer)), 1)
+        request = self.make_request(AnonymousUser())
+        request._cart_key = 'anon'
+        self.assertEqual(get_request_cart_count(request), 1)
+
+
+class CartCountConditionalGetTests(TestCase):
+    def test_unchanged_count_is_not_modified(self):
+        master = User.objects.create_user(username='master', role='master')
+        product = Product.objects.create(master=master, name='Товар', description='', price=1, stock=10)
+        self.client.force_login(User.objects.create_user(username='buyer', role='buyer'))
+        url = reverse('cart:get_cart_count')
+
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(reverse('cart:add_to_cart', args=[product.pk]), {'quantity': 2})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json(), {'count': 2})
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    """Параллельные покупатели не могут зарезервировать больше остатка"""
+
+    THREADS = 16
+    STOCK = 10
+
+    def test_no_oversell_under_concurrency(self):
+        master = User.objects.create_user(username='master', role='master')
+        product = Product.objects.create(master=master, name='Товар', description='', price=1, stock=self.STOCK)
+        buyers = [User.objects.create_user(username=f'buyer_{i}', role='buyer') for i in range(self.THREADS)]
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def buy(buyer):
+            try:
+                item = CartItem(buyer=buyer, product=Product.objects.get(pk=product.pk), quantity=0)
+                barrier.wait()
+                while True:
+                    try:
+                        results.append(reserve(item, 1))
+                        return
+                    except OperationalError:
+                        # SQLite в тестах сообщает о блокировке вместо ожидания
+                        continue
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(buyer,)) for buyer in buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(len(results), self.THREADS)
+        self.assertEqual(results.count(True), self.STOCK)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(CartItem.objects.filter(product=product).count(), self.STOCK)
+
+    def test_parallel_adds_keep_one_line(self):
+        master = User.objects.create_user(username='master', role='master')
+        product = Product.objects.create(master=master, name='Товар', description='', price=1, stock=self.STOCK * 2)
+        buyer = User.objects.create_user(username='buyer', role='buyer')
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def add(owner):
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        results.append(add_to_cart_line(owner, product, 'unit', 1))
+                        return
+                    except OperationalError:
+                        continue
+            finally:
+                connection.close()
+
+        # Половина потоков добавляет товар в корзину покупателя, половина — в анонимную
+        owners = [{'buyer': buyer}, {'session_key': 'anon'}] * (self.THREADS // 2)
+        threads = [threading.Thread(target=add, args=(owner,)) for owner in owners]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.THREADS)
+        lines = CartItem.objects.filter(product=product).values_list('session_key', 'quantity')
+        self.assertCountEqual(lines, [(None, self.THREADS // 2), ('anon', self.THREADS // 2)])
+        product.refresh_from_db()
+        self.assertEqual(product.stock, self.STOCK * 2 - self.THREADS)
+
+
+class LazyCartIdentityTests(TestCase):
+    """Анонимный посетитель получает ключ корзины только при добавлении товара"""
+
+    def setUp(self):
+        cache.clear()
+        master = User.objects.create_user(username='master', role='master')
+        self.product = Product.objects.create(master=master, name='Товар', description='', price=1, stock=10)
+
+    def test_browsing_writes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            for url in (reverse('products:product_list'), reverse('cart:view_cart'), reverse('cart:get_cart_count')):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn(CART_COOKIE_NAME, response.cookies)
+        writes = [query['sql'] for query in queries if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(writes, [])
+        self.assertFalse(Session.objects.exists())
+
+    def test_first_add_issues_cookie_and_keeps_cart(self):
+        self.client.post(reverse('cart:add_to_cart', args=[self.product.pk]), {'quantity': 2})
+        key = self.client.cookies[CART_COOKIE_NAME].value
+        item = CartItem.objects.get()
+        self.assertEqual(item.quantity, 2)
+        self.assertNotEqual(item.session_key, key)  # в cookie ключ хранится подписанным
+        self.assertTrue(key.startswith(item.session_key))
+
+        response = self.client.post(reverse('cart:add_to_cart', args=[self.product.pk]), {'quantity': 1})
+        self.assertNotIn(CART_COOKIE_NAME, response.cookies)
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+        self.assertEqual(self.client.get(reverse('cart:get_cart_count')).json(), {'count': 3})
+        self.assertFalse(Session.objects.filter(session_key=item.session_key).exists())
+
+    def test_forged_cookie_is_ignored(self):
+        CartItem.objects.create(session_key='someone-else', product=self.product, quantity=1)
+        self.client.cookies[CART_COOKIE_NAME] = 'someone-else'
+        response = self.client.get(reverse('cart:view_cart'))
+        self.assertEqual(list(response.context['cart_items']), [])
+
+    def test_legacy_session_cart_is_found(self):
+        session = self.client.session
+        session.save()
+        CartItem.objects.create(session_key=session.session_key, product=self.product, quantity=4)
+        self.assertEqual(self.client.get(reverse('cart:get_cart_count')).json(), {'count': 4})
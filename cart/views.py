@@ -2,27 +2,34 @@
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.db import transaction
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import condition, require_POST
 import json
+from .identity import ensure_cart_key, get_cart_key
 from .models import CartItem
+from .reservations import add_to_cart_line, release, reserve
+from .summary import get_request_cart_count, refresh_cart_summary
 from products.models import Product
 
-def get_cart_owner_info(request):
-    """Получает информацию о владельце корзины (пользователь или сессия)"""
+def get_cart_owner_info(request, create=False):
+    """
+    Получает информацию о владельце корзины (пользователь или ключ
+    анонимной корзины, см. cart.identity). Ключ выдаётся только при
+    create=True; посетителю без ключа соответствует пустая корзина.
+    """
     if request.user.is_authenticated:
         return {'buyer': request.user}, {'buyer': request.user}
-    else:
-        # Убедимся, что у нас есть ключ сессии
-        if not request.session.session_key:
-            request.session.create()
-        return {'session_key': request.session.session_key}, {'session_key': request.session.session_key}
+    key = ensure_cart_key(request) if create else get_cart_key(request)
+    # Пустой ключ не принадлежит ни одной строке корзины
+    key = key or ''
+    return {'session_key': key}, {'session_key': key}
 
 def view_cart(request):
     owner_filter, _ = get_cart_owner_info(request)
     
-    cart_items = CartItem.objects.filter(**owner_filter)
+    cart_items = CartItem.objects.filter(**owner_filter).select_related('product')
     total = sum(item.get_total_price() for item in cart_items)
     
     return render(request, 'cart/cart_view.html', {
@@ -35,36 +42,29 @@ def add_to_cart(request, product_id):
     quantity = int(request.POST.get('quantity', 1))
     unit_type = request.POST.get('unit_type', 'unit')  # 'unit' или 'package'
     
-    owner_filter, owner_data = get_cart_owner_info(request)
-    
-    # Проверяем, есть ли уже такой товар с такой же единицей измерения в корзине
-    existing_item = CartItem.objects.filter(
-        product=product, 
-        unit_type=unit_type,
-        **owner_filter
-    ).first()
+    owner_filter, owner_data = get_cart_owner_info(request, create=True)
+    unit_display = dict(CartItem.UNIT_CHOICES)[unit_type]
     
-    if existing_item:
-        existing_item.quantity += quantity
-        existing_item.save()
-        unit_display = dict(CartItem.UNIT_CHOICES)[unit_type]
+    # Строка создаётся или увеличивается одной командой вместе с резервом остатка
+    line_quantity = add_to_cart_line(owner_data, product, unit_type, quantity) if quantity >= 1 else None
+    if line_quantity is None:
+        messages.error(request, f"Недостаточно товара {product.name} в наличии.")
+    elif line_quantity > quantity:
         messages.success(request, f"Количество товара {product.name} ({unit_display}) обновлено в корзине.")
     else:
-        CartItem.objects.create(
-            product=product,
-            quantity=quantity,
-            unit_type=unit_type,
-            **owner_data
-        )
-        unit_display = dict(CartItem.UNIT_CHOICES)[unit_type]
         messages.success(request, f"Товар {product.name} ({unit_display}) добавлен в корзину.")
     
+    refresh_cart_summary(owner_filter)
     return redirect('products:product_detail', pk=product_id)
 
 def remove_from_cart(request, pk):
     owner_filter, _ = get_cart_owner_info(request)
     item = get_object_or_404(CartItem, pk=pk, **owner_filter)
-    item.delete()
+    # Резерв возвращается на склад только вместе с удалением строки
+    with transaction.atomic():
+        release(item)
+        item.delete()
+    refresh_cart_summary(owner_filter)
     messages.success(request, "Товар удален из корзины.")
     return redirect('cart:view_cart')
 
@@ -73,13 +73,17 @@ def update_quantity(request, pk, action):
     item = get_object_or_404(CartItem, pk=pk, **owner_filter)
     
     if action == 'increase':
-        item.quantity += 1
-        messages.success(request, "Количество товара увеличено.")
+        if reserve(item, item.quantity + 1):
+            messages.success(request, "Количество товара увеличено.")
+        else:
+            messages.error(request, "Недостаточно товара в наличии.")
     elif action == 'decrease' and item.quantity > 1:
-        item.quantity -= 1
-        messages.success(request, "Количество товара уменьшено.")
+        if reserve(item, item.quantity - 1):
+            messages.success(request, "Количество товара уменьшено.")
+        else:
+            messages.error(request, "Не удалось изменить количество товара.")
     
-    item.save()
+    refresh_cart_summary(owner_filter)
     return redirect('cart:view_cart')
 
 @require_POST
@@ -88,45 +92,33 @@ def add_to_cart_ajax(request):
     try:
         data = json.loads(request.body)
         product_id = data.get('product_id')
-        quantity = data.get('quantity', 1)
+        quantity = int(data.get('quantity', 1))
         unit_type = data.get('unit_type', 'unit')
         
         product = get_object_or_404(Product, id=product_id)
         
-        # Проверяем наличие товара
-        if quantity > product.stock:
-            return JsonResponse({
-                'success': False,
-                'message': f'В наличии только {product.stock} шт.'
-            })
-        
-        owner_filter, owner_data = get_cart_owner_info(request)
-        
-        # Проверяем, есть ли уже такой товар с такой же единицей измерения в корзине
-        existing_item = CartItem.objects.filter(
-            product=product, 
-            unit_type=unit_type,
-            **owner_filter
-        ).first()
+        owner_filter, owner_data = get_cart_owner_info(request, create=True)
+        unit_display = dict(CartItem.UNIT_CHOICES)[unit_type]
         
-        if existing_item:
-            new_quantity = existing_item.quantity + quantity
-            if new_quantity > product.stock:
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Превышено количество в наличии. В корзине уже {existing_item.quantity} шт.'
-                })
-            existing_item.quantity = new_quantity
-            existing_item.save()
-        else:
-            CartItem.objects.create(
+        # Резервируем товар на складе; проверка остатка, списание и запись строки корзины
+        # выполняются без предварительного чтения строки
+        line_quantity = add_to_cart_line(owner_data, product, unit_type, quantity) if quantity >= 1 else None
+        if line_quantity is None:
+            in_cart = CartItem.objects.filter(
                 product=product,
-                quantity=quantity,
                 unit_type=unit_type,
-                **owner_data
-            )
+                **owner_filter
+            ).values_list('quantity', flat=True).first()
+            if in_cart:
+                message = f'Превышено количество в наличии. В корзине уже {in_cart} шт.'
+            else:
+                message = f'В наличии только {product.stock} шт.'
+            return JsonResponse({
+                'success': False,
+                'message': message
+            })
         
-        unit_display = dict(CartItem.UNIT_CHOICES)[unit_type]
+        refresh_cart_summary(owner_filter)
         return JsonResponse({
             'success': True,
             'message': f'Товар "{product.name}" ({unit_display}) добавлен в корзину'
@@ -138,10 +130,11 @@ def add_to_cart_ajax(request):
             'message': 'Произошла ошибка при добавлении товара'
         })
 
+def cart_count_etag(request):
+    # Ответ состоит только из количества, оно и служит валидатором
+    return str(get_request_cart_count(request))
+
+@condition(etag_func=cart_count_etag)
 def get_cart_count(request):
     """API endpoint для получения количества товаров в корзине"""
-    owner_filter, _ = get_cart_owner_info(request)
-    cart_items = CartItem.objects.filter(**owner_filter)
-    count = sum(item.quantity for item in cart_items)
-    
-    return JsonResponse({'count': count})
+    return JsonResponse({'count': get_request_cart_count(request)})
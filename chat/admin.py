@@ -1,3 +1,18 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Conversation, Message
+
+
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ['buyer', 'seller', 'product', 'order', 'last_message_at', 'buyer_unread', 'seller_unread']
+    search_fields = ['buyer__username', 'seller__username', 'product__name']
+    raw_id_fields = ['buyer', 'seller', 'product', 'order']
+    readonly_fields = ['created_at', 'last_message_at', 'buyer_unread', 'seller_unread']
+
+
+@admin.register(Message)
+class MessageAdmin(admin.ModelAdmin):
+    list_display = ['conversation', 'sender', 'created_at']
+    search_fields = ['text', 'sender__username']
+    raw_id_fields = ['conversation', 'sender']
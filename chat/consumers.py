@@ -0,0 +1,84 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.utils import timezone
+
+from .models import Conversation
+from .writer import flush_pending, get_writer
+
+# Коды закрытия соединения (диапазон 4000-4999 — коды приложения)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+
+MAX_MESSAGE_LENGTH = 2000
+
+
+def conversation_group(conversation_id):
+    return f'chat.conversation.{conversation_id}'
+
+
+@database_sync_to_async
+def participant_role(conversation_id, user):
+    conversation = Conversation.objects.filter(pk=conversation_id).only('buyer_id', 'seller_id').first()
+    return conversation.role_of(user) if conversation else None
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Соединение участника переписки. Сообщение рассылается участникам
+    сразу после получения, а в базу записывается пакетом (chat.writer),
+    поэтому отправка не ждёт базы данных.
+
+    Клиент отправляет {"text": "..."} или {"type": "read"}, когда
+    переписка открыта и сообщения прочитаны.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close(code=CLOSE_UNAUTHORIZED)
+            return
+        self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
+        self.role = await participant_role(self.conversation_id, self.user)
+        if self.role is None:
+            await self.close(code=CLOSE_FORBIDDEN)
+            return
+        self.group_name = conversation_group(self.conversation_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            # При остановке сервера соединения закрываются раньше, чем завершается
+            # цикл событий: очередь записывается, а не пропадает вместе с ним
+            await flush_pending()
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict):
+            return
+        if content.get('type') == 'read':
+            get_writer().mark_read(self.conversation_id, self.role)
+            return
+
+        text = str(content.get('text', '')).strip()[:MAX_MESSAGE_LENGTH]
+        if not text:
+            return
+        created_at = timezone.now()
+        recipient_role = 'seller' if self.role == 'buyer' else 'buyer'
+        get_writer().add_message(self.conversation_id, self.user.pk, recipient_role, text, created_at)
+        await self.channel_layer.group_send(self.group_name, {
+            'type': 'chat.message',
+            'sender_id': self.user.pk,
+            'sender_name': self.user.get_full_name() or self.user.username,
+            'text': text,
+            'created_at': created_at.isoformat(),
+        })
+
+    async def chat_message(self, event):
+        await self.send_json({
+            'type': 'message',
+            'sender_id': event['sender_id'],
+            'sender_name': event['sender_name'],
+            'text': event['text'],
+            'created_at': event['created_at'],
+        })
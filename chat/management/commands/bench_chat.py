@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from accounts.models import User
+from chat.models import Conversation, Message
+from chat.routing import websocket_urlpatterns
+from chat.writer import get_writer, write_batch
+from products.models import Product
+
+USERNAME_PREFIX = 'bench_chat_'
+
+
+def write_one(conversation_id, sender_id, text):
+    """Запись сообщения без пакетов: INSERT и UPDATE счётчика на каждое сообщение"""
+    with transaction.atomic():
+        Message.objects.create(conversation_id=conversation_id, sender_id=sender_id, text=text)
+        Conversation.objects.filter(pk=conversation_id).update(
+            seller_unread=F('seller_unread') + 1, last_message_at=timezone.now(),
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет пропускную способность чата в одном процессе с уровнем каналов в памяти: '
+        'доставку сообщений по websocket и их пакетную запись в базу'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=100, help='Количество переписок (по два соединения)')
+        parser.add_argument('--messages', type=int, default=10000, help='Количество сообщений')
+
+    def handle(self, *args, **options):
+        # Потребители пишут в базу из своих потоков, поэтому данные создаются
+        # обычными транзакциями и удаляются в конце, а не откатываются
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        seller = User.objects.create_user(username=f'{USERNAME_PREFIX}seller', role='master')
+        product = Product.objects.create(master=seller, name='Товар', description='', price=1)
+        buyers = User.objects.bulk_create([
+            User(username=f'{USERNAME_PREFIX}buyer_{i}', role='buyer') for i in range(options['conversations'])
+        ])
+        conversations = Conversation.objects.bulk_create([
+            Conversation(buyer=buyer, seller=seller, product=product) for buyer in buyers
+        ])
+        try:
+            results = asyncio.run(self.run(conversations, options['messages']))
+        finally:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+        count, deliver_s, persist_s, persisted, single_rate, batch_rate = results
+        self.stdout.write(f'Сообщений: {count}, переписок: {len(conversations)}')
+        self.stdout.write(f'Доставка по websocket: {count / deliver_s:10.0f} сообщений/с')
+        self.stdout.write(
+            f'Доставка и пакетная запись: {count / persist_s:10.0f} сообщений/с (записано {persisted})'
+        )
+        self.stdout.write(f'Запись пакетами (write_batch): {batch_rate:10.0f} сообщений/с')
+        self.stdout.write(f'Запись по одному сообщению: {single_rate:10.0f} сообщений/с')
+
+    async def run(self, conversations, count):
+        application = URLRouter(websocket_urlpatterns)
+        pairs = []
+        for conversation in conversations:
+            sockets = []
+            for user in (conversation.buyer, conversation.seller):
+                scope = {'type': 'websocket', 'path': f'/ws/chat/{conversation.pk}/', 'query_string': b'',
+                         'headers': [], 'subprotocols': [], 'user': user}
+                socket = ApplicationCommunicator(application, scope)
+                await socket.send_input({'type': 'websocket.connect'})
+                assert (await socket.receive_output(timeout=10))['type'] == 'websocket.accept'
+                sockets.append(socket)
+            pairs.append(sockets)
+
+        async def drain(socket, expected):
+            for _ in range(expected):
+                json.loads((await socket.receive_output(timeout=60))['text'])
+
+        # Сообщения отправляют покупатели по кругу; каждое получают оба участника
+        per_pair = [count // len(pairs) + (i < count % len(pairs)) for i in range(len(pairs))]
+        started = time.perf_counter()
+        receivers = [
+            asyncio.ensure_future(drain(socket, expected))
+            for (buyer, seller), expected in zip(pairs, per_pair)
+            for socket in (buyer, seller)
+        ]
+        for n in range(max(per_pair)):
+            for (buyer, _), expected in zip(pairs, per_pair):
+                if n < expected:
+                    await buyer.send_input({'type': 'websocket.receive', 'text': json.dumps({'text': f'Сообщение {n}'})})
+            # Отдаём управление потребителям, как это делает сервер между чтениями сокетов
+            await asyncio.sleep(0)
+        await asyncio.gather(*receivers)
+        deliver_s = time.perf_counter() - started
+        await get_writer().flush()
+        persist_s = time.perf_counter() - started
+        persisted = await database_sync_to_async(Message.objects.filter(conversation__in=conversations).count)()
+
+        for buyer, seller in pairs:
+            for socket in (buyer, seller):
+                await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+                await socket.wait(timeout=10)
+
+        sample = min(count, 1000)
+        conversation = conversations[0]
+        started = time.perf_counter()
+        for n in range(sample):
+            await database_sync_to_async(write_one)(conversation.pk, conversation.buyer_id, f'Сообщение {n}')
+        single_rate = sample / (time.perf_counter() - started)
+
+        messages = [
+            Message(conversation_id=conversation.pk, sender_id=conversation.buyer_id, text=f'Сообщение {n}',
+                    created_at=timezone.now())
+            for n in range(count)
+        ]
+        unread = {(conversation.pk, 'seller_unread'): (False, count)}
+        started = time.perf_counter()
+        await database_sync_to_async(write_batch)(messages, unread)
+        batch_rate = count / (time.perf_counter() - started)
+
+        return count, deliver_s, persist_s, persisted, single_rate, batch_rate
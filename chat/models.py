@@ -1,3 +1,92 @@
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 
-# Create your models here.
+from accounts.models import User
+from orders.models import Order
+from products.models import Product
+
+# Участники переписки и поля их счётчиков непрочитанных сообщений
+ROLES = ('buyer', 'seller')
+
+
+class Conversation(models.Model):
+    """
+    Переписка покупателя с продавцом о товаре или о заказе.
+
+    Счётчики непрочитанных хранятся для каждого участника и меняются
+    пакетами вместе с записью сообщений (chat.writer), поэтому список
+    переписок не считает сообщения.
+    """
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='buyer_conversations', verbose_name='Покупатель')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='seller_conversations', verbose_name='Продавец')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True, related_name='conversations', verbose_name='Товар')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='conversations', verbose_name='Заказ')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создана')
+    last_message_at = models.DateTimeField(default=timezone.now, verbose_name='Последнее сообщение')
+    buyer_unread = models.PositiveIntegerField(default=0, verbose_name='Не прочитано покупателем')
+    seller_unread = models.PositiveIntegerField(default=0, verbose_name='Не прочитано продавцом')
+
+    class Meta:
+        verbose_name = 'Переписка'
+        verbose_name_plural = 'Переписки'
+        indexes = [
+            # Списки переписок участника, новые сверху
+            models.Index(fields=['buyer', '-last_message_at', '-id'], name='conv_buyer_last_idx'),
+            models.Index(fields=['seller', '-last_message_at', '-id'], name='conv_seller_last_idx'),
+        ]
+        constraints = [
+            # Одна переписка на товар или заказ для пары участников
+            models.UniqueConstraint(fields=['buyer', 'seller', 'product'], condition=Q(order__isnull=True),
+                                    name='conv_product_uniq'),
+            models.UniqueConstraint(fields=['buyer', 'seller', 'order'], condition=Q(order__isnull=False),
+                                    name='conv_order_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.buyer.username} — {self.seller.username}: {self.topic}"
+
+    @property
+    def topic(self):
+        if self.order_id:
+            return f"Заказ #{self.order_id}"
+        if self.product_id:
+            return self.product.name
+        return "Товар удалён"
+
+    def role_of(self, user):
+        """'buyer', 'seller' или None, если пользователь не участвует в переписке"""
+        if user.pk == self.buyer_id:
+            return 'buyer'
+        if user.pk == self.seller_id:
+            return 'seller'
+        return None
+
+    def companion(self, user):
+        return self.seller if user.pk == self.buyer_id else self.buyer
+
+    def unread_for(self, user):
+        role = self.role_of(user)
+        return getattr(self, f'{role}_unread') if role else 0
+
+
+class Message(models.Model):
+    """
+    Сообщение переписки. created_at задаётся при получении сообщения
+    потребителем, а строка записывается позже пакетом (chat.writer).
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages', verbose_name='Переписка')
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_messages', verbose_name='Отправитель')
+    text = models.TextField(verbose_name='Текст')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='Отправлено')
+
+    class Meta:
+        verbose_name = 'Сообщение'
+        verbose_name_plural = 'Сообщения'
+        indexes = [
+            # Курсорная пагинация истории переписки
+            models.Index(fields=['conversation', '-created_at', '-id'], name='message_conv_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sender.username}: {self.text[:50]}"
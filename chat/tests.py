@@ -1,3 +1,202 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from channels.layers import InMemoryChannelLayer
+from channels.routing import URLRouter
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from fruitsite.channel_layers import ThrottledInMemoryChannelLayer
+from products.models import Product
+from .models import Conversation, Message
+from .routing import websocket_urlpatterns
+from .writer import MessageWriter, get_writer, lifespan
+
+
+def create_conversation():
+    seller = User.objects.create_user(username='seller', role='master')
+    buyer = User.objects.create_user(username='buyer', role='buyer')
+    product = Product.objects.create(master=seller, name='Хурма', description='', price=10)
+    return Conversation.objects.create(buyer=buyer, seller=seller, product=product)
+
+
+class MessageWriterTests(TransactionTestCase):
+    """Сообщения и счётчики непрочитанных записываются пакетом"""
+
+    def setUp(self):
+        self.conversation = create_conversation()
+
+    def test_batch_updates_counters_in_order(self):
+        conversation = self.conversation
+
+        async def scenario():
+            writer = MessageWriter()
+            for i in range(3):
+                writer.add_message(conversation.pk, conversation.buyer_id, 'seller', f'Вопрос {i}', timezone.now())
+            writer.add_message(conversation.pk, conversation.seller_id, 'buyer', 'Ответ', timezone.now())
+            # Продавец прочитал переписку, после этого пришло ещё одно сообщение
+            writer.mark_read(conversation.pk, 'seller')
+            writer.add_message(conversation.pk, conversation.buyer_id, 'seller', 'Ещё вопрос', timezone.now())
+            self.assertEqual(await writer.flush(), 5)
+        async_to_sync(scenario)()
+
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.buyer_unread, conversation.seller_unread), (1, 1))
+        last = Message.objects.order_by('-created_at', '-id').first()
+        self.assertEqual(last.text, 'Ещё вопрос')
+        self.assertEqual(conversation.last_message_at, last.created_at)
+
+    def test_deleted_conversation_does_not_drop_batch(self):
+        conversation = self.conversation
+        other = Conversation.objects.create(
+            buyer=User.objects.create_user(username='other', role='buyer'),
+            seller=conversation.seller, product=conversation.product,
+        )
+
+        async def scenario():
+            writer = MessageWriter()
+            writer.add_message(other.pk, other.buyer_id, 'seller', 'Удалённая переписка', timezone.now())
+            writer.add_message(conversation.pk, conversation.buyer_id, 'seller', 'Вопрос', timezone.now())
+            await database_sync_to_async(other.delete)()
+            with self.assertLogs('chat.writer', 'WARNING'):
+                self.assertEqual(await writer.flush(), 1)
+        async_to_sync(scenario)()
+
+        self.assertEqual(list(Message.objects.values_list('text', flat=True)), ['Вопрос'])
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.seller_unread, 1)
+
+    def test_server_shutdown_flushes_queue(self):
+        conversation = self.conversation
+
+        async def scenario():
+            get_writer().add_message(conversation.pk, conversation.buyer_id, 'seller', 'Перед деплоем', timezone.now())
+            server = ApplicationCommunicator(lifespan, {'type': 'lifespan'})
+            await server.send_input({'type': 'lifespan.startup'})
+            self.assertEqual((await server.receive_output())['type'], 'lifespan.startup.complete')
+            await server.send_input({'type': 'lifespan.shutdown'})
+            self.assertEqual((await server.receive_output())['type'], 'lifespan.shutdown.complete')
+            self.assertEqual(get_writer().pending, 0)
+        async_to_sync(scenario)()
+
+        self.assertEqual(list(Message.objects.values_list('text', flat=True)), ['Перед деплоем'])
+
+
+class ChatConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.conversation = create_conversation()
+        self.stranger = User.objects.create_user(username='stranger', role='buyer')
+
+    def communicator(self, user):
+        # channels.testing тянет за собой daphne, поэтому протокол websocket ведётся вручную
+        scope = {'type': 'websocket', 'path': f'/ws/chat/{self.conversation.pk}/', 'query_string': b'',
+                 'headers': [], 'subprotocols': [], 'user': user}
+        return ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+
+    async def connect(self, communicator):
+        await communicator.send_input({'type': 'websocket.connect'})
+        return await communicator.receive_output()
+
+    def test_message_is_delivered_then_persisted(self):
+        conversation = self.conversation
+
+        async def scenario():
+            stranger = await self.connect(self.communicator(self.stranger))
+            self.assertEqual((stranger['type'], stranger['code']), ('websocket.close', 4403))
+
+            buyer, seller = self.communicator(conversation.buyer), self.communicator(conversation.seller)
+            for socket in (buyer, seller):
+                self.assertEqual((await self.connect(socket))['type'], 'websocket.accept')
+
+            await buyer.send_input({'type': 'websocket.receive', 'text': json.dumps({'text': 'Сладкая?'})})
+            for socket in (buyer, seller):
+                event = json.loads((await socket.receive_output())['text'])
+                self.assertEqual((event['sender_id'], event['text']), (conversation.buyer_id, 'Сладкая?'))
+
+            # Очередь записывается при закрытии соединений, не дожидаясь FLUSH_INTERVAL
+            for socket in (buyer, seller):
+                await socket.send_input({'type': 'websocket.disconnect', 'code': 1001})
+                await socket.wait()
+            self.assertEqual(get_writer().pending, 0)
+        async_to_sync(scenario)()
+
+        self.assertEqual(list(Message.objects.values_list('text', flat=True)), ['Сладкая?'])
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.buyer_unread, conversation.seller_unread), (0, 1))
+
+
+class ChatViewsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.conversation = create_conversation()
+
+    def test_start_conversation_is_idempotent(self):
+        self.client.force_login(self.conversation.buyer)
+        url = reverse('chat:start_product_conversation', args=[self.conversation.product_id])
+        response = self.client.post(url)
+        self.assertRedirects(response, reverse('chat:conversation_detail', args=[self.conversation.pk]))
+        self.client.post(url)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_start_conversation_race_reuses_existing(self):
+        self.client.force_login(self.conversation.buyer)
+        url = reverse('chat:start_product_conversation', args=[self.conversation.product_id])
+        # Параллельный запрос создал переписку после того, как этот её не нашёл
+        with mock.patch.object(Conversation.objects, 'filter') as lookup:
+            lookup.return_value.first.return_value = None
+            response = self.client.post(url)
+        self.assertRedirects(response, reverse('chat:conversation_detail', args=[self.conversation.pk]))
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_history_pages_and_read_resets_counter(self):
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, sender=self.conversation.buyer, text=f'Сообщение {i}')
+            for i in range(60)
+        ])
+        Conversation.objects.filter(pk=self.conversation.pk).update(seller_unread=60)
+        self.client.force_login(self.conversation.seller)
+
+        response = self.client.get(reverse('chat:conversation_detail', args=[self.conversation.pk]))
+        page = response.context['messages_page']
+        self.assertEqual((page[0].text, page[-1].text), ('Сообщение 10', 'Сообщение 59'))
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.seller_unread, 0)
+
+        history = self.client.get(
+            reverse('chat:conversation_history', args=[self.conversation.pk]),
+            {'cursor': response.context['older_cursor']},
+        ).json()
+        self.assertEqual([message['text'] for message in history['messages']], [f'Сообщение {i}' for i in range(10)])
+        self.assertIsNone(history['older_cursor'])
+
+    def test_other_users_cannot_read(self):
+        self.client.force_login(User.objects.create_user(username='stranger'))
+        response = self.client.get(reverse('chat:conversation_history', args=[self.conversation.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ChannelLayerTests(TestCase):
+    """Очистка просроченного в слое каналов в памяти выполняется не чаще CLEAN_INTERVAL"""
+
+    def test_cleanup_is_throttled(self):
+        layer = ThrottledInMemoryChannelLayer()
+
+        async def scenario():
+            channel = await layer.new_channel()
+            await layer.group_add('orders', channel)
+            for _ in range(3):
+                await layer.group_send('orders', {'type': 'order.update'})
+                await layer.receive(channel)
+            layer._cleaned_at -= layer.CLEAN_INTERVAL
+            await layer.group_send('orders', {'type': 'order.update'})
+
+        # receive и group_send очищают через _clean_expired (channels 4.2)
+        with mock.patch.object(InMemoryChannelLayer, '_clean_expired', autospec=True) as clean_expired:
+            async_to_sync(scenario)()
+        self.assertEqual(clean_expired.call_count, 2)
@@ -0,0 +1,12 @@
+from django.urls import path
+from . import views
+
+app_name = 'chat'
+
+urlpatterns = [
+    path('', views.conversation_list, name='conversation_list'),
+    path('<int:pk>/', views.conversation_detail, name='conversation_detail'),
+    path('<int:pk>/history/', views.conversation_history, name='conversation_history'),
+    path('product/<int:product_id>/', views.start_product_conversation, name='start_product_conversation'),
+    path('order/<int:order_id>/', views.start_order_conversation, name='start_order_conversation'),
+]
@@ -1,3 +1,147 @@
-from django.shortcuts import render
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_GET, require_POST
 
-# Create your views here.
+from orders.models import Order, OrderItem
+from products.models import Product
+from products.pagination import KeysetPaginator
+from .models import Conversation, Message
+
+CONVERSATIONS_PER_PAGE = 20
+MESSAGES_PER_PAGE = 50
+HISTORY_ORDERING = ('-created_at', '-id')
+
+
+def _get_conversation(request, pk):
+    conversation = get_object_or_404(
+        Conversation.objects.select_related('buyer', 'seller', 'product'), pk=pk
+    )
+    if conversation.role_of(request.user) is None:
+        raise Http404
+    return conversation
+
+
+def _history_page(conversation, cursor):
+    """Страница истории от новых к старым; cursor ведёт к более старым сообщениям"""
+    messages_qs = Message.objects.filter(conversation=conversation).select_related('sender')
+    return KeysetPaginator(messages_qs, MESSAGES_PER_PAGE, ordering=HISTORY_ORDERING).get_page(cursor)
+
+
+def _message_data(message):
+    return {
+        'sender_id': message.sender_id,
+        'sender_name': message.sender.get_full_name() or message.sender.username,
+        'text': message.text,
+        'created_at': message.created_at.isoformat(),
+    }
+
+
+def _open_conversation(**lookup):
+    """
+    Переписка по lookup; создаётся при первом обращении. Параллельный
+    запрос мог создать её между поиском и вставкой — тогда вставка
+    нарушает уникальное ограничение, и переписка читается заново.
+    """
+    conversation = Conversation.objects.filter(**lookup).first()
+    if conversation is not None:
+        return conversation
+    try:
+        with transaction.atomic():
+            return Conversation.objects.create(**lookup)
+    except IntegrityError:
+        return Conversation.objects.get(**lookup)
+
+
+@login_required
+def conversation_list(request):
+    """
+    Переписки пользователя (как покупателя и как продавца), новые сверху
+    """
+    conversations = (
+        Conversation.objects
+        .filter(Q(buyer=request.user) | Q(seller=request.user))
+        .select_related('buyer', 'seller', 'product')
+    )
+    paginator = KeysetPaginator(conversations, CONVERSATIONS_PER_PAGE, ordering=('-last_message_at', '-id'))
+    page = paginator.get_page(request.GET.get('cursor'))
+    items = [
+        {
+            'conversation': conversation,
+            'companion': conversation.companion(request.user),
+            'unread': conversation.unread_for(request.user),
+        }
+        for conversation in page
+    ]
+    return render(request, 'chat/conversation_list.html', {'page': page, 'items': items})
+
+
+@login_required
+def conversation_detail(request, pk):
+    """
+    Переписка: последние сообщения; новые приходят по websocket,
+    более старые подгружаются из conversation_history
+    """
+    conversation = _get_conversation(request, pk)
+    role = conversation.role_of(request.user)
+    page = _history_page(conversation, None)
+
+    # Открытая переписка прочитана: счётчик обнуляется без подсчёта сообщений
+    if getattr(conversation, f'{role}_unread'):
+        Conversation.objects.filter(pk=conversation.pk).update(**{f'{role}_unread': 0})
+
+    return render(request, 'chat/conversation_detail.html', {
+        'conversation': conversation,
+        'companion': conversation.companion(request.user),
+        'messages_page': list(reversed(page.object_list)),
+        'older_cursor': page.next_cursor,
+    })
+
+
+@login_required
+@require_GET
+def conversation_history(request, pk):
+    """
+    Более старые сообщения переписки (JSON) для подгрузки при прокрутке вверх
+    """
+    conversation = _get_conversation(request, pk)
+    page = _history_page(conversation, request.GET.get('cursor'))
+    return JsonResponse({
+        'messages': [_message_data(message) for message in reversed(page.object_list)],
+        'older_cursor': page.next_cursor,
+    })
+
+
+@login_required
+@require_POST
+def start_product_conversation(request, product_id):
+    """
+    Переписка покупателя с продавцом о товаре (создаётся при первом обращении)
+    """
+    product = get_object_or_404(Product, pk=product_id)
+    if product.master_id == request.user.pk:
+        messages.error(request, "Это ваш товар.")
+        return redirect('products:product_detail', pk=product.pk)
+    conversation = _open_conversation(
+        buyer=request.user, seller_id=product.master_id, product=product, order=None,
+    )
+    return redirect('chat:conversation_detail', pk=conversation.pk)
+
+
+@login_required
+@require_POST
+def start_order_conversation(request, order_id):
+    """
+    Переписка продавца с покупателем о заказе, в котором есть товары продавца
+    """
+    order = get_object_or_404(Order, pk=order_id)
+    if not OrderItem.objects.filter(order=order, product__master=request.user).exists():
+        messages.error(request, "У вас нет товаров в этом заказе.")
+        return redirect('orders:seller_orders')
+    conversation = _open_conversation(
+        buyer_id=order.buyer_id, seller=request.user, order=order,
+    )
+    return redirect('chat:conversation_detail', pk=conversation.pk)
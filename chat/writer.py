@@ -0,0 +1,164 @@
+"""
+Пакетная запись сообщений чата.
+
+Потребитель (chat.consumers) рассылает сообщение участникам сразу,
+а запись в базу откладывает: сообщения и изменения счётчиков
+непрочитанных копятся в MessageWriter своего цикла событий и
+записываются одной транзакцией раз в FLUSH_INTERVAL секунд или при
+накоплении BATCH_SIZE сообщений (bulk_create и по одному UPDATE на
+переписку).
+
+При закрытии соединения и при штатной остановке сервера (событие
+lifespan.shutdown, см. lifespan) накопленное записывается сразу.
+Сообщения, ещё не записанные при аварийной остановке процесса,
+теряются (не больше, чем за FLUSH_INTERVAL). Сообщения переписки,
+удалённой до записи, отбрасываются без потери остального пакета;
+при другой ошибке записи пакет отбрасывается целиком, ошибка
+записывается в журнал.
+"""
+
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+from django.db import transaction
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import Greatest
+
+from .models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.2
+
+
+def write_batch(messages, unread):
+    """
+    Записывает сообщения и изменения счётчиков одной транзакцией.
+    unread: {(conversation_id, поле счётчика): (reset, delta)} — при reset
+    счётчик сначала обнулён (участник прочитал переписку), затем увеличен на delta.
+    Сообщения переписок, удалённых до записи, отбрасываются, остальной
+    пакет записывается. Возвращает число записанных сообщений.
+    """
+    conversation_ids = {message.conversation_id for message in messages}
+    conversation_ids.update(conversation_id for conversation_id, _ in unread)
+
+    with transaction.atomic():
+        # Блокировка строк не даёт удалить переписку до конца записи
+        existing = set(
+            Conversation.objects.select_for_update()
+            .filter(pk__in=conversation_ids).values_list('pk', flat=True)
+        )
+        if len(existing) < len(conversation_ids):
+            dropped = [message for message in messages if message.conversation_id not in existing]
+            logger.warning(
+                'Переписки %s удалены до записи, отброшено сообщений: %s',
+                sorted(conversation_ids - existing), len(dropped),
+            )
+            messages = [message for message in messages if message.conversation_id in existing]
+
+        updates = defaultdict(dict)
+        for (conversation_id, field), (reset, delta) in unread.items():
+            if conversation_id in existing:
+                updates[conversation_id][field] = Value(delta) if reset else F(field) + delta
+        for message in messages:
+            # Сообщения в пакете идут по времени, последнее — самое новое
+            updates[message.conversation_id]['last_message_at'] = Greatest(
+                F('last_message_at'), Value(message.created_at, output_field=DateTimeField())
+            )
+
+        Message.objects.bulk_create(messages, batch_size=BATCH_SIZE)
+        for conversation_id, fields in updates.items():
+            Conversation.objects.filter(pk=conversation_id).update(**fields)
+    return len(messages)
+
+
+class MessageWriter:
+    """Очередь записи сообщений одного цикла событий"""
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._messages = []
+        self._unread = {}
+        self._flush_requested = asyncio.Event()
+        self._task = None
+
+    def add_message(self, conversation_id, sender_id, recipient_role, text, created_at):
+        self._messages.append(Message(
+            conversation_id=conversation_id, sender_id=sender_id, text=text, created_at=created_at,
+        ))
+        reset, delta = self._unread.get((conversation_id, f'{recipient_role}_unread'), (False, 0))
+        self._unread[(conversation_id, f'{recipient_role}_unread')] = (reset, delta + 1)
+        if len(self._messages) >= self.batch_size:
+            self._flush_requested.set()
+        self._start()
+
+    def mark_read(self, conversation_id, role):
+        # Сообщения, добавленные после отметки, снова увеличат счётчик
+        self._unread[(conversation_id, f'{role}_unread')] = (True, 0)
+        self._start()
+
+    @property
+    def pending(self):
+        return len(self._messages)
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        # Задача завершается, когда записывать нечего, и запускается заново при новом сообщении
+        while self._messages or self._unread:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Записывает накопленное; возвращает число записанных сообщений"""
+        if not self._messages and not self._unread:
+            return 0
+        messages, unread = self._messages, self._unread
+        self._messages, self._unread = [], {}
+        try:
+            return await database_sync_to_async(write_batch)(messages, unread)
+        except Exception:
+            logger.exception('Не удалось записать пакет сообщений чата (%s сообщений)', len(messages))
+            return 0
+
+
+_writers = weakref.WeakKeyDictionary()
+
+
+def get_writer():
+    """MessageWriter текущего цикла событий"""
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        writer = _writers[loop] = MessageWriter()
+    return writer
+
+
+async def flush_pending():
+    """Записывает накопленное MessageWriter текущего цикла событий, если он есть"""
+    writer = _writers.get(asyncio.get_running_loop())
+    if writer is not None:
+        await writer.flush()
+
+
+async def lifespan(scope, receive, send):
+    """ASGI-приложение lifespan: при остановке сервера записывает очередь сообщений"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await flush_pending()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -2,14 +2,26 @@ import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
+from channels.security.websocket import AllowedHostsOriginValidator
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fruitsite.settings')
 
+# Приложение Django инициализируется до импорта потребителей, которые используют модели
+django_asgi_app = get_asgi_application()
+
+from chat.routing import websocket_urlpatterns as chat_websocket_urlpatterns  # noqa: E402
+from chat.writer import lifespan as chat_lifespan  # noqa: E402
+from orders.routing import websocket_urlpatterns as orders_websocket_urlpatterns  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
-        URLRouter(
-            # здесь добавишь urls для чата
+    "http": django_asgi_app,
+    "websocket": AllowedHostsOriginValidator(
+        AuthMiddlewareStack(
+            URLRouter(
+                orders_websocket_urlpatterns + chat_websocket_urlpatterns
+            )
         )
     ),
+    # При остановке сервера записываются сообщения чата, ещё не записанные пакетом
+    "lifespan": chat_lifespan,
 })
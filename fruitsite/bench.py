@@ -0,0 +1,32 @@
+"""
+Вспомогательные функции для management-команд бенчмарков.
+
+Бенчмарки создают свои тестовые данные внутри транзакции, которая
+откатывается по завершении, поэтому их можно запускать на любой базе.
+"""
+
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def rolled_back():
+    """Выполняет блок в транзакции и откатывает все изменения"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(func, repeat=20, warmup=2):
+    """Возвращает медианное время выполнения func в миллисекундах"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
@@ -0,0 +1,253 @@
+"""
+Двухуровневый кэш проекта.
+
+Первый уровень — небольшой LRU в памяти процесса, второй — общий кэш
+(Redis, а без REDIS_URL — LocMemCache как замена для тестов и
+бенчмарков). Ключи разделены на пространства имён по префиксу до
+первого двоеточия ('products:...', 'cart:...'); для каждого
+пространства в настройках задаются время жизни в общем кэше и время
+жизни копии в памяти процесса. Пространства без local_timeout читаются
+только из общего кэша: так данные, которые меняются в других
+процессах (например, корзина покупателя), не бывают устаревшими.
+
+Записи, удаления и incr проходят через оба уровня, поэтому процесс
+сразу видит свои изменения; изменения других процессов видны после
+истечения local_timeout. Счётчики попаданий и промахов по уровням
+и пространствам возвращает stats().
+"""
+
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Потокобезопасный LRU с временем жизни записей; значения хранятся сериализованными"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            data, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+        return pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (data, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def namespace_of(key):
+    return str(key).split(':', 1)[0]
+
+
+class TwoTierCache(BaseCache):
+    """
+    Бэкенд кэша: LRU процесса перед общим кэшем из CACHES[OPTIONS['SHARED']].
+
+    OPTIONS:
+        SHARED — псевдоним общего кэша в CACHES;
+        LOCAL_MAX_ENTRIES — размер LRU процесса;
+        NAMESPACES — {пространство: {'timeout': ..., 'local_timeout': ...}}.
+    """
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        super().__init__(params)
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._namespaces = options.get('NAMESPACES', {})
+        self._local = LocalLRU(options.get('LOCAL_MAX_ENTRIES', 1000))
+        self._stats = defaultdict(Counter)
+        self._stats_lock = threading.Lock()
+
+    @cached_property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # --- Настройки пространств имён ---------------------------------------
+
+    def _timeout(self, namespace, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            return self._namespaces.get(namespace, {}).get('timeout', self.default_timeout)
+        return timeout
+
+    def _local_ttl(self, namespace, timeout=None):
+        ttl = self._namespaces.get(namespace, {}).get('local_timeout', 0)
+        if timeout is not None:
+            ttl = min(ttl, timeout)
+        return ttl if ttl > 0 else 0
+
+    def _count(self, namespace, event, amount=1):
+        with self._stats_lock:
+            self._stats[namespace][event] += amount
+
+    def stats(self):
+        """{пространство: {'local_hits', 'shared_hits', 'misses', 'hit_ratio'}} для этого процесса"""
+        with self._stats_lock:
+            result = {}
+            for namespace, counter in self._stats.items():
+                hits = counter['local_hits'] + counter['shared_hits']
+                lookups = hits + counter['misses']
+                result[namespace] = {
+                    'local_hits': counter['local_hits'],
+                    'shared_hits': counter['shared_hits'],
+                    'misses': counter['misses'],
+                    'hit_ratio': hits / lookups if lookups else 0.0,
+                }
+            return result
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+    # --- API кэша ---------------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        namespace = namespace_of(key)
+        local_key = self.make_key(key, version)
+        local_ttl = self._local_ttl(namespace)
+        if local_ttl:
+            value = self._local.get(local_key)
+            if value is not _MISSING:
+                self._count(namespace, 'local_hits')
+                return value
+        value = self.shared.get(key, _MISSING, version)
+        if value is _MISSING:
+            self._count(namespace, 'misses')
+            return default
+        self._count(namespace, 'shared_hits')
+        if local_ttl:
+            self._local.set(local_key, value, local_ttl)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        namespace = namespace_of(key)
+        timeout = self._timeout(namespace, timeout)
+        self.shared.set(key, value, timeout, version)
+        self._set_local(namespace, key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        namespace = namespace_of(key)
+        timeout = self._timeout(namespace, timeout)
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self._set_local(namespace, key, value, timeout, version)
+        else:
+            # Значение в общем кэше неизвестно, копия процесса могла устареть
+            self._local.delete(self.make_key(key, version))
+        return added
+
+    def _set_local(self, namespace, key, value, timeout, version):
+        local_key = self.make_key(key, version)
+        local_ttl = self._local_ttl(namespace, timeout)
+        if local_ttl:
+            self._local.set(local_key, value, local_ttl)
+        else:
+            self._local.delete(local_key)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, self._timeout(namespace_of(key), timeout), version)
+
+    def delete(self, key, version=None):
+        self._local.delete(self.make_key(key, version))
+        return self.shared.delete(key, version)
+
+    def has_key(self, key, version=None):
+        namespace = namespace_of(key)
+        if self._local_ttl(namespace) and self._local.get(self.make_key(key, version)) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version)
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_key(key, version)
+        self._local.delete(local_key)
+        value = self.shared.incr(key, delta, version)
+        local_ttl = self._local_ttl(namespace_of(key))
+        if local_ttl:
+            self._local.set(local_key, value, local_ttl)
+        return value
+
+    def get_many(self, keys, version=None):
+        result = {}
+        remaining = []
+        for key in keys:
+            namespace = namespace_of(key)
+            value = _MISSING
+            if self._local_ttl(namespace):
+                value = self._local.get(self.make_key(key, version))
+            if value is _MISSING:
+                remaining.append(key)
+            else:
+                self._count(namespace, 'local_hits')
+                result[key] = value
+        if remaining:
+            found = self.shared.get_many(remaining, version)
+            for key in remaining:
+                namespace = namespace_of(key)
+                if key in found:
+                    self._count(namespace, 'shared_hits')
+                    result[key] = found[key]
+                    local_ttl = self._local_ttl(namespace)
+                    if local_ttl:
+                        self._local.set(self.make_key(key, version), found[key], local_ttl)
+                else:
+                    self._count(namespace, 'misses')
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        # Время жизни по умолчанию зависит от пространства, поэтому ключи группируются по нему
+        groups = defaultdict(dict)
+        for key, value in data.items():
+            groups[self._timeout(namespace_of(key), timeout)][key] = value
+        failed = []
+        for group_timeout, group in groups.items():
+            failed.extend(self.shared.set_many(group, group_timeout, version))
+            for key, value in group.items():
+                if key not in failed:
+                    self._set_local(namespace_of(key), key, value, group_timeout, version)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._local.delete(self.make_key(key, version))
+        self.shared.delete_many(keys, version)
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def clear_local(self):
+        """Очищает только копии процесса (например, в тестах, имитирующих другой процесс)"""
+        self._local.clear()
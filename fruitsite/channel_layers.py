@@ -0,0 +1,37 @@
+"""
+Уровень каналов в памяти процесса для работы без Redis.
+
+InMemoryChannelLayer из channels очищает просроченные сообщения и членство
+в группах при каждом receive и group_send, проходя по всем каналам и группам.
+Каждое открытое websocket-соединение ждёт в receive, поэтому открытие N
+соединений и рассылка N событий стоят O(N²). Здесь очистка выполняется
+не чаще раза в CLEAN_INTERVAL секунд: сроки жизни сообщений (expiry, 60 с)
+и членства в группах (group_expiry, сутки) намного больше, поэтому
+поведение не меняется.
+
+Публичного способа ограничить очистку нет: receive и group_send сами
+вызывают приватный метод _clean_expired, поэтому переопределяется он.
+Версия channels закреплена в requirements.txt (4.2.2); тест
+chat.tests.ChannelLayerTests проверяет, что receive и group_send
+по-прежнему очищают через _clean_expired, и при обновлении channels
+сообщит, если это изменилось.
+"""
+
+import time
+
+from channels.layers import InMemoryChannelLayer
+
+
+class ThrottledInMemoryChannelLayer(InMemoryChannelLayer):
+    CLEAN_INTERVAL = 1
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cleaned_at = 0
+
+    def _clean_expired(self):
+        now = time.monotonic()
+        if now - self._cleaned_at < self.CLEAN_INTERVAL:
+            return
+        self._cleaned_at = now
+        super()._clean_expired()
@@ -0,0 +1,149 @@
+"""
+Локальная замена S3 для бенчмарков и тестов хранилищ.
+
+Поддерживает подмножество API в path-стиле, которое использует
+загрузка через boto3/s3transfer: PutObject, загрузку частями
+(CreateMultipartUpload, UploadPart, CompleteMultipartUpload), HeadObject,
+GetObject и DeleteObject. Объекты хранятся в памяти процесса. Параметр
+latency добавляет задержку к каждому запросу, имитируя сетевую
+задержку до настоящего хранилища.
+"""
+
+import hashlib
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _parse(self):
+        parts = urlsplit(self.path)
+        bucket, _, key = unquote(parts.path).lstrip('/').partition('/')
+        query = {name: values[0] for name, values in parse_qs(parts.query, keep_blank_values=True).items()}
+        return bucket, key, query
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _reply(self, status, body=b'', headers=None):
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_PUT(self):
+        bucket, key, query = self._parse()
+        data = self._body()
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        with self.server.lock:
+            if 'uploadId' in query:
+                self.server.uploads[query['uploadId']][int(query['partNumber'])] = data
+            else:
+                self.server.objects[(bucket, key)] = data
+        self._reply(200, headers={'ETag': etag})
+
+    def do_POST(self):
+        bucket, key, query = self._parse()
+        body = self._body()
+        if 'uploads' in query:
+            upload_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.uploads[upload_id] = {}
+            xml = (
+                '<InitiateMultipartUploadResult>'
+                f'<Bucket>{bucket}</Bucket><Key>{key}</Key><UploadId>{upload_id}</UploadId>'
+                '</InitiateMultipartUploadResult>'
+            )
+            return self._reply(200, xml.encode(), {'Content-Type': 'application/xml'})
+        if 'uploadId' in query:
+            numbers = [int(number) for number in re.findall(rb'<PartNumber>(\d+)</PartNumber>', body)]
+            with self.server.lock:
+                parts = self.server.uploads.pop(query['uploadId'])
+                data = b''.join(parts[number] for number in sorted(numbers))
+                self.server.objects[(bucket, key)] = data
+                self.server.multipart_uploads += 1
+            xml = (
+                '<CompleteMultipartUploadResult>'
+                f'<Bucket>{bucket}</Bucket><Key>{key}</Key>'
+                f'<ETag>"{hashlib.md5(data).hexdigest()}-{len(numbers)}"</ETag>'
+                '</CompleteMultipartUploadResult>'
+            )
+            return self._reply(200, xml.encode(), {'Content-Type': 'application/xml'})
+        self._reply(400)
+
+    def do_GET(self):
+        bucket, key, _ = self._parse()
+        data = self.server.objects.get((bucket, key))
+        if data is None:
+            return self._reply(404, b'<Error><Code>NoSuchKey</Code></Error>', {'Content-Type': 'application/xml'})
+        self._reply(200, data, {'ETag': f'"{hashlib.md5(data).hexdigest()}"'})
+
+    def do_HEAD(self):
+        bucket, key, _ = self._parse()
+        data = self.server.objects.get((bucket, key))
+        if data is None:
+            return self._reply(404)
+        # Content-Length ответа на HEAD — размер объекта, тело не передаётся
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('ETag', f'"{hashlib.md5(data).hexdigest()}"')
+        self.end_headers()
+
+    def do_DELETE(self):
+        bucket, key, _ = self._parse()
+        with self.server.lock:
+            self.server.objects.pop((bucket, key), None)
+        self._reply(204)
+
+
+class LocalS3Server:
+    """
+    Контекстный менеджер: запускает сервер на свободном порту localhost.
+    Адрес для endpoint_url — атрибут url, загруженные объекты — objects.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.latency = self.latency
+        self.server.lock = threading.Lock()
+        self.server.objects = {}
+        self.server.uploads = {}
+        self.server.multipart_uploads = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    @property
+    def objects(self):
+        return self.server.objects
+
+    @property
+    def multipart_uploads(self):
+        return self.server.multipart_uploads
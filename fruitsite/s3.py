@@ -0,0 +1,123 @@
+"""
+Общий слой ввода-вывода S3 для хранилищ файлов.
+
+Ресурсы boto3 не потокобезопасны, поэтому хранилища держат ресурс на
+каждый поток, но создают его из одной сессии процесса с общими
+настройками клиента (пул соединений, таймауты, повторы), а не из новой
+сессии на каждый поток. Загрузка идёт через s3transfer: файлы больше
+S3_MULTIPART_THRESHOLD передаются частями параллельно. Несколько файлов
+загружаются одновременно через общий пул потоков (upload_concurrently,
+commit_files).
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from django.conf import settings
+
+MB = 1024 * 1024
+
+_lock = threading.Lock()
+_session = None
+_executor = None
+
+
+def client_config(addressing_style=None, signature_version=None):
+    """
+    Настройки клиента: пул соединений для частей загрузки s3transfer, короткий
+    таймаут подключения с повторными попытками вместо минутного ожидания.
+    Контрольные суммы считаются только там, где их требует API: потоковые
+    aws-chunked загрузки botocore по умолчанию поддерживают не все S3-совместимые хранилища.
+    """
+    return Config(
+        s3={'addressing_style': addressing_style or getattr(settings, 'AWS_S3_ADDRESSING_STYLE', None) or 'auto'},
+        signature_version=signature_version or getattr(settings, 'AWS_S3_SIGNATURE_VERSION', None),
+        max_pool_connections=getattr(settings, 'S3_MAX_POOL_CONNECTIONS', 32),
+        connect_timeout=getattr(settings, 'S3_CONNECT_TIMEOUT', 5),
+        read_timeout=getattr(settings, 'S3_READ_TIMEOUT', 30),
+        retries={'max_attempts': 3, 'mode': 'standard'},
+        tcp_keepalive=True,
+        request_checksum_calculation='when_required',
+        response_checksum_validation='when_required',
+    )
+
+
+def transfer_config():
+    """Параметры s3transfer: загрузка частями для больших файлов"""
+    return TransferConfig(
+        multipart_threshold=getattr(settings, 'S3_MULTIPART_THRESHOLD', 8 * MB),
+        multipart_chunksize=getattr(settings, 'S3_MULTIPART_CHUNKSIZE', 8 * MB),
+        max_concurrency=getattr(settings, 'S3_MULTIPART_CONCURRENCY', 4),
+        use_threads=True,
+    )
+
+
+def get_session():
+    """Одна boto3-сессия на процесс (сессии не потокобезопасны, используются под блокировкой)"""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session()
+        return _session
+
+
+def get_resource(**kwargs):
+    """
+    Ресурс S3 поверх той же сессии и настроек клиента. Ресурсы не
+    потокобезопасны, поэтому вызывающий код хранит их по потокам.
+    """
+    session = get_session()
+    config = client_config(kwargs.pop('addressing_style', None), kwargs.pop('signature_version', None))
+    with _lock:
+        return session.resource('s3', config=config, **kwargs)
+
+
+def get_executor():
+    """Общий пул потоков для одновременной загрузки нескольких файлов"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'S3_UPLOAD_WORKERS', 8),
+                thread_name_prefix='s3-upload',
+            )
+        return _executor
+
+
+def upload_concurrently(calls):
+    """
+    Выполняет функции без аргументов (обычно загрузки) в общем пуле
+    и возвращает их результаты в исходном порядке. Если какие-то вызовы
+    завершились ошибкой, после окончания всех остальных поднимается первая.
+    """
+    calls = list(calls)
+    if len(calls) <= 1:
+        return [call() for call in calls]
+    futures = [get_executor().submit(call) for call in calls]
+    results = []
+    error = None
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(None)
+            error = error or e
+    if error is not None:
+        raise error
+    return results
+
+
+def commit_files(field_files):
+    """
+    Загружает ещё не сохранённые файлы полей FileField/ImageField
+    одновременно. После этого model.save() не загружает их повторно.
+    """
+    pending = [field_file for field_file in field_files if field_file and not field_file._committed]
+
+    def commit(field_file):
+        return lambda: field_file.save(field_file.name, field_file.file, save=False)
+
+    return upload_concurrently(commit(field_file) for field_file in pending)
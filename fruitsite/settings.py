@@ -76,6 +76,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'cart.identity.CartIdentityMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
 ]
@@ -96,6 +97,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.csrf',
                 'products.context_processors.categories',
+                'products.context_processors.cached_page',
             ],
         },
     },
@@ -116,6 +118,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Локальные приложения
     'storages',
@@ -150,6 +153,51 @@ DATABASES = {
     'default': dj_database_url.parse(DATABASE_URL, conn_max_age=600)
 }
 
+# Кэш: LRU в памяти процесса перед общим Redis (fruitsite.cache.TwoTierCache).
+# Без REDIS_URL общий уровень заменяется LocMemCache (тесты, бенчмарки, разработка).
+REDIS_URL = os.environ.get('REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'fruitsite.cache.TwoTierCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            # timeout — время жизни в общем кэше, local_timeout — копии в памяти процесса
+            'NAMESPACES': {
+                'products': {'timeout': 300, 'local_timeout': 2},
+                'cart': {'timeout': 60 * 60},
+                # Страницы HTML каталога только в общем кэше (products.page_cache)
+                'pages': {'timeout': 60},
+                's3_file_exists': {'timeout': 60 * 60, 'local_timeout': 60},
+            },
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'fruitsite',
+        'OPTIONS': {'socket_connect_timeout': 2, 'socket_timeout': 2},
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fruitsite-shared',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Уровень каналов для websocket-уведомлений (orders.realtime).
+# Без REDIS_URL события доставляются только внутри одного процесса
+# (fruitsite.channel_layers), поэтому это годится лишь для разработки
+# и тестов; в продакшене с несколькими процессами нужен Redis.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': [REDIS_URL]},
+    } if REDIS_URL else {
+        'BACKEND': 'fruitsite.channel_layers.ThrottledInMemoryChannelLayer',
+    },
+}
 
 
 # Password validation
@@ -217,6 +265,15 @@ AUTH_USER_MODEL = 'accounts.User'
 
 NPM_BIN_PATH = "C:/Program Files/nodejs/npm.cmd"
 
+# PWA (django-pwa): service worker с офлайн-копией каталога в IndexedDB (products.sync)
+PWA_SERVICE_WORKER_PATH = os.path.join(BASE_DIR, 'fruitsite', 'templates', 'serviceworker.js')
+PWA_APP_NAME = 'OsimiFood'
+PWA_APP_DESCRIPTION = 'Маркетплейс фруктов'
+PWA_APP_START_URL = '/products/table/'
+PWA_APP_SCOPE = '/'
+PWA_APP_LANG = 'ru-RU'
+PWA_APP_DEBUG_MODE = False
+
 # При локальной разработке и тестировании используем локальные медиа-файлы
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -249,9 +306,18 @@ AWS_S3_USE_SSL = True  # Использовать SSL для подключен
 AWS_S3_MAX_MEMORY_SIZE = 5 * 1024 * 1024  # 5 MB - оптимальный размер для загрузки
 AWS_S3_FILE_OVERWRITE = False  # Не перезаписывать файлы с одинаковыми именами
 
-# Таймауты для S3
-AWS_S3_CONNECT_TIMEOUT = 60  # 60 секунд на установление соединения
-AWS_S3_READ_TIMEOUT = 60  # 60 секунд на чтение данных
+# Общий клиент S3 (fruitsite.s3): таймауты с повторными попытками, пул соединений,
+# одновременные загрузки и загрузка частями больших файлов
+S3_CONNECT_TIMEOUT = 5  # секунд на установление соединения
+S3_READ_TIMEOUT = 30  # секунд на чтение ответа
+S3_MAX_POOL_CONNECTIONS = 32  # соединений в пуле клиента на процесс
+S3_UPLOAD_WORKERS = 8  # потоков для одновременной загрузки нескольких файлов
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024  # файлы больше загружаются частями
+S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+S3_MULTIPART_CONCURRENCY = 4  # частей одного файла одновременно
+
+# Уменьшенные копии изображений товаров (products.images): потоков фонового пула
+IMAGE_DERIVATIVE_WORKERS = int(os.environ.get('IMAGE_DERIVATIVE_WORKERS', 2))
 
 # Настройки хранения файлов
 DEFAULT_FILE_STORAGE = 'fruitsite.storage_backends.MediaStorage'
\ No newline at end of file
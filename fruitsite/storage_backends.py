@@ -1,16 +1,71 @@
 from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name, get_available_overwrite_name
 from django.conf import settings
+import datetime
 import os
 import logging
+import uuid
+from functools import lru_cache
+from urllib.parse import quote
+
+from . import s3
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-class MediaStorage(S3Boto3Storage):
+
+@lru_cache(maxsize=100_000)
+def public_url(location, name, direct_storage_url, endpoint_url, bucket):
+    """
+    Публичный URL файла name из папки location: прямой адрес Selectel,
+    если он настроен, иначе адрес бакета на S3 endpoint (path-стиль).
+    """
+    location = location.strip('/')
+    name = name.lstrip('/')
+    # Имя может уже содержать папку хранилища
+    if name.startswith(f"{location}/"):
+        name = name[len(location) + 1:]
+    if direct_storage_url:
+        return f"{direct_storage_url.rstrip('/')}/{location}/{quote(name)}"
+    path = '/'.join(part for part in f"{bucket}/{location}/{name}".split('/') if part)
+    return f"{endpoint_url.rstrip('/')}/{quote(path)}"
+
+
+class PooledS3Mixin:
+    """
+    Хранилище S3 поверх общей сессии и настроек клиента из fruitsite.s3:
+    ресурсы потоков создаются из общей сессии, а не из новой сессии на
+    каждый поток, а s3transfer загружает большие файлы частями
+    (S3_MULTIPART_*). Сама загрузка — штатный _save django-storages.
+    """
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.transfer_config = s3.transfer_config()
+
+    @property
+    def connection(self):
+        connection = getattr(self._connections, 'connection', None)
+        if connection is None:
+            connection = s3.get_resource(
+                endpoint_url=self.endpoint_url,
+                region_name=self.region_name,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+                use_ssl=self.use_ssl,
+                verify=self.verify,
+                addressing_style=self.addressing_style,
+                signature_version=self.signature_version,
+            )
+            self._connections.connection = connection
+        return connection
+
+
+class MediaStorage(PooledS3Mixin, S3Boto3Storage):
     location = 'media'  # Папка в S3, куда будут загружаться файлы
     file_overwrite = False  # Запретить перезапись файлов с одинаковыми именами
     
-class ProductImagesStorage(S3Boto3Storage):
+class ProductImagesStorage(PooledS3Mixin, S3Boto3Storage):
     """
     Хранилище для изображений продуктов в S3
     """
@@ -22,105 +77,44 @@ class ProductImagesStorage(S3Boto3Storage):
     default_acl = 'public-read'  # Файлы будут публичными
     # НЕ используем custom_domain, так как он вызывает проблемы с URL
     # Вместо этого будем работать с полными URL от Selectel
+
+    # Таймауты и пул соединений задаются общим клиентом (настройки S3_* в settings)
     
-    # Настройки для стабильной работы с Selectel S3
-    connect_timeout = 60  # Увеличиваем таймаут подключения до 60 секунд
-    read_timeout = 60  # Увеличиваем таймаут чтения до 60 секунд
-    
-    def _save(self, name, content):
+    def get_available_name(self, name, max_length=None):
         """
-        Переопределяем метод _save для прямой загрузки в S3 без промежуточного сохранения
+        Короткое уникальное имя вида ГГГГММДД_uuid.расширение. Проверка
+        существования исходного имени (лишний HEAD-запрос к S3 на каждую
+        загрузку) не нужна.
         """
-        # Используем более простую схему имен файлов
-        import datetime
-        import uuid
-        import os
-        
-        # Получаем расширение файла
         _, ext = os.path.splitext(name)
-        
         # Генерируем уникальное короткое имя с UUID4 (без дефисов)
         unique_id = uuid.uuid4().hex[:8]  # Берем только первые 8 символов для краткости
         timestamp = datetime.datetime.now().strftime('%Y%m%d')
-        
-        # Формируем новое имя файла: timestamp_uuid_ext
-        name = f"{timestamp}_{unique_id}{ext}"
-        
-        return super()._save(name, content)
+        return get_available_overwrite_name(f"{timestamp}_{unique_id}{ext}", max_length)
         
     def url(self, name, parameters=None, expire=None):
         """
-        Переопределяем метод url для корректного формирования URL к файлам в Selectel S3
+        Публичный URL файла в Selectel S3 (без авторизационных параметров).
+        Результат зависит только от имени и настроек и запоминается в public_url().
         """
-        from django.conf import settings
-        from urllib.parse import quote
-        
-        logger.debug(f"Generating URL for file: {name}")
-        
         if not name:
-            logger.warning("Empty name provided to url method")
             return ""
-        
-        # Проверяем, есть ли настройка для прямого URL Selectel
-        direct_storage_url = getattr(settings, 'SELECTEL_DIRECT_STORAGE_URL', None)
-        
-        if direct_storage_url:
-            try:
-                # Обрабатываем имя файла
-                if name.startswith('/'):
-                    name = name[1:]
-                    
-                # Если есть location в имени файла, удаляем его
-                location = self.location.strip('/')
-                if name.startswith(f"{location}/"):
-                    name = name[len(f"{location}/"):]
-                
-                # Кодируем имя файла для URL
-                encoded_name = quote(name)
-                
-                # Формируем URL в формате Selectel Storage
-                url = f"{direct_storage_url}/{self.location}/{encoded_name}"
-                logger.debug(f"Generated direct S3 URL: {url}")
-                return url
-            except Exception as e:
-                logger.error(f"Error generating direct URL: {str(e)}")
-                # Если произошла ошибка, пробуем запасной вариант
-        
-        # Запасной вариант - старый метод
-        try:
-            # Формируем URL вручную для большей надежности
-            endpoint = settings.AWS_S3_ENDPOINT_URL.rstrip('/')
-            bucket = settings.AWS_STORAGE_BUCKET_NAME
-            location = self.location.strip('/')
-            
-            # Обрабатываем имя файла
-            if name.startswith('/'):
-                name = name[1:]
-            
-            # Кодируем имя файла
-            encoded_name = quote(name)
-            
-            # Собираем полный URL
-            full_url = f"{endpoint}/{bucket}/{location}/{encoded_name}"
-            
-            # Удаляем двойные слеши в пути (кроме протокола)
-            parts = full_url.split('://')
-            if len(parts) > 1:
-                protocol = parts[0]
-                path = parts[1]
-                while '//' in path:
-                    path = path.replace('//', '/')
-                full_url = f"{protocol}://{path}"
-                
-            logger.debug(f"Generated alternative URL: {full_url}")
-            return full_url
-        except Exception as e:
-            logger.error(f"Error generating alternative URL: {str(e)}")
-            # Если что-то пошло не так, возвращаем оригинальный метод
-            try:
-                url = super().url(name, parameters=parameters, expire=expire)
-                logger.debug(f"Using original method URL: {url}")
-                return url
-            except Exception as e2:
-                logger.error(f"Error in original url method: {str(e2)}")
-                return ""
\ No newline at end of file
+        return public_url(
+            self.location,
+            name,
+            getattr(settings, 'SELECTEL_DIRECT_STORAGE_URL', None),
+            settings.AWS_S3_ENDPOINT_URL,
+            settings.AWS_STORAGE_BUCKET_NAME,
+        )
+
+
+class ProductImageDerivativesStorage(ProductImagesStorage):
+    """
+    Уменьшенные копии изображений товаров (см. products.images).
+    Копии лежат рядом с оригиналом под предсказуемыми именами,
+    поэтому имя не заменяется случайным, а повторная генерация перезаписывает файлы.
+    """
+    file_overwrite = True
+
+    def get_available_name(self, name, max_length=None):
+        return get_available_overwrite_name(clean_name(name), max_length)
@@ -0,0 +1,87 @@
+// Service worker OsimiFood (отдаётся django-pwa по адресу /serviceworker.js).
+//
+// Каталог (/ и /products/table/) загружается из сети; если сеть не ответила
+// за NETWORK_TIMEOUT_MS или недоступна, показывается сохранённая оболочка
+// каталога, которая выводит товары из IndexedDB (products/js/catalog_store.js).
+// Оболочка и её статика обновляются в кэше в фоне при каждом обращении.
+
+const SHELL_CACHE = 'osimifood-shell-v1';
+const CATALOG_PATHS = ['/', '/products/table/'];
+const OFFLINE_CATALOG_URL = '/products/table/offline/';
+const SHELL_URLS = [
+  OFFLINE_CATALOG_URL,
+  '/static/products/js/catalog_store.js',
+  '/static/css/dist/styles.css',
+];
+const NETWORK_TIMEOUT_MS = 3000;
+
+self.addEventListener('install', event => {
+  event.waitUntil(
+    caches.open(SHELL_CACHE)
+      .then(cache => cache.addAll(SHELL_URLS))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys()
+      .then(keys => Promise.all(keys.filter(key => key !== SHELL_CACHE).map(key => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+function offlineCatalog() {
+  return caches.match(OFFLINE_CATALOG_URL).then(response => response || Response.error());
+}
+
+// Сеть с ограничением по времени; без ответа — оболочка каталога из кэша
+function networkOrOfflineCatalog(request) {
+  return new Promise(resolve => {
+    let settled = false;
+    const fallback = () => {
+      if (!settled) {
+        settled = true;
+        resolve(offlineCatalog());
+      }
+    };
+    const timer = setTimeout(fallback, NETWORK_TIMEOUT_MS);
+    fetch(request)
+      .then(response => {
+        clearTimeout(timer);
+        if (!settled) {
+          settled = true;
+          resolve(response);
+        }
+      })
+      .catch(() => {
+        clearTimeout(timer);
+        fallback();
+      });
+  });
+}
+
+// Ответ из кэша сразу, копия в кэше обновляется из сети в фоне
+function staleWhileRevalidate(event) {
+  const update = fetch(event.request).then(response => {
+    if (response.ok) {
+      const copy = response.clone();
+      caches.open(SHELL_CACHE).then(cache => cache.put(event.request, copy));
+    }
+    return response;
+  });
+  event.waitUntil(update.catch(() => null));
+  return caches.match(event.request).then(cached => cached || update);
+}
+
+self.addEventListener('fetch', event => {
+  const url = new URL(event.request.url);
+  if (event.request.method !== 'GET' || url.origin !== self.location.origin) {
+    return;
+  }
+  if (event.request.mode === 'navigate' && CATALOG_PATHS.includes(url.pathname)) {
+    event.respondWith(networkOrOfflineCatalog(event.request));
+  } else if (SHELL_URLS.includes(url.pathname)) {
+    event.respondWith(staleWhileRevalidate(event));
+  }
+});
@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
+from pwa import views as pwa_views
 from . import views
 from django.conf import settings
 from django.conf.urls.static import static
@@ -27,9 +28,14 @@ urlpatterns = [
     path('products/', include('products.urls', namespace='products')),
     path('cart/', include('cart.urls', namespace='cart')),
     path('orders/', include('orders.urls', namespace='orders')),
+    path('reviews/', include('reviews.urls', namespace='reviews')),
+    path('chat/', include('chat.urls', namespace='chat')),
     path('pwa/', include('pwa.urls')),
+    # Service worker должен отдаваться из корня, чтобы управлять всеми страницами сайта
+    path('serviceworker.js', pwa_views.service_worker, name='site_serviceworker'),
     # Твоя домашняя страница
     path('', views.home, name='home'),
+    path('fragment/', views.page_fragment, name='page_fragment'),
     path('accounts/', include('accounts.urls', namespace='accounts')),
     path('master/', views.master_landing, name='master_landing'),
 
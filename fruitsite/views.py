@@ -1,6 +1,11 @@
 # fruitsite/views.py
+from django.contrib import messages
+from django.http import JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import render, redirect
+from django.views.decorators.cache import never_cache
 
+from cart.summary import get_request_cart_count
 from products.models import Product, Category
 
 def master_landing(request):
@@ -18,3 +23,18 @@ def home(request):
     # Перенаправляем на таблицу товаров как главную страницу
     return redirect('products:product_table')
 
+
+@never_cache
+def page_fragment(request):
+    """
+    Данные посетителя для страниц из общего кэша (products.page_cache):
+    CSRF-токен, счётчик корзины и накопившиеся сообщения.
+    """
+    return JsonResponse({
+        'csrf_token': get_token(request),
+        'cart_count': get_request_cart_count(request),
+        'messages': [
+            {'tags': message.tags, 'text': str(message)}
+            for message in messages.get_messages(request)
+        ],
+    })
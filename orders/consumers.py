@@ -0,0 +1,39 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .realtime import user_group
+
+# Код закрытия для неавторизованного соединения (диапазон 4000-4999 — коды приложения)
+CLOSE_UNAUTHORIZED = 4401
+
+
+class OrderStatusConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Соединение пользователя для событий о статусах его заказов
+    (как покупателя и как продавца). Клиент только слушает: соединение
+    ничего не читает из базы, поэтому простаивающие соединения почти
+    ничего не стоят.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=CLOSE_UNAUTHORIZED)
+            return
+        self.group_name = user_group(user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Входящие сообщения не поддерживаются
+        pass
+
+    async def order_status(self, event):
+        await self.send_json({
+            'order_id': event['order_id'],
+            'status': event['status'],
+            'status_display': event['status_display'],
+        })
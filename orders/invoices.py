@@ -0,0 +1,210 @@
+"""
+Товарные накладные в формате Excel.
+
+Книги создаются в режиме write-only openpyxl: строки листа сразу
+записываются во временный файл, а не хранятся в памяти как ячейки,
+и оформление задаётся общими именованными стилями вместо отдельных
+объектов Font/Border для каждой ячейки. Zip-архив с накладными
+формируется и отдаётся по частям, поэтому расход памяти не зависит
+от количества заказов в выгрузке.
+"""
+
+import io
+import tempfile
+import zipfile
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+COLUMN_WIDTHS = {'A': 6, 'B': 45, 'C': 20, 'D': 14, 'E': 14, 'F': 16}
+TABLE_HEADERS = ('№', 'Наименование', 'Вид упаковки', 'Количество', 'Цена, сом.', 'Сумма, сом.')
+
+# openpyxl хранит метаданные каждого листа до сохранения книги (около 20 КБ на лист),
+# поэтому выгрузка одной книгой ограничена; большие периоды выгружаются zip-архивом
+MAX_WORKBOOK_SHEETS = 500
+
+# Размер порции при потоковой записи zip-архива
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _named_styles():
+    thin = Side(style='thin')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    return [
+        NamedStyle(
+            name='invoice_title',
+            font=Font(name='Arial', size=16, bold=True),
+            alignment=Alignment(horizontal='center', vertical='center'),
+        ),
+        NamedStyle(name='invoice_header', font=Font(name='Arial', size=12, bold=True)),
+        NamedStyle(
+            name='invoice_text',
+            font=Font(name='Arial', size=11),
+            alignment=Alignment(horizontal='left', vertical='center', wrap_text=True),
+        ),
+        NamedStyle(
+            name='invoice_table_header',
+            font=Font(name='Arial', size=11, bold=True),
+            alignment=Alignment(horizontal='center', vertical='center', wrap_text=True),
+            border=border,
+            fill=PatternFill(start_color='E5E7EB', end_color='E5E7EB', fill_type='solid'),
+        ),
+        NamedStyle(
+            name='invoice_cell',
+            font=Font(name='Arial', size=11),
+            alignment=Alignment(horizontal='left', vertical='center', wrap_text=True),
+            border=border,
+        ),
+        NamedStyle(
+            name='invoice_money',
+            font=Font(name='Arial', size=11),
+            alignment=Alignment(horizontal='right', vertical='center'),
+            border=border,
+            number_format='#,##0.00',
+        ),
+        NamedStyle(
+            name='invoice_total',
+            font=Font(name='Arial', size=12, bold=True),
+            alignment=Alignment(horizontal='right', vertical='center'),
+            number_format='#,##0.00',
+        ),
+    ]
+
+
+def new_workbook():
+    """Пустая write-only книга с зарегистрированными стилями накладной"""
+    workbook = Workbook(write_only=True)
+    for style in _named_styles():
+        workbook.add_named_style(style)
+    return workbook
+
+
+def write_invoice_sheet(workbook, order, items):
+    """
+    Добавляет в книгу лист с накладной заказа order по позициям items
+    (позиции должны быть загружены вместе с product).
+    """
+    ws = workbook.create_sheet(title=f'Накладная_{order.id}')
+    for column, width in COLUMN_WIDTHS.items():
+        ws.column_dimensions[column].width = width
+    ws.merged_cells.add('A1:F1')
+
+    def cell(value, style):
+        result = WriteOnlyCell(ws, value=value)
+        result.style = style
+        return result
+
+    ws.append([cell('ТОВАРНАЯ НАКЛАДНАЯ', 'invoice_title')])
+    ws.append([])
+    ws.append([
+        cell(f'Накладная № {order.id}', 'invoice_header'), None, None, None,
+        cell(f'от {order.created_at.strftime("%d.%m.%Y")}', 'invoice_header'),
+    ])
+    ws.append([])
+    ws.append([cell('Покупатель:', 'invoice_header'), cell(order.buyer.username, 'invoice_text')])
+    ws.append([cell('Телефон:', 'invoice_header'), cell(order.phone_number, 'invoice_text')])
+    ws.append([cell('Адрес доставки:', 'invoice_header'), cell(order.delivery_address, 'invoice_text')])
+    ws.append([cell('Статус:', 'invoice_header'), cell(order.get_status_display(), 'invoice_text')])
+    ws.append([])
+    ws.append([cell(title, 'invoice_table_header') for title in TABLE_HEADERS])
+
+    total = 0
+    for number, item in enumerate(items, start=1):
+        line_total = item.price * item.quantity
+        total += line_total
+        product = item.product
+        ws.append([
+            cell(number, 'invoice_cell'),
+            cell(product.name if product else 'Товар удалён', 'invoice_cell'),
+            cell(product.package_type if product else '', 'invoice_cell'),
+            cell(item.quantity, 'invoice_cell'),
+            cell(item.price, 'invoice_money'),
+            cell(line_total, 'invoice_money'),
+        ])
+
+    ws.append([])
+    ws.append([None, None, None, None, cell('Итого:', 'invoice_header'), cell(total, 'invoice_total')])
+    ws.append([])
+    ws.append([cell('Отпустил: ____________________', 'invoice_text'), None, None,
+               cell('Получил: ____________________', 'invoice_text')])
+    # Закрытый лист сбрасывается во временный файл и освобождает дескриптор
+    ws.close()
+    return ws
+
+
+def save_workbook(workbook):
+    """Сохраняет книгу во временный файл и возвращает его, перемотанным в начало"""
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def invoice_bytes(order, items):
+    """Накладная одного заказа в виде отдельной книги"""
+    workbook = new_workbook()
+    write_invoice_sheet(workbook, order, items)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def invoices_workbook(orders_with_items):
+    """Одна книга, по листу на заказ; возвращает временный файл"""
+    workbook = new_workbook()
+    written = 0
+    for order, items in orders_with_items:
+        write_invoice_sheet(workbook, order, items)
+        written += 1
+    if not written:
+        ws = workbook.create_sheet(title='Накладные')
+        ws.append(['Нет заказов за выбранный период'])
+    return save_workbook(workbook)
+
+
+class _StreamSink:
+    """Файлоподобный буфер без перемотки: zipfile пишет в него, генератор забирает данные"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pending(self):
+        return len(self._buffer)
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def stream_invoices_zip(orders_with_items):
+    """
+    Генератор zip-архива с отдельной книгой на каждый заказ.
+    Архив отдаётся порциями по мере формирования накладных.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for order, items in orders_with_items:
+            archive.writestr(f'invoice_{order.id}.xlsx', invoice_bytes(order, items))
+            if sink.pending() >= STREAM_CHUNK_SIZE:
+                yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from cart.models import CartItem
+from fruitsite.bench import measure, rolled_back
+from orders.services import place_order
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Измеряет время оформления заказа для корзин разного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 50, 500], help='Количество строк в корзине')
+        parser.add_argument('--repeat', type=int, default=20, help='Количество замеров')
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        repeat = options['repeat']
+        results = []
+
+        with rolled_back():
+            master = User.objects.create_user(username='bench_checkout_master', role='master')
+            products = Product.objects.bulk_create(
+                [Product(master=master, name=f'Товар {i}', description='', price=1) for i in range(max(sizes))],
+                batch_size=1000,
+            )
+
+            for size in sizes:
+                buyer = User.objects.create_user(username=f'bench_checkout_buyer_{size}', role='buyer')
+                # Строки уже зарезервированы, как после добавления в корзину
+                CartItem.objects.bulk_create(
+                    [
+                        CartItem(buyer=buyer, product=product, quantity=2, reserved_quantity=2)
+                        for product in products[:size]
+                    ],
+                    batch_size=1000,
+                )
+                owner_filter = {'buyer': buyer}
+
+                def checkout():
+                    # Каждый замер откатывается, и корзина остаётся заполненной
+                    with rolled_back():
+                        order = place_order(owner_filter, buyer, '0000000000', 'Адрес')
+                    assert order is not None
+
+                with CaptureQueriesContext(connection) as queries:
+                    checkout()
+                results.append((size, len(queries), measure(checkout, repeat)))
+
+        for size, query_count, ms in results:
+            self.stdout.write(f'{size:>5} строк: {query_count:>3} запросов, {ms:8.2f} мс')
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import time
+import tracemalloc
+
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from orders.realtime import user_group
+from orders.routing import websocket_urlpatterns
+
+
+class Command(BaseCommand):
+    help = (
+        'Открывает в одном процессе множество простаивающих websocket-соединений '
+        'уведомлений о заказах и измеряет память на соединение и время рассылки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=5000, help='Количество соединений')
+        parser.add_argument('--idle', type=float, default=5, help='Сколько секунд соединения простаивают')
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['connections'], options['idle']))
+
+    async def run(self, count, idle):
+        application = URLRouter(websocket_urlpatterns)
+        channel_layer = get_channel_layer()
+        # Соединения открываются без сервера ASGI: измеряется стоимость потребителя
+        # и уровня каналов, а не сокетов; пользователи не сохраняются в базу
+        scopes = [
+            {'type': 'websocket', 'path': '/ws/orders/', 'query_string': b'', 'headers': [],
+             'subprotocols': [], 'user': User(pk=pk, username=f'bench_push_{pk}')}
+            for pk in range(1, count + 1)
+        ]
+
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        sockets = [ApplicationCommunicator(application, scope) for scope in scopes]
+        for socket in sockets:
+            await socket.send_input({'type': 'websocket.connect'})
+        accepted = await asyncio.gather(*(socket.receive_output(timeout=30) for socket in sockets))
+        connect_ms = (time.perf_counter() - started) * 1000
+        memory_per_connection = (tracemalloc.get_traced_memory()[0] - memory_before) / count
+        tracemalloc.stop()
+        assert all(message['type'] == 'websocket.accept' for message in accepted)
+
+        await asyncio.sleep(idle)
+        alive = sum(not socket.future.done() for socket in sockets)
+
+        started = time.perf_counter()
+        for pk in range(1, count + 1):
+            await channel_layer.group_send(user_group(pk), {
+                'type': 'order.status', 'order_id': pk, 'status': 'accepted', 'status_display': 'Принят продавцом',
+            })
+        messages = await asyncio.gather(*(socket.receive_output(timeout=30) for socket in sockets))
+        fanout_ms = (time.perf_counter() - started) * 1000
+        assert all(json.loads(message['text'])['order_id'] == pk for pk, message in enumerate(messages, 1))
+
+        for socket in sockets:
+            await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.gather(*(socket.wait(timeout=30) for socket in sockets))
+
+        self.stdout.write(f'Соединений: {count}, после {idle:g} с простоя открыто: {alive}')
+        self.stdout.write(f'Открытие: {connect_ms:8.1f} мс, {connect_ms * 1000 / count:6.1f} мкс на соединение')
+        self.stdout.write(f'Память: {memory_per_connection / 1024:8.1f} КБ на соединение')
+        self.stdout.write(f'Рассылка {count} событий: {fanout_ms:8.1f} мс')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='stock_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
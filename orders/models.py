@@ -24,6 +24,13 @@ class Order(models.Model):
     delivery_address = models.TextField()
     tracking_number = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Курсорная пагинация списка заказов продавца и фильтры по статусу и периоду
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order #{self.id} by {self.buyer.username}"
 
@@ -32,6 +39,14 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Единицы товара, списанные со склада; возвращаются при отклонении или отмене заказа
+    stock_quantity = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Поиск позиций продавца (через его товары) вместе с заказом без обращения к таблице
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
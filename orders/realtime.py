@@ -0,0 +1,74 @@
+"""
+Уведомления о смене статуса заказа через Channels.
+
+Каждое websocket-соединение пользователя (orders.consumers) входит
+в группу user_group(pk). После фиксации транзакции, изменившей статус,
+событие отправляется в группы покупателя и всех продавцов, чьи товары
+есть в заказе, поэтому страницы "Мои заказы" и "Заказы на мои товары"
+обновляются без перезагрузки.
+
+Без REDIS_URL используется InMemoryChannelLayer, который доставляет
+события только соединениям того же процесса; в продакшене с несколькими
+процессами нужен Redis (channels_redis).
+"""
+
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .models import OrderItem
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPE = 'order.status'
+
+
+def user_group(user_id):
+    return f'orders.user.{user_id}'
+
+
+def order_participants(order):
+    """id покупателя и продавцов заказа (один запрос)"""
+    sellers = (
+        OrderItem.objects.filter(order=order, product__isnull=False)
+        .values_list('product__master_id', flat=True)
+        .distinct()
+    )
+    return {order.buyer_id, *sellers}
+
+
+def status_event(order):
+    return {
+        'type': EVENT_TYPE,
+        'order_id': order.pk,
+        'status': order.status,
+        'status_display': order.get_status_display(),
+    }
+
+
+def _send(groups, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    send = async_to_sync(channel_layer.group_send)
+    for group in groups:
+        try:
+            send(group, event)
+        except Exception:
+            # Уведомление не должно ломать смену статуса; страница обновится при следующем открытии
+            logger.exception('Не удалось отправить событие заказа %s в группу %s', event['order_id'], group)
+
+
+def notify_order_status(order, participants=None):
+    """
+    Отправляет участникам заказа событие о его текущем статусе после
+    фиксации транзакции. participants — уже известные id участников,
+    чтобы не выбирать их из базы повторно.
+    """
+    if participants is None:
+        participants = order_participants(order)
+    groups = [user_group(user_id) for user_id in participants]
+    event = status_event(order)
+    transaction.on_commit(lambda: _send(groups, event))
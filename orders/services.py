@@ -0,0 +1,140 @@
+"""
+Оформление заказа из корзины, смена статусов, влияющих на склад,
+и выборки для списка заказов продавца.
+
+Оформление выполняется в одной транзакции и за постоянное число
+запросов, не зависящее от количества строк в корзине: выборка корзины
+вместе с товарами, досписание остатков, не покрытых резервом корзины,
+создание заказа, пакетная вставка позиций заказа и удаление оформленных
+строк корзины.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.utils import timezone
+
+from cart.models import CartItem
+from cart.reservations import InsufficientStock, adjust_stock, find_shortages, stock_units
+from .models import Order, OrderItem
+from .realtime import notify_order_status
+
+
+def load_cart(owner_filter, lock=False):
+    """Строки корзины вместе с товарами одним запросом"""
+    queryset = CartItem.objects.filter(**owner_filter).select_related('product').order_by('added_at', 'id')
+    if lock:
+        # Блокируем только строки корзины: повторная отправка формы
+        # дождётся первой и увидит уже пустую корзину
+        queryset = queryset.select_for_update(of=('self',))
+    return list(queryset)
+
+
+def cart_total(cart_items):
+    return sum((item.get_total_price() for item in cart_items), 0)
+
+
+def place_order(owner_filter, buyer, phone_number, delivery_address):
+    """
+    Создаёт заказ из корзины владельца owner_filter и очищает корзину.
+    Возвращает созданный заказ или None, если корзина пуста.
+    Если остатка на складе не хватает, вызывает InsufficientStock
+    и ничего не меняет.
+    """
+    with transaction.atomic():
+        cart_items = load_cart(owner_filter, lock=True)
+        if not cart_items:
+            return None
+
+        # Резервы строк переходят в заказ; недостающее (например, после
+        # истечения резерва) списывается со склада одним UPDATE
+        units = [stock_units(item.product, item.unit_type, item.quantity) for item in cart_items]
+        deltas = defaultdict(int)
+        for item, item_units in zip(cart_items, units):
+            deltas[item.product_id] += item_units - item.reserved_quantity
+        if not adjust_stock(deltas):
+            raise InsufficientStock(find_shortages(deltas))
+
+        order = Order.objects.create(
+            buyer=buyer,
+            phone_number=phone_number,
+            delivery_address=delivery_address,
+            total_amount=cart_total(cart_items),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=item.product,
+                quantity=item.quantity,
+                price=item.get_price(),
+                stock_quantity=item_units,
+            )
+            for item, item_units in zip(cart_items, units)
+        ])
+        # Удаляем только оформленные строки: товар, добавленный в корзину
+        # во время оформления, останется в ней
+        CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+        # Продавцы увидят новый заказ сразу после фиксации транзакции
+        notify_order_status(order, {buyer.pk, *(item.product.master_id for item in cart_items)})
+    return order
+
+
+def release_order_stock(order):
+    """Возвращает на склад товары заказа"""
+    items = OrderItem.objects.filter(order=order, stock_quantity__gt=0, product__isnull=False)
+    deltas = defaultdict(int)
+    for product_id, stock_quantity in items.values_list('product_id', 'stock_quantity'):
+        deltas[product_id] -= stock_quantity
+    adjust_stock(deltas)
+    items.update(stock_quantity=0)
+
+
+def close_order(order, status):
+    """
+    Переводит новый заказ в статус status ('rejected' или 'canceled')
+    и возвращает его товары на склад. Возвращает False, если заказ уже
+    обработан (в том числе параллельным запросом).
+    """
+    with transaction.atomic():
+        # Условный UPDATE: вернуть товары на склад может только один запрос
+        closed = Order.objects.filter(pk=order.pk, status='new').update(status=status, updated_at=timezone.now())
+        if not closed:
+            return False
+        release_order_stock(order)
+    order.status = status
+    notify_order_status(order)
+    return True
+
+
+def seller_orders_queryset(seller):
+    """
+    Заказы, содержащие товары продавца, с суммой и количеством позиций
+    только по его товарам. Агрегаты считаются в базе одним GROUP BY.
+    """
+    line_total = ExpressionWrapper(
+        F('items__quantity') * F('items__price'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    # Фильтр и агрегаты используют одно и то же соединение с items,
+    # поэтому в суммы попадают только позиции этого продавца
+    return (
+        Order.objects
+        .filter(items__product__master=seller)
+        .annotate(seller_total=Sum(line_total), seller_items_count=Count('items'))
+        .select_related('buyer')
+    )
+
+
+def attach_seller_items(orders, seller):
+    """Позиции продавца для заказов видимой страницы одним запросом"""
+    items_by_order = defaultdict(list)
+    items = (
+        OrderItem.objects
+        .filter(order__in=[order.pk for order in orders], product__master=seller)
+        .select_related('product')
+        .order_by('id')
+    )
+    for item in items:
+        items_by_order[item.order_id].append(item)
+    return [{'order': order, 'items': items_by_order[order.pk]} for order in orders]
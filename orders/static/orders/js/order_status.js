@@ -0,0 +1,75 @@
+// Статусы заказов без перезагрузки страницы (серверная часть — orders/consumers.py).
+// Соединение получает события о заказах пользователя как покупателя и как
+// продавца; при событии показывается уведомление, а блок [data-orders-live]
+// заменяется свежей версией той же страницы.
+(function () {
+  const SOCKET_PATH = '/ws/orders/';
+  const MAX_RECONNECT_DELAY_MS = 30000;
+  // Код закрытия для неавторизованного соединения (OrderStatusConsumer)
+  const CLOSE_UNAUTHORIZED = 4401;
+
+  let reconnectDelay = 1000;
+  let refreshTimer = null;
+  let wasConnected = false;
+
+  function showNotification(text) {
+    const notification = document.createElement('div');
+    notification.className = 'fixed top-4 right-4 px-4 py-2 rounded-md text-white z-50 bg-blue-500';
+    notification.textContent = text;
+    document.body.appendChild(notification);
+    setTimeout(() => notification.remove(), 5000);
+  }
+
+  async function refreshOrders() {
+    const current = document.querySelector('[data-orders-live]');
+    if (!current) {
+      return;
+    }
+    const response = await fetch(window.location.href, {credentials: 'same-origin'});
+    if (!response.ok) {
+      return;
+    }
+    const page = new DOMParser().parseFromString(await response.text(), 'text/html');
+    const fresh = page.querySelector('[data-orders-live]');
+    if (fresh) {
+      current.innerHTML = fresh.innerHTML;
+    }
+  }
+
+  // Несколько событий подряд (например, заказ с товарами разных продавцов) — одно обновление
+  function scheduleRefresh() {
+    clearTimeout(refreshTimer);
+    refreshTimer = setTimeout(() => {
+      refreshOrders().catch(error => console.log('Не удалось обновить список заказов:', error));
+    }, 300);
+  }
+
+  function connect() {
+    const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${scheme}://${window.location.host}${SOCKET_PATH}`);
+    socket.onopen = () => {
+      reconnectDelay = 1000;
+      // События, пришедшие пока соединения не было, потеряны — перечитываем список
+      if (wasConnected) {
+        scheduleRefresh();
+      }
+      wasConnected = true;
+    };
+    socket.onmessage = event => {
+      const data = JSON.parse(event.data);
+      showNotification(`Заказ #${data.order_id}: ${data.status_display}`);
+      scheduleRefresh();
+    };
+    socket.onclose = event => {
+      if (event.code === CLOSE_UNAUTHORIZED) {
+        return;
+      }
+      setTimeout(connect, reconnectDelay);
+      reconnectDelay = Math.min(reconnectDelay * 2, MAX_RECONNECT_DELAY_MS);
+    };
+  }
+
+  if ('WebSocket' in window) {
+    connect();
+  }
+})();
@@ -1,3 +1,255 @@
+import io
+import zipfile
+from decimal import Decimal
+
+import json
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from openpyxl import load_workbook
+
+from accounts.models import User
+from cart.models import CartItem
+from products.models import Product
+from .models import Order, OrderItem
+from .routing import websocket_urlpatterns
+
+
+class CheckoutTests(TestCase):
+    """Оформление заказа: одна транзакция и постоянное число запросов"""
+
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.products = Product.objects.bulk_create([
+            Product(master=self.master, name=f'Товар {i}', description='', price=10,
+                    price_per_unit=10, price_per_package=100, stock=100)
+            for i in range(50)
+        ])
+
+    def fill_cart(self, owner, count):
+        CartItem.objects.bulk_create([
+            CartItem(product=product, quantity=2, unit_type='package' if i % 2 else 'unit', **owner)
+            for i, product in enumerate(self.products[:count])
+        ])
+
+    def post_checkout(self):
+        return self.client.post(reverse('orders:checkout'), {
+            'phone': '+992 900 00 00 00',
+            'delivery_address': 'Душанбе',
+        })
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        # Корзина из одного товара списывает остаток без точки сохранения,
+        # поэтому сравниваются корзины из нескольких товаров
+        for size in (2, 50):
+            buyer = User.objects.create_user(username=f'buyer_{size}', role='buyer')
+            self.client.force_login(buyer)
+            self.fill_cart({'buyer': buyer}, size)
+            with self.assertNumQueries(14):
+                self.post_checkout()
+
+    def test_order_uses_cart_prices_and_clears_cart(self):
+        buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.client.force_login(buyer)
+        self.fill_cart({'buyer': buyer}, 3)
+        self.post_checkout()
+        order = Order.objects.get(buyer=buyer)
+        self.assertEqual(order.items.count(), 3)
+        self.assertEqual(order.total_amount, Decimal('2') * (10 + 100 + 10))
+        self.assertFalse(CartItem.objects.filter(buyer=buyer).exists())
+
+    def test_anonymous_checkout_creates_account_and_order(self):
+        session = self.client.session
+        session.save()
+        self.fill_cart({'session_key': session.session_key}, 2)
+        response = self.post_checkout()
+        self.assertRedirects(response, reverse('accounts:profile'), fetch_redirect_response=False)
+        order = Order.objects.get()
+        self.assertEqual(order.buyer.phone, '992900000000')
+        self.assertEqual(order.items.count(), 2)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_checkout_takes_stock_and_reject_returns_it(self):
+        buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.client.force_login(buyer)
+        self.fill_cart({'buyer': buyer}, 2)
+        self.post_checkout()
+        order = Order.objects.get(buyer=buyer)
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.assertEqual(product.stock, 98)
+
+        self.client.force_login(self.master)
+        self.client.post(reverse('orders:reject_order', args=[order.pk]))
+        self.client.post(reverse('orders:reject_order', args=[order.pk]))
+        order.refresh_from_db()
+        product.refresh_from_db()
+        self.assertEqual(order.status, 'rejected')
+        self.assertEqual(product.stock, 100)
+
+    def test_checkout_fails_when_stock_is_short(self):
+        buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.client.force_login(buyer)
+        self.fill_cart({'buyer': buyer}, 2)
+        Product.objects.filter(pk=self.products[1].pk).update(stock=1)
+        response = self.post_checkout()
+        self.assertRedirects(response, reverse('cart:view_cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(buyer=buyer).count(), 2)
+        self.assertEqual(Product.objects.get(pk=self.products[0].pk).stock, 100)
+
+
+class SellerOrdersTests(TestCase):
+    """Список заказов продавца: агрегаты в базе, позиции только для видимой страницы"""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user(username='seller', role='master')
+        other = User.objects.create_user(username='other', role='master')
+        self.buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.own = Product.objects.create(master=self.seller, name='Свой', description='', price=10)
+        self.foreign = Product.objects.create(master=other, name='Чужой', description='', price=10)
+        self.client.force_login(self.seller)
+
+    def create_orders(self, count, status='new'):
+        for _ in range(count):
+            order = Order.objects.create(buyer=self.buyer, phone_number='0', delivery_address='-', status=status)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=self.own, quantity=2, price=Decimal('10.00')),
+                OrderItem(order=order, product=self.own, quantity=1, price=Decimal('5.00')),
+                OrderItem(order=order, product=self.foreign, quantity=7, price=Decimal('100.00')),
+            ])
+
+    def test_totals_cover_only_seller_items(self):
+        self.create_orders(1)
+        response = self.client.get(reverse('orders:seller_orders'))
+        order_data, = response.context['orders_data']
+        self.assertEqual(order_data['order'].seller_total, Decimal('25.00'))
+        self.assertEqual(order_data['order'].seller_items_count, 2)
+        self.assertEqual(len(order_data['items']), 2)
+
+    def test_query_count_does_not_depend_on_order_count(self):
+        self.create_orders(2)
+        self.client.get(reverse('orders:seller_orders'))
+        with self.assertNumQueries(4):
+            self.client.get(reverse('orders:seller_orders'))
+        self.create_orders(40)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('orders:seller_orders'))
+        self.assertEqual(len(response.context['orders_data']), 20)
+        self.assertTrue(response.context['page'].has_next())
+
+    def test_status_filter(self):
+        self.create_orders(2)
+        self.create_orders(3, status='shipped')
+        response = self.client.get(reverse('orders:seller_orders'), {'status': 'shipped'})
+        self.assertEqual(len(response.context['orders_data']), 3)
+        response = self.client.get(reverse('orders:seller_orders'), {'date_to': '2000-01-01'})
+        self.assertEqual(response.context['orders_data'], [])
+
+
+class InvoiceExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user(username='seller', role='master')
+        self.buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.product = Product.objects.create(master=self.seller, name='Яблоки', description='', price=10)
+        self.orders = []
+        for _ in range(3):
+            order = Order.objects.create(buyer=self.buyer, phone_number='0', delivery_address='-', status='accepted')
+            OrderItem.objects.create(order=order, product=self.product, quantity=3, price=Decimal('10.00'))
+            self.orders.append(order)
+
+    def test_single_invoice(self):
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('orders:download_invoice', args=[self.orders[0].pk]))
+        workbook = load_workbook(io.BytesIO(response.content))
+        sheet = workbook.active
+        self.assertEqual(sheet['A1'].value, 'ТОВАРНАЯ НАКЛАДНАЯ')
+        self.assertEqual(sheet['B11'].value, 'Яблоки')
+        self.assertEqual(sheet['F13'].value, 30)
+
+    def test_bulk_workbook_has_sheet_per_order(self):
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('orders:export_invoices'), {'format': 'xlsx'})
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(workbook.sheetnames, [f'Накладная_{order.pk}' for order in self.orders])
+
+    def test_bulk_zip_streams_workbook_per_order(self):
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('orders:export_invoices'), {'format': 'zip'})
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), [f'invoice_{order.pk}.xlsx' for order in self.orders])
+        self.assertIsNone(archive.testzip())
+
+
+class OrderStatusPushTests(TestCase):
+    """События о смене статуса заказа приходят покупателю и продавцам заказа"""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user(username='seller', role='master')
+        self.other_seller = User.objects.create_user(username='other', role='master')
+        self.stranger = User.objects.create_user(username='stranger', role='master')
+        self.buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.order = Order.objects.create(buyer=self.buyer, phone_number='0', delivery_address='-')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=self.order, quantity=1, price=Decimal('10.00'),
+                      product=Product.objects.create(master=master, name='Товар', description='', price=10))
+            for master in (self.seller, self.other_seller)
+        ])
+
+    def communicator(self, user):
+        # channels.testing тянет за собой daphne, поэтому протокол websocket ведётся вручную
+        scope = {'type': 'websocket', 'path': '/ws/orders/', 'query_string': b'', 'headers': [],
+                 'subprotocols': [], 'user': user}
+        return ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+
+    async def connect(self, communicator):
+        await communicator.send_input({'type': 'websocket.connect'})
+        return await communicator.receive_output()
+
+    async def receive_event(self, communicator):
+        message = await communicator.receive_output()
+        self.assertEqual(message['type'], 'websocket.send')
+        return json.loads(message['text'])
+
+    def change_status(self, user, url_name, data=None):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse(url_name, args=[self.order.pk]), data or {})
+
+    def test_anonymous_connection_is_rejected(self):
+        async def scenario():
+            message = await self.connect(self.communicator(AnonymousUser()))
+            self.assertEqual((message['type'], message['code']), ('websocket.close', 4401))
+        async_to_sync(scenario)()
+
+    def test_status_change_reaches_buyer_and_every_seller(self):
+        async def scenario():
+            sockets = {user: self.communicator(user) for user in (self.buyer, self.seller, self.other_seller, self.stranger)}
+            for socket in sockets.values():
+                self.assertEqual((await self.connect(socket))['type'], 'websocket.accept')
+
+            await sync_to_async(self.change_status)(self.seller, 'orders:accept_order')
+            for user in (self.buyer, self.seller, self.other_seller):
+                event = await self.receive_event(sockets[user])
+                self.assertEqual(event, {'order_id': self.order.pk, 'status': 'accepted',
+                                         'status_display': 'Принят продавцом'})
+            self.assertTrue(await sockets[self.stranger].receive_nothing())
+
+            # Отмена покупателем идёт через условный UPDATE в close_order
+            await sync_to_async(Order.objects.filter(pk=self.order.pk).update)(status='new')
+            await sync_to_async(self.change_status)(self.buyer, 'orders:cancel_order')
+            event = await self.receive_event(sockets[self.other_seller])
+            self.assertEqual(event['status'], 'canceled')
 
-# Create your tests here.
+            for socket in sockets.values():
+                await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+                await socket.wait()
+        async_to_sync(scenario)()
@@ -12,7 +12,9 @@ urlpatterns = [
     path('seller/', views.seller_orders, name='seller_orders'),
     path('accept/<int:order_id>/', views.accept_order, name='accept_order'),
     path('reject/<int:order_id>/', views.reject_order, name='reject_order'),
+    path('cancel/<int:order_id>/', views.cancel_order, name='cancel_order'),
     path('update/<int:order_id>/', views.update_order_status, name='update_order_status'),
     path('confirm-delivery/<int:order_id>/', views.confirm_delivery, name='confirm_delivery'),
     path('download-invoice/<int:order_id>/', views.download_invoice, name='download_invoice'),
+    path('export-invoices/', views.export_invoices, name='export_invoices'),
 ]
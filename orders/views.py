@@ -1,38 +1,71 @@
 # fruitsite/orders/views.py
 
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
 from django.utils.crypto import get_random_string
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, JsonResponse, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-import io
+from django.utils.dateparse import parse_date
+from django.db import transaction
 import json
-from datetime import datetime
+from itertools import islice
+from datetime import datetime, time, timedelta
+from urllib.parse import urlencode
 import re
 
-try:
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-    from openpyxl.utils import get_column_letter
-    OPENPYXL_AVAILABLE = True
-except ImportError:
-    OPENPYXL_AVAILABLE = False
-
-from cart.models import CartItem
 from cart.views import get_cart_owner_info
+from cart.reservations import InsufficientStock
+from cart.summary import refresh_cart_summary
 from accounts.models import User
+from products.pagination import KeysetPaginator
+from .invoices import (
+    MAX_WORKBOOK_SHEETS, OPENPYXL_AVAILABLE, XLSX_CONTENT_TYPE, invoice_bytes, invoices_workbook, stream_invoices_zip,
+)
 from .models import Order, OrderItem
+from .realtime import notify_order_status
+from .services import (
+    attach_seller_items, cart_total, close_order, load_cart, place_order, seller_orders_queryset,
+)
+
+def _place_order_for(request, owner_filter, clean_phone, delivery_address):
+    """
+    Находит или создаёт покупателя по телефону и оформляет заказ в одной транзакции.
+    Возвращает (user, is_new_user, order); order равен None, если корзина пуста.
+    """
+    user = request.user
+    is_new_user = False
+    
+    with transaction.atomic():
+        # Если пользователь не авторизован, создаем новый аккаунт или находим существующий
+        if not user.is_authenticated:
+            user = User.objects.filter(phone=clean_phone).first()
+            if user is None:
+                username = f"user_{get_random_string(8)}"
+                password = get_random_string(12)
+                user = User.objects.create_user(
+                    username=username,
+                    password=password,
+                    phone=clean_phone,
+                    role='buyer'
+                )
+                is_new_user = True
+
+        # Заказ оформляется прямо из анонимной корзины,
+        # переносить её строки пользователю не нужно
+        order = place_order(owner_filter, user, clean_phone, delivery_address)
+        if order is None:
+            # Откатываем созданный аккаунт вместе с пустым заказом
+            transaction.set_rollback(True)
+    return user, is_new_user, order
+
 
 def checkout(request):
-    # Получаем корзину на основе авторизации или сессии
+    # Получаем корзину на основе авторизации или сессии.
+    # Владельца запоминаем до login(): вход меняет ключ сессии
     owner_filter, _ = get_cart_owner_info(request)
-    cart_items = CartItem.objects.filter(**owner_filter)
-    
-    if not cart_items.exists():
-        messages.info(request, "Ваша корзина пуста.")
-        return redirect('products:product_list')
 
     if request.method == 'POST':
         phone = request.POST.get('phone')
@@ -49,75 +82,41 @@ def checkout(request):
             messages.error(request, "Пожалуйста, введите корректный номер телефона (минимум 10 цифр).")
             return redirect('orders:checkout')
             
-        user = request.user
-        
-        # Если пользователь не авторизован, создаем новый аккаунт или находим существующий
+        try:
+            user, is_new_user, order = _place_order_for(request, owner_filter, clean_phone, delivery_address)
+        except InsufficientStock as error:
+            messages.error(request, f"Недостаточно товара на складе: {error}. Измените количество в корзине.")
+            return redirect('cart:view_cart')
+
+        if order is None:
+            messages.info(request, "Ваша корзина пуста.")
+            return redirect('products:product_list')
+
+        refresh_cart_summary(owner_filter)
+
         if not request.user.is_authenticated:
-            # Ищем пользователя с таким телефоном
-            existing_user = User.objects.filter(phone=clean_phone).first()
-            
-            if existing_user:
-                user = existing_user
-                # Если нашли пользователя, авторизуем его
-                login(request, user)
-                messages.success(request, f"Вход выполнен по номеру телефона {phone}.")
+            login(request, user)
+            if is_new_user:
+                messages.success(request, f"Аккаунт создан автоматически. Ваш логин: {user.username}. Пароль отправлен на ваш номер телефона.")
             else:
-                # Создаем нового пользователя
-                username = f"user_{get_random_string(8)}"
-                password = get_random_string(12)
-                user = User.objects.create_user(
-                    username=username,
-                    password=password,
-                    phone=clean_phone,
-                    role='buyer'
-                )
-                login(request, user)
-                messages.success(request, f"Аккаунт создан автоматически. Ваш логин: {username}. Пароль отправлен на ваш номер телефона.")
-                
-            # Перенос товаров из анонимной корзины в корзину пользователя
-            if 'session_key' in owner_filter:
-                session_cart_items = CartItem.objects.filter(session_key=request.session.session_key)
-                for item in session_cart_items:
-                    item.buyer = user
-                    item.session_key = None
-                    item.save()
-        
-        total_amount = sum(item.product.price * item.quantity for item in cart_items)
-
-        # Создаем заказ
-        order = Order.objects.create(
-            buyer=user,
-            phone_number=clean_phone,
-            delivery_address=delivery_address,
-            total_amount=total_amount
-        )
-
-        # Добавляем товары в заказ
-        for item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity,
-                price=item.product.price
-            )
-            
-        # Очищаем корзину
-        cart_items.delete()
+                messages.success(request, f"Вход выполнен по номеру телефона {phone}.")
         
         # Разные сообщения для новых и существующих пользователей
-        if not request.user.is_authenticated or not hasattr(request.user, 'last_login') or request.user.last_login is None:
+        if is_new_user:
             messages.success(request, f"Заказ #{order.id} успешно оформлен! Добро пожаловать в личный кабинет, где вы можете отслеживать статус своих заказов.")
         else:
             messages.success(request, f"Заказ #{order.id} успешно оформлен! Вы можете отслеживать статус заказа в своем профиле.")
         
         return redirect('accounts:profile')
 
-    # Подсчитываем общую сумму
-    total = sum(item.product.price * item.quantity for item in cart_items)
-    
+    cart_items = load_cart(owner_filter)
+    if not cart_items:
+        messages.info(request, "Ваша корзина пуста.")
+        return redirect('products:product_list')
+
     return render(request, 'orders/checkout.html', {
         'cart_items': cart_items,
-        'total': total
+        'total': cart_total(cart_items),
     })
 
 
@@ -175,6 +174,37 @@ def find_orders(request):
     })
 
 
+def _date_param(params, name):
+    """Дата из GET-параметра в формате ГГГГ-ММ-ДД или None"""
+    try:
+        return parse_date(params.get(name) or '')
+    except ValueError:
+        return None
+
+
+def _filter_seller_orders(params, orders):
+    """
+    Применяет фильтры по статусу и периоду из GET-параметров.
+    Возвращает (queryset, параметры фильтров для ссылок).
+    Фильтры используют индексы order_status_created_idx и order_created_id_idx.
+    """
+    filter_params = {}
+    status = params.get('status', '')
+    if status in dict(Order.STATUS_CHOICES):
+        orders = orders.filter(status=status)
+        filter_params['status'] = status
+    # Границы периода задаются диапазоном по created_at, чтобы работал индекс
+    date_from = _date_param(params, 'date_from')
+    if date_from:
+        orders = orders.filter(created_at__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+        filter_params['date_from'] = date_from.isoformat()
+    date_to = _date_param(params, 'date_to')
+    if date_to:
+        orders = orders.filter(created_at__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+        filter_params['date_to'] = date_to.isoformat()
+    return orders, filter_params
+
+
 @login_required
 def seller_orders(request):
     """
@@ -184,27 +214,21 @@ def seller_orders(request):
         messages.error(request, "У вас нет доступа к этой странице.")
         return redirect('accounts:my_products')
     
-    # Получаем все заказы, которые содержат товары этого продавца
-    order_items = OrderItem.objects.filter(
-        product__master=request.user
-    ).select_related('order', 'product').order_by('-order__created_at')
-    
-    # Группируем по заказам для удобного отображения
-    orders_dict = {}
-    for item in order_items:
-        order_id = item.order.id
-        if order_id not in orders_dict:
-            orders_dict[order_id] = {
-                'order': item.order,
-                'items': []
-            }
-        orders_dict[order_id]['items'].append(item)
-    
-    # Преобразуем в список для шаблона
-    orders_data = list(orders_dict.values())
-    
+    orders, filter_params = _filter_seller_orders(request.GET, seller_orders_queryset(request.user))
+
+    # Курсорная пагинация по заказам; позиции загружаются только для видимой страницы
+    paginator = KeysetPaginator(orders, 20)
+    page = paginator.get_page(request.GET.get('cursor'))
+    orders_data = attach_seller_items(list(page), request.user)
+
     return render(request, 'orders/seller_orders.html', {
-        'orders_data': orders_data
+        'orders_data': orders_data,
+        'page': page,
+        'status_choices': Order.STATUS_CHOICES,
+        'selected_status': filter_params.get('status', ''),
+        'date_from': filter_params.get('date_from', ''),
+        'date_to': filter_params.get('date_to', ''),
+        'filter_query': urlencode(filter_params),
     })
 
 
@@ -232,6 +256,7 @@ def accept_order(request, order_id):
     if order.status == 'new':
         order.status = 'accepted'
         order.save()
+        notify_order_status(order)
         messages.success(request, f"Заказ #{order.id} успешно принят.")
     else:
         messages.info(request, f"Заказ #{order.id} уже обработан.")
@@ -259,15 +284,35 @@ def reject_order(request, order_id):
         messages.error(request, "У вас нет товаров в этом заказе.")
         return redirect('orders:seller_orders')
     
-    if order.status == 'new':
-        order.status = 'rejected'
-        order.save()
+    # Товары отклонённого заказа возвращаются на склад
+    if close_order(order, 'rejected'):
         messages.success(request, f"Заказ #{order.id} отклонен.")
     else:
         messages.info(request, f"Заказ #{order.id} уже обработан.")
     
     return redirect('orders:seller_orders')
 
+@login_required
+def cancel_order(request, order_id):
+    """
+    Отмена нового заказа покупателем
+    """
+    order = get_object_or_404(Order, id=order_id)
+    
+    # Проверяем, что это покупатель этого заказа
+    if order.buyer != request.user:
+        messages.error(request, "У вас нет доступа к этому заказу.")
+        return redirect('orders:my_orders')
+    
+    if request.method == 'POST':
+        # Товары отменённого заказа возвращаются на склад
+        if close_order(order, 'canceled'):
+            messages.success(request, f"Заказ #{order.id} отменен.")
+        else:
+            messages.error(request, "Этот заказ уже обработан продавцом и не может быть отменен.")
+    
+    return redirect('orders:my_orders')
+
 @login_required
 def update_order_status(request, order_id):
     """
@@ -300,6 +345,7 @@ def update_order_status(request, order_id):
             if tracking_number:
                 order.tracking_number = tracking_number
             order.save()
+            notify_order_status(order)
             messages.success(request, f"Статус заказа #{order.id} обновлен.")
         else:
             messages.error(request, "Недопустимый статус заказа.")
@@ -327,6 +373,7 @@ def confirm_delivery(request, order_id):
         # Меняем статус на "Доставлен"
         order.status = 'delivered'
         order.save()
+        notify_order_status(order)
         messages.success(request, f"Спасибо! Заказ #{order.id} отмечен как доставленный.")
     
     return redirect('orders:my_orders')
@@ -340,16 +387,13 @@ def download_invoice(request, order_id):
         messages.error(request, "Функция скачивания накладных временно недоступна.")
         return redirect('orders:seller_orders' if request.user.role == 'master' else 'orders:my_orders')
     
-    order = get_object_or_404(Order, id=order_id)
+    order = get_object_or_404(Order.objects.select_related('buyer'), id=order_id)
     
     # Проверяем права доступа
     if request.user.role == 'master':
-        # Для мастера - проверяем что в заказе есть его товары
-        seller_items = OrderItem.objects.filter(
-            order=order,
-            product__master=request.user
-        )
-        if not seller_items.exists():
+        # Для мастера - в накладную попадают только его товары
+        items = attach_seller_items([order], request.user)[0]['items']
+        if not items:
             messages.error(request, "У вас нет доступа к этому заказу.")
             return redirect('orders:seller_orders')
     else:
@@ -357,36 +401,64 @@ def download_invoice(request, order_id):
         if order.buyer != request.user:
             messages.error(request, "У вас нет доступа к этому заказу.")
             return redirect('orders:my_orders')
+        items = list(order.items.select_related('product').order_by('id'))
 
-    # Создаем Excel файл
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"Накладная_{order.id}"
-
-    # Стили
-    title_font = Font(name='Arial', size=16, bold=True)
-    header_font = Font(name='Arial', size=12, bold=True)
-    normal_font = Font(name='Arial', size=11)
-    center_alignment = Alignment(horizontal='center', vertical='center')
-    left_alignment = Alignment(horizontal='left', vertical='center')
-    
-    # Границы
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    response = HttpResponse(invoice_bytes(order, items), content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="invoice_{order.id}.xlsx"'
+    return response
+
+
+# Сколько заказов выгрузки загружается из базы за один раз
+EXPORT_CHUNK_SIZE = 100
+
+
+def _iter_seller_orders_with_items(orders, seller, chunk_size=EXPORT_CHUNK_SIZE):
+    """(заказ, позиции продавца) порциями: один запрос позиций на chunk_size заказов"""
+    iterator = orders.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        for order_data in attach_seller_items(chunk, seller):
+            yield order_data['order'], order_data['items']
+
+
+@login_required
+def export_invoices(request):
+    """
+    Выгрузка накладных продавца за период: одна книга с листом на каждый
+    заказ (format=xlsx) или zip-архив с отдельной книгой на заказ (format=zip).
+    Фильтры те же, что и в списке заказов; без дат выгружается текущий день.
+    """
+    if request.user.role != 'master':
+        messages.error(request, "У вас нет доступа к этой функции.")
+        return redirect('accounts:my_products')
+
+    if not OPENPYXL_AVAILABLE:
+        messages.error(request, "Функция скачивания накладных временно недоступна.")
+        return redirect('orders:seller_orders')
+
+    params = request.GET.copy()
+    if not params.get('date_from') and not params.get('date_to'):
+        today = timezone.localdate().isoformat()
+        params.update({'date_from': today, 'date_to': today})
+    orders, filter_params = _filter_seller_orders(params, seller_orders_queryset(request.user))
+    orders = orders.order_by('created_at', 'id')
+    period = f"{filter_params.get('date_from', '')}_{filter_params.get('date_to', '')}".strip('_')
+    orders_with_items = _iter_seller_orders_with_items(orders, request.user)
+
+    if request.GET.get('format') != 'zip' and orders.count() > MAX_WORKBOOK_SHEETS:
+        messages.error(request, f"За выбранный период больше {MAX_WORKBOOK_SHEETS} заказов. Скачайте накладные архивом ZIP.")
+        return redirect(f"{reverse('orders:seller_orders')}?{urlencode(filter_params)}")
+
+    if request.GET.get('format') == 'zip':
+        response = StreamingHttpResponse(stream_invoices_zip(orders_with_items), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="invoices_{period}.zip"'
+        return response
+
+    return FileResponse(
+        invoices_workbook(orders_with_items),
+        as_attachment=True,
+        filename=f'invoices_{period}.xlsx',
+        content_type=XLSX_CONTENT_TYPE,
     )
-    
-    # Заголовок документа
-    ws.merge_cells('A1:G1')
-    ws['A1'] = 'ТОВАРНАЯ НАКЛАДНАЯ'
-    ws['A1'].font = title_font
-    ws['A1'].alignment = center_alignment
-    
-    # Номер и дата накладной
-    current_row = 3
-    ws[f'A{current_row}'] = f'Накладная № {order.id}'
-    ws[f'A{current_row}'].font = header_font
-    
-    ws[f'E{current_row}'] = f'от {order.created_at.strftime("%d.%m.%Y")}'
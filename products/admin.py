@@ -1,6 +1,7 @@
 # fruitsite/products/admin.py
 from django.contrib import admin
-from .models import Category, Product, ProductImage
+from fruitsite.s3 import commit_files
+from .models import Category, ImageAudit, ImageAuditIssue, Product, ProductImage
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -39,6 +40,15 @@ class ProductAdmin(admin.ModelAdmin):
     search_fields = ['name', 'description']
     readonly_fields = ['created_at']
     inlines = [ProductImageInline]
+
+    def save_formset(self, request, form, formset, change):
+        # Новые изображения загружаются в S3 одновременно, а не по очереди при сохранении каждой строки
+        if formset.model is ProductImage:
+            commit_files(
+                inline_form.instance.image for inline_form in formset.forms
+                if inline_form.cleaned_data and not inline_form.cleaned_data.get('DELETE')
+            )
+        super().save_formset(request, form, formset, change)
     
     fieldsets = (
         ('Основная информация', {
@@ -66,3 +76,25 @@ class ProductAdmin(admin.ModelAdmin):
 class ProductImageAdmin(admin.ModelAdmin):
     list_display = ['product', 'image']
     list_filter = ['product__category']
+
+
+@admin.register(ImageAudit)
+class ImageAuditAdmin(admin.ModelAdmin):
+    """Результаты проверок; запуск — со страницы диагностики или командой audit_s3_images"""
+    list_display = ['started_at', 'finished_at', 'total', 'checked', 'missing', 'failed']
+    readonly_fields = ['started_at', 'updated_at', 'finished_at', 'total', 'last_image_id', 'checked', 'missing', 'failed']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ImageAuditIssue)
+class ImageAuditIssueAdmin(admin.ModelAdmin):
+    list_display = ['image', 'url', 'status_code', 'error']
+    list_filter = ['audit', 'status_code']
+    list_select_related = ['image__product']
+    raw_id_fields = ['image']
+    readonly_fields = ['audit', 'image', 'url', 'status_code', 'error']
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,83 @@
+"""
+Кэшированные снимки каталога, общие для всех процессов через django cache.
+
+Каждый снимок хранится под ключом с номером версии. При изменении
+категорий или товаров версия увеличивается, и следующие чтения
+пересобирают снимок. Время жизни снимков ограничено SNAPSHOT_TIMEOUT,
+поэтому даже при потере сигнала устаревшие данные живут недолго.
+"""
+
+import time
+
+from django.core.cache import cache
+
+CATEGORIES_VERSION_KEY = 'products:categories_version'
+CATALOG_VERSION_KEY = 'products:catalog_version'
+
+SNAPSHOT_TIMEOUT = 300
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Начальное значение из времени: если ключ версии вытеснен из кэша,
+        # новая версия не совпадёт ни с одним из старых снимков
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def get_catalog_version():
+    """Версия каталога: меняется при любом изменении товаров или категорий"""
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def invalidate_catalog():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def invalidate_categories():
+    bump_version(CATEGORIES_VERSION_KEY)
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def _snapshot(name, version, build):
+    key = f'products:{name}:{version}'
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, SNAPSHOT_TIMEOUT)
+    return value
+
+
+def get_categories():
+    """Все категории, отсортированные по названию"""
+    from .models import Category
+
+    return _snapshot(
+        'categories',
+        get_version(CATEGORIES_VERSION_KEY),
+        lambda: list(Category.objects.all()),
+    )
+
+
+def get_categories_with_products():
+    """Категории, в которых есть хотя бы один товар"""
+    from .models import Category, Product
+
+    return _snapshot(
+        'categories_with_products',
+        get_catalog_version(),
+        lambda: list(
+            Category.objects.filter(
+                id__in=Product.objects.exclude(category__isnull=True).values('category_id')
+            ).order_by('name')
+        ),
+    )
@@ -0,0 +1,247 @@
+"""
+Импорт и экспорт каталога продавца в xlsx/csv.
+
+Файл читается построчно (openpyxl в режиме read-only, csv.reader),
+каждая строка проверяется формой ProductImportForm, а проверенные
+строки сохраняются порциями по IMPORT_CHUNK_SIZE: одним запросом
+определяется, какие артикулы уже есть, и одним INSERT ... ON CONFLICT
+товары создаются или обновляются по ключу (master, sku). Память
+расходуется только на текущую порцию, список первых ошибок и множество
+артикулов файла (для поиска повторов).
+
+Экспорт использует те же колонки, поэтому выгруженный файл можно
+исправить и загрузить обратно.
+"""
+
+import csv
+import io
+import tempfile
+
+from django.db import transaction
+
+from .caching import invalidate_catalog
+from .forms import ProductForm, ProductImportForm
+from .models import Category, Product
+from .search import refresh_search_vectors
+
+try:
+    from openpyxl import Workbook, load_workbook
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+
+# Сколько ошибок сохраняется для отчёта; остальные только подсчитываются
+MAX_REPORTED_ERRORS = 200
+
+# Поля в порядке колонок файла; заголовки берутся из подписей ProductForm
+COLUMNS = (
+    'sku', 'name', 'category', 'description', 'volume', 'package_type',
+    'quantity_in_package', 'price_per_unit', 'price_per_package', 'old_price', 'stock',
+)
+HEADERS = [ProductForm.Meta.labels[field] for field in COLUMNS]
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class CatalogImportError(Exception):
+    """Файл нельзя импортировать целиком (неизвестный формат, нет заголовка)"""
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, message))
+
+    @property
+    def truncated_errors(self):
+        return self.error_count - len(self.errors)
+
+
+def _header_map(header):
+    """Номер колонки -> поле по заголовку (подпись из ProductForm или имя поля)"""
+    aliases = {label.lower(): field for field, label in zip(COLUMNS, HEADERS)}
+    aliases.update({field: field for field in COLUMNS})
+    mapping = {}
+    for index, title in enumerate(header):
+        field = aliases.get(str(title or '').strip().lower())
+        if field:
+            mapping[index] = field
+    if 'sku' not in mapping.values() or 'name' not in mapping.values():
+        raise CatalogImportError(
+            f'В первой строке файла должны быть заголовки колонок, как минимум «{HEADERS[0]}» и «{HEADERS[1]}»'
+        )
+    return mapping
+
+
+def _iter_xlsx(uploaded_file):
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_csv(uploaded_file):
+    text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def iter_rows(uploaded_file):
+    """Строки файла (первая — заголовок) по одной"""
+    name = (uploaded_file.name or '').lower()
+    if name.endswith('.xlsx'):
+        if not OPENPYXL_AVAILABLE:
+            raise CatalogImportError('Импорт из Excel временно недоступен, загрузите CSV')
+        return _iter_xlsx(uploaded_file)
+    if name.endswith('.csv'):
+        return _iter_csv(uploaded_file)
+    raise CatalogImportError('Поддерживаются файлы .xlsx и .csv')
+
+
+def _cell_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _update_fields(present):
+    """Поля существующих товаров, которые обновляет импорт: только колонки из файла"""
+    fields = [field for field in COLUMNS if field in present and field != 'sku']
+    if 'price_per_unit' in present:
+        fields.append('price')
+    fields.append('updated_at')
+    return fields
+
+
+def _save_chunk(seller, products, update_fields, report):
+    skus = [product.sku for product in products]
+    existing = set(Product.objects.filter(master=seller, sku__in=skus).values_list('sku', flat=True))
+    with transaction.atomic():
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['master', 'sku'],
+            update_fields=update_fields,
+        )
+        # bulk_create не вызывает Product.save(), поисковые векторы пересчитываются отдельно
+        refresh_search_vectors(Product.objects.filter(master=seller, sku__in=skus))
+    report.updated += len(existing)
+    report.created += len(products) - len(existing)
+
+
+def import_products(seller, uploaded_file):
+    """
+    Импортирует товары продавца из файла. Возвращает ImportReport.
+    Строки с ошибками пропускаются, остальные сохраняются.
+    """
+    report = ImportReport()
+    categories = {
+        category.name.lower(): category
+        for category in Category.objects.filter(created_by=seller)
+    }
+    rows = iter_rows(uploaded_file)
+    try:
+        mapping = _header_map(next(rows))
+    except StopIteration:
+        raise CatalogImportError('Файл пуст')
+
+    present = set(mapping.values())
+    update_fields = _update_fields(present)
+    # Для колонок, которых нет в файле, новые товары получают значения по умолчанию
+    defaults = {}
+    for field in COLUMNS:
+        if field not in present and field != 'category':
+            default = Product._meta.get_field(field).get_default()
+            defaults[field] = '' if default is None else str(default)
+
+    seen_skus = set()
+    chunk = []
+    for row_number, row in enumerate(rows, start=2):
+        data = {field: _cell_value(row[index]) for index, field in mapping.items() if index < len(row)}
+        if not any(data.values()):
+            continue
+        # Форма на каждую строку: строка проверяется теми же правилами, что и ProductForm
+        form = ProductImportForm({**defaults, **data}, categories=categories)
+        if not form.is_valid():
+            messages = [
+                f"{form.fields[field].label}: {error}" if field in form.fields else error
+                for field, errors in form.errors.items()
+                for error in errors
+            ]
+            report.add_error(row_number, '; '.join(messages))
+            continue
+        cleaned = form.cleaned_data
+        if cleaned['sku'] in seen_skus:
+            report.add_error(row_number, f"Артикул {cleaned['sku']} повторяется в файле")
+            continue
+        seen_skus.add(cleaned['sku'])
+
+        product = Product(master=seller, price=cleaned['price'])
+        for field in COLUMNS:
+            setattr(product, field, cleaned.get(field))
+        chunk.append(product)
+
+        if len(chunk) >= IMPORT_CHUNK_SIZE:
+            _save_chunk(seller, chunk, update_fields, report)
+            chunk = []
+
+    if chunk:
+        _save_chunk(seller, chunk, update_fields, report)
+    if report.created or report.updated:
+        invalidate_catalog()
+    return report
+
+
+# --- Экспорт ------------------------------------------------------------------
+
+def _export_rows(seller):
+    fields = [f'{field}__name' if field == 'category' else field for field in COLUMNS]
+    queryset = Product.objects.filter(master=seller).order_by('id').values_list(*fields)
+    for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield ['' if value is None else value for value in row]
+
+
+class _Echo:
+    """Объект с методом write, возвращающий записанное (для csv.writer)"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(seller):
+    """Генератор строк CSV (с BOM, чтобы Excel распознал UTF-8)"""
+    writer = csv.writer(_Echo(), delimiter=';')
+    yield '\ufeff' + writer.writerow(HEADERS)
+    for row in _export_rows(seller):
+        yield writer.writerow(row)
+
+
+def export_xlsx(seller):
+    """Книга write-only во временном файле, перемотанном в начало"""
+    workbook = Workbook(write_only=True)
+    ws = workbook.create_sheet(title='Товары')
+    ws.append(HEADERS)
+    for row in _export_rows(seller):
+        ws.append(row)
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
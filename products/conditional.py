@@ -0,0 +1,53 @@
+"""
+Валидаторы условных GET-запросов (ETag) для страниц каталога.
+
+ETag вычисляется до представления декоратором
+django.views.decorators.http.condition; если он совпал с If-None-Match,
+ответ 304 отдаётся без выборки товаров и без рендеринга шаблона.
+
+Страница вошедшего пользователя содержит его данные (CSRF-токен,
+шапку), поэтому в ETag входит ключ его сессии: после входа или выхода
+страница загружается заново. Страницы анонимных посетителей общие
+(см. products.page_cache).
+"""
+
+import hashlib
+
+from .caching import get_catalog_version
+from .models import Product
+from .page_cache import catalog_state, page_query
+
+
+def _etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def visitor_tag(request):
+    if request.user.is_authenticated:
+        return request.session.session_key
+    return 'anonymous'
+
+
+def catalog_page_etag(params):
+    """
+    ETag страницы каталога: состояние каталога (версия и время последнего
+    изменения товаров, в том числе остатков) и параметры params
+    """
+
+    def etag(request, *args, **kwargs):
+        return _etag(catalog_state(request), page_query(request, params), visitor_tag(request))
+
+    return etag
+
+
+def product_etag(request, pk):
+    """
+    ETag страницы товара: время его изменения (в том числе остатка, рейтинга
+    и отзывов — reviews.ratings) и версия каталога, которая меняется при
+    изменении изображений и категорий. Других товаров страница не выводит.
+    Для несуществующего товара None — представление вернёт 404.
+    """
+    updated_at = Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return _etag(pk, updated_at.isoformat(), get_catalog_version(), visitor_tag(request))
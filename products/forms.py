@@ -24,13 +24,14 @@ class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
         fields = [
-            'category', 'name', 'description', 'volume', 'package_type', 
+            'category', 'name', 'sku', 'description', 'volume', 'package_type', 
             'quantity_in_package', 'price_per_unit', 'price_per_package', 
             'price', 'old_price', 'stock'
         ]
         labels = {
             'category': 'Категория',
             'name': 'Наименование продукции',
+            'sku': 'Артикул',
             'description': 'Описание',
             'volume': 'Объем, г',
             'package_type': 'Вид упаковки',
@@ -48,16 +49,26 @@ class ProductForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
+        self.user = user
         
         # Показываем только категории, созданные текущим пользователем
-        if user:
-            available_categories = Category.objects.filter(
-                created_by=user
-            ).order_by('name')
-            self.fields['category'].queryset = available_categories
-        else:
-            # Если пользователь не передан, показываем пустой queryset
-            self.fields['category'].queryset = Category.objects.none()
+        # (в форме импорта категория задаётся названием, а не выбором)
+        category_field = self.fields.get('category')
+        if isinstance(category_field, forms.ModelChoiceField):
+            if user:
+                category_field.queryset = Category.objects.filter(created_by=user).order_by('name')
+            else:
+                # Если пользователь не передан, показываем пустой queryset
+                category_field.queryset = Category.objects.none()
+
+    def clean_sku(self):
+        sku = (self.cleaned_data.get('sku') or '').strip()
+        if not sku:
+            return None
+        duplicates = Product.objects.filter(master=self.user, sku=sku).exclude(pk=self.instance.pk)
+        if self.user and duplicates.exists():
+            raise forms.ValidationError('Товар с таким артикулом уже есть')
+        return sku
 
     def clean_price_per_unit(self):
         price = self.cleaned_data.get('price_per_unit')
@@ -92,3 +103,46 @@ class ProductForm(forms.ModelForm):
             cleaned_data['price'] = price_per_unit
         
         return cleaned_data
+
+
+class ProductImportForm(ProductForm):
+    """
+    Проверка строки импорта по правилам ProductForm: на каждую строку
+    создаётся связанная форма и вызывается is_valid().
+
+    Категория задаётся названием и ищется в заранее загруженном словаре,
+    поэтому не входит в поля модели формы; артикул обязателен. Продавец
+    в форму не входит, поэтому уникальность (master, sku) форма не
+    проверяет: повторы в файле отсекает импорт, а существующие товары
+    обновляются по этому ключу.
+    """
+
+    category = forms.CharField(label=ProductForm.Meta.labels['category'], required=False)
+
+    class Meta(ProductForm.Meta):
+        fields = [field for field in ProductForm.Meta.fields if field != 'category']
+
+    def __init__(self, *args, categories=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.categories = categories or {}
+        self.fields['sku'].required = True
+        # Поле price (для совместимости) заполняется из цены за единицу в clean()
+        self.fields['price'].required = False
+
+    def clean_category(self):
+        name = (self.cleaned_data.get('category') or '').strip()
+        if not name:
+            return None
+        category = self.categories.get(name.lower())
+        if category is None:
+            raise forms.ValidationError(f'Категория «{name}» не найдена среди ваших категорий')
+        return category
+
+    def clean_sku(self):
+        return (self.cleaned_data.get('sku') or '').strip()
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('price') is None:
+            cleaned_data['price'] = cleaned_data.get('price_per_unit') or 0
+        return cleaned_data
@@ -0,0 +1,196 @@
+"""
+Проверка доступности всех изображений товаров в S3.
+
+Изображения читаются из базы порциями по возрастанию id, публичные
+URL проверяются HEAD-запросами одновременно в пуле потоков через одну
+requests.Session с пулом соединений (соединения с хранилищем
+переиспользуются между запросами). После каждой порции в одной
+транзакции сохраняются найденные проблемы и контрольная точка
+ImageAudit.last_image_id, поэтому прерванная проверка продолжается
+с места остановки.
+
+Проверку выполняет один процесс: перед запуском он захватывает аренду
+(ImageAudit.lease_token, lease_until) условным UPDATE и продлевает её
+с каждой порцией. Порция сохраняется, только пока аренда за ним; аренду
+процесса, остановившегося без её освобождения, можно захватить после
+LEASE_TIMEOUT.
+"""
+
+import logging
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .models import ImageAudit, ImageAuditIssue, ProductImage
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BATCH_SIZE = 1000
+REQUEST_TIMEOUT = 5
+
+# Порция из AUDIT_BATCH_SIZE изображений с повторами проверяется заметно быстрее
+LEASE_TIMEOUT = timedelta(minutes=15)
+
+
+class AuditInProgress(Exception):
+    """Проверку выполняет другой процесс"""
+
+
+def default_workers():
+    return getattr(settings, 'IMAGE_AUDIT_WORKERS', 32)
+
+
+def make_session(workers):
+    """Сессия с пулом на workers соединений и повтором при обрывах и 5xx"""
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.2, status_forcelist=(500, 502, 503, 504), allowed_methods=('HEAD',))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def check_url(session, url):
+    """(HTTP-статус, ошибка) для HEAD-запроса к url"""
+    if not url:
+        return None, 'Нет URL'
+    try:
+        response = session.head(url, timeout=REQUEST_TIMEOUT, allow_redirects=True)
+        return response.status_code, ''
+    except requests.RequestException as e:
+        return None, str(e)[:255]
+
+
+def _image_batches(after_id, batch_size):
+    """Порции (id, публичный URL) изображений с id больше after_id"""
+    while True:
+        batch = list(
+            ProductImage.objects.filter(pk__gt=after_id)
+            .exclude(image='')
+            .order_by('pk')
+            .values_list('pk', 'public_url')[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        after_id = batch[-1][0]
+
+
+def start_audit():
+    return ImageAudit.objects.create(total=ProductImage.objects.exclude(image='').count())
+
+
+def unfinished_audit():
+    """Последняя незавершённая проверка, если она есть"""
+    return ImageAudit.objects.filter(finished_at__isnull=True).order_by('-started_at').first()
+
+
+def claim_audit(audit):
+    """
+    Захватывает аренду проверки. Возвращает токен аренды или None,
+    если проверку выполняет другой процесс или она завершена.
+    """
+    token = secrets.token_hex(16)
+    now = timezone.now()
+    claimed = (
+        ImageAudit.objects.filter(pk=audit.pk, finished_at__isnull=True)
+        .filter(Q(lease_until__isnull=True) | Q(lease_until__lt=now))
+        .update(lease_token=token, lease_until=now + LEASE_TIMEOUT)
+    )
+    return token if claimed else None
+
+
+def _save_batch(audit, token, batch, issues):
+    """Сохраняет результаты порции и продлевает аренду; False — аренда потеряна"""
+    with transaction.atomic():
+        # Изображение могло быть удалено во время проверки
+        existing = set(
+            ProductImage.objects.filter(pk__in=[issue.image_id for issue in issues]).values_list('pk', flat=True)
+        )
+        issues = [issue for issue in issues if issue.image_id in existing]
+        missing = sum(1 for issue in issues if issue.status_code is not None)
+        now = timezone.now()
+        updated = ImageAudit.objects.filter(pk=audit.pk, lease_token=token).update(
+            last_image_id=batch[-1][0],
+            checked=F('checked') + len(batch),
+            missing=F('missing') + missing,
+            failed=F('failed') + len(issues) - missing,
+            lease_until=now + LEASE_TIMEOUT,
+            updated_at=now,
+        )
+        if not updated:
+            transaction.set_rollback(True)
+            return False
+        ImageAuditIssue.objects.bulk_create(issues, ignore_conflicts=True)
+    return True
+
+
+def run_audit(audit, workers=None, batch_size=AUDIT_BATCH_SIZE, progress=None, lease_token=None):
+    """
+    Проверяет изображения, начиная с контрольной точки audit.
+    progress(audit) вызывается после каждой сохранённой порции.
+    lease_token — уже захваченная аренда (claim_audit); без него аренда
+    захватывается здесь. AuditInProgress, если проверку выполняет другой процесс.
+    """
+    token = lease_token or claim_audit(audit)
+    if token is None:
+        raise AuditInProgress(audit.pk)
+    workers = workers or default_workers()
+    session = make_session(workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-audit') as executor:
+            for batch in _image_batches(audit.last_image_id, batch_size):
+                results = executor.map(lambda row: check_url(session, row[1]), batch)
+                issues = [
+                    ImageAuditIssue(audit=audit, image_id=pk, url=url, status_code=status, error=error)
+                    for (pk, url), (status, error) in zip(batch, results)
+                    if status != 200
+                ]
+                if not _save_batch(audit, token, batch, issues):
+                    raise AuditInProgress(audit.pk)
+                audit.refresh_from_db()
+                if progress:
+                    progress(audit)
+        now = timezone.now()
+        ImageAudit.objects.filter(pk=audit.pk, lease_token=token).update(finished_at=now, updated_at=now)
+    finally:
+        session.close()
+        # Прерванную проверку можно продолжить сразу, не дожидаясь истечения аренды
+        ImageAudit.objects.filter(pk=audit.pk, lease_token=token).update(lease_token='', lease_until=None)
+
+    audit.refresh_from_db()
+    return audit
+
+
+def _run_in_background(audit, lease_token):
+    try:
+        run_audit(audit, lease_token=lease_token)
+    except Exception:
+        logger.exception('Проверка изображений %s прервана с ошибкой', audit.pk)
+    finally:
+        connections.close_all()
+
+
+def start_in_background():
+    """
+    Продолжает незавершённую проверку или начинает новую в фоновом потоке.
+    Возвращает (проверка, запущена ли она этим вызовом). Проверку, которую
+    выполняет другой процесс (в том числе другой воркер), не запускает.
+    """
+    audit = unfinished_audit() or start_audit()
+    lease_token = claim_audit(audit)
+    if lease_token is None:
+        return audit, False
+    threading.Thread(
+        target=_run_in_background, args=(audit, lease_token), name='image-audit', daemon=True
+    ).start()
+    return audit, True
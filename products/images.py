@@ -0,0 +1,154 @@
+"""
+Производные изображения товаров: уменьшенные копии фиксированной ширины
+в форматах AVIF, WebP и JPEG для srcset.
+
+Копии создаются после сохранения ProductImage в фоновом пуле потоков
+(Pillow освобождает GIL при декодировании, масштабировании и
+кодировании), записываются в S3 рядом с оригиналом по предсказуемым
+именам (<имя>_<ширина>w.<формат>), а в ProductImage.derivatives
+сохраняется перечень созданных ширин и форматов. Пока копий нет,
+шаблоны показывают оригинал.
+"""
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+
+from fruitsite.s3 import upload_concurrently
+from fruitsite.storage_backends import ProductImageDerivativesStorage
+from .caching import invalidate_catalog
+
+try:
+    from PIL import Image, ImageOps, features
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Ширины копий: мини-превью галереи, карточки каталога, основное фото
+DERIVATIVE_WIDTHS = (160, 320, 640, 1024)
+
+# Формат -> (расширение, MIME-тип, параметры сохранения Pillow); порядок — от лучшего сжатия к совместимому
+FORMATS = {
+    'avif': ('avif', 'image/avif', {'quality': 55, 'speed': 8}),
+    'webp': ('webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_storage = ProductImageDerivativesStorage()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def available_formats():
+    """Форматы, которые поддерживает установленный Pillow"""
+    if not PILLOW_AVAILABLE:
+        return []
+    return [fmt for fmt in FORMATS if fmt == 'jpeg' or features.check(fmt)]
+
+
+def derivative_name(name, width, fmt):
+    root, _ = os.path.splitext(name)
+    return f'{root}_{width}w.{FORMATS[fmt][0]}'
+
+
+def derivative_url(name, width, fmt):
+    return _storage.url(derivative_name(name, width, fmt))
+
+
+def target_widths(original_width):
+    """Ширины копий не больше оригинала; маленький оригинал получает одну копию своей ширины"""
+    widths = [width for width in DERIVATIVE_WIDTHS if width <= original_width]
+    return widths or [original_width]
+
+
+def render_derivatives(data, formats=None):
+    """
+    Уменьшенные копии изображения из байтов data.
+    Возвращает (ширины, [(ширина, формат, байты), ...]).
+    """
+    formats = formats or available_formats()
+    with Image.open(io.BytesIO(data)) as source:
+        # Для JPEG декодер сразу уменьшает изображение кратно 2, если это позволяет наибольшая ширина
+        source.draft(None, (max(DERIVATIVE_WIDTHS), 1))
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+    widths = target_widths(image.width)
+    results = []
+    # От большей ширины к меньшей: каждая копия масштабируется из предыдущей, а не из оригинала
+    current = image
+    for width in sorted(widths, reverse=True):
+        if current.width != width:
+            height = max(1, round(current.height * width / current.width))
+            current = current.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            frame = current.convert('RGB') if fmt == 'jpeg' and current.mode != 'RGB' else current
+            buffer = io.BytesIO()
+            frame.save(buffer, format=fmt.upper(), **FORMATS[fmt][2])
+            results.append((width, fmt, buffer.getvalue()))
+    return sorted(widths), results
+
+
+def generate_derivatives(image):
+    """Создаёт копии для ProductImage и сохраняет их перечень; возвращает перечень"""
+    from .models import ProductImage
+
+    name = image.image.name
+    with image.image.storage.open(name, 'rb') as original:
+        data = original.read()
+    widths, results = render_derivatives(data)
+    # Копии загружаются в S3 одновременно через общий пул
+    upload_concurrently(
+        partial(_storage.save, derivative_name(name, width, fmt), ContentFile(content))
+        for width, fmt, content in results
+    )
+
+    formats = [fmt for fmt in FORMATS if any(result[1] == fmt for result in results)]
+    manifest = {'source': name, 'widths': widths, 'formats': formats}
+    # Изображение могли заменить, пока копии создавались; перечень относится только к этому файлу
+    if ProductImage.objects.filter(pk=image.pk, image=name).update(derivatives=manifest):
+        invalidate_catalog()
+    image.derivatives = manifest
+    return manifest
+
+
+def _generate_in_worker(image_id):
+    from .models import ProductImage
+
+    try:
+        image = ProductImage.objects.filter(pk=image_id).first()
+        if image is not None and image.image:
+            generate_derivatives(image)
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s', image_id)
+    finally:
+        # У каждого потока пула своё соединение с базой
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2),
+                thread_name_prefix='image-derivatives',
+            )
+        return _executor
+
+
+def schedule_derivatives(image):
+    """Ставит создание копий в фоновый пул после фиксации транзакции"""
+    if not PILLOW_AVAILABLE:
+        return
+    image_id = image.pk
+    transaction.on_commit(lambda: get_executor().submit(_generate_in_worker, image_id))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.image_audit import (
+    AUDIT_BATCH_SIZE, AuditInProgress, default_workers, run_audit, start_audit, unfinished_audit,
+)
+
+
+class Command(BaseCommand):
+    help = 'Проверяет доступность всех изображений товаров в S3 и сохраняет найденные проблемы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resume', action='store_true', help='Продолжить последнюю незавершённую проверку')
+        parser.add_argument('--workers', type=int, default=default_workers(), help='Одновременных запросов')
+        parser.add_argument('--batch-size', type=int, default=AUDIT_BATCH_SIZE, help='Изображений в порции')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            audit = unfinished_audit()
+            if audit is None:
+                raise CommandError('Нет незавершённой проверки, запустите команду без --resume')
+            self.stdout.write(f'Продолжение проверки #{audit.pk} с изображения {audit.last_image_id + 1}')
+        else:
+            audit = start_audit()
+            self.stdout.write(f'Проверка #{audit.pk}: изображений {audit.total}')
+
+        def progress(audit):
+            self.stdout.write(
+                f'Проверено {audit.checked} из {audit.total}, недоступно {audit.missing}, ошибок {audit.failed}'
+            )
+
+        try:
+            audit = run_audit(audit, workers=options['workers'], batch_size=options['batch_size'], progress=progress)
+        except AuditInProgress:
+            raise CommandError(f'Проверку #{audit.pk} выполняет другой процесс')
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                f'Проверка #{audit.pk} прервана, продолжить: manage.py audit_s3_images --resume'
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверка #{audit.pk} завершена: проверено {audit.checked}, '
+            f'недоступно {audit.missing}, ошибок {audit.failed}'
+        ))
@@ -0,0 +1,66 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from fruitsite.bench import measure, rolled_back
+from products.caching import get_categories, get_version
+from products.models import Category
+
+# Снимок бенчмарка хранится под собственной версией: категории, созданные
+# в откатываемой транзакции, не попадают в снимок, который читает сайт,
+# а общий кэш не очищается целиком
+BENCH_VERSION_KEY = 'products:bench_cache:categories_version'
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает чтение снимка категорий из двухуровневого кэша и только из общего кэша'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=50, help='Количество категорий в снимке')
+        parser.add_argument('--reads', type=int, default=1000, help='Чтений в одном замере')
+        parser.add_argument(
+            '--shared-latency-ms', type=float, default=0.5,
+            help='Задержка общего кэша, мс (имитация сети до Redis; 0 — без задержки)',
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Количество замеров')
+
+    def handle(self, *args, **options):
+        reads = options['reads']
+        latency = options['shared_latency_ms'] / 1000
+        shared = cache.shared
+        shared_get = shared.get
+
+        def delayed_get(*args, **kwargs):
+            time.sleep(latency)
+            return shared_get(*args, **kwargs)
+
+        with rolled_back(), mock.patch.object(shared, 'get', delayed_get if latency else shared_get), \
+                mock.patch('products.caching.CATEGORIES_VERSION_KEY', BENCH_VERSION_KEY):
+            Category.objects.bulk_create([Category(name=f'Категория {i}') for i in range(options['categories'])])
+            cache.delete(BENCH_VERSION_KEY)
+            version = get_version(BENCH_VERSION_KEY)
+            try:
+                get_categories()
+
+                def read():
+                    for _ in range(reads):
+                        get_categories()
+
+                # Без копий в памяти процесса каждое чтение версии и снимка идёт в общий кэш
+                with mock.patch.dict(cache._namespaces, {'products': {'timeout': 300}}):
+                    shared_ms = measure(read, options['repeat'], warmup=1)
+                cache.reset_stats()
+                two_tier_ms = measure(read, options['repeat'], warmup=1)
+                stats = cache.stats().get('products', {})
+            finally:
+                cache.delete_many([BENCH_VERSION_KEY, f'products:categories:{version}'])
+
+        self.stdout.write(f'Только общий кэш:    {shared_ms / reads * 1000:8.1f} мкс на чтение')
+        self.stdout.write(f'Двухуровневый кэш:   {two_tier_ms / reads * 1000:8.1f} мкс на чтение ')
+        self.stdout.write(
+            f"Пространство products: в памяти процесса {stats.get('local_hits', 0)}, "
+            f"в общем кэше {stats.get('shared_hits', 0)}, промахов {stats.get('misses', 0)}, "
+            f"доля попаданий {stats.get('hit_ratio', 0):.1%}"
+        )
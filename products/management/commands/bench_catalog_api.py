@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from accounts.models import User
+from fruitsite.bench import measure, rolled_back
+from products.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает JSON API каталога и рендеринг HTML-таблицы товаров (время ответа, размер, запросов в секунду)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000, help='Количество товаров')
+        parser.add_argument('--per-page', type=int, default=20, help='Товаров на странице')
+        parser.add_argument('--repeat', type=int, default=50, help='Количество замеров')
+
+    def handle(self, *args, **options):
+        per_page = options['per_page']
+        repeat = options['repeat']
+
+        with rolled_back(), override_settings(ALLOWED_HOSTS=['testserver']):
+            master = User.objects.create_user(username='bench_api_master', role='master')
+            buyer = User.objects.create_user(username='bench_api_buyer', role='buyer')
+            categories = Category.objects.bulk_create([Category(name=f'Категория {i}') for i in range(20)])
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        master=master, category=categories[i % len(categories)], name=f'Товар {i}',
+                        description='Описание товара ' * 10, price=i % 500 + 1, price_per_unit=i % 500 + 1,
+                    )
+                    for i in range(options['products'])
+                ],
+                batch_size=1000,
+            )
+
+            # Вошедший покупатель: HTML-таблица рендерится на каждый запрос, без кэша анонимных страниц
+            client = Client()
+            client.force_login(buyer)
+            table_url = reverse('products:product_table')
+            api_url = reverse('products:api_products') + f'?limit={per_page}'
+            sparse_url = api_url + '&fields=id,name,price_per_unit'
+
+            cases = [
+                ('HTML-таблица', table_url, {}),
+                ('JSON API', api_url, {}),
+                ('JSON API, gzip', api_url, {'HTTP_ACCEPT_ENCODING': 'gzip'}),
+                ('JSON API, fields=', sparse_url, {}),
+            ]
+            results = []
+            for title, url, headers in cases:
+                response = client.get(url, **headers)
+                ms = measure(lambda: client.get(url, **headers), repeat, warmup=3)
+                results.append((title, ms, len(response.content)))
+
+        table_ms = results[0][1]
+        for title, ms, size in results:
+            self.stdout.write(
+                f'{title:<18} {ms:7.2f} мс  {1000 / ms:7.0f} запр/с  {size / 1024:7.1f} КБ  '
+                f'x{table_ms / ms:.1f}'
+            )
@@ -0,0 +1,51 @@
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from fruitsite.bench import measure
+from fruitsite.local_s3 import LocalS3Server
+from fruitsite.s3 import upload_concurrently
+from fruitsite.storage_backends import ProductImagesStorage
+
+
+class Command(BaseCommand):
+    help = 'Измеряет скорость загрузки изображений в S3 (локальная замена S3 с задержкой сети)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counts', type=int, nargs='+', default=[1, 5, 20], help='Количество изображений')
+        parser.add_argument('--size-kb', type=int, default=300, help='Размер одного изображения, КБ')
+        parser.add_argument('--latency-ms', type=float, default=30, help='Задержка ответа S3, мс')
+        parser.add_argument('--repeat', type=int, default=5, help='Количество замеров')
+
+    def handle(self, *args, **options):
+        payload = b'\xff' * (options['size_kb'] * 1024)
+        results = []
+
+        with LocalS3Server(latency=options['latency_ms'] / 1000) as server:
+            with override_settings(AWS_S3_ENDPOINT_URL=server.url, AWS_S3_USE_SSL=False):
+                # Обе схемы загружают через одно хранилище (без HEAD-проверок имени),
+                # различается только одновременность загрузок
+                storage = ProductImagesStorage()
+
+                for count in options['counts']:
+                    def serial():
+                        for i in range(count):
+                            storage.save(f'bench_{i}.jpg', ContentFile(payload))
+
+                    def concurrent():
+                        upload_concurrently(
+                            (lambda i=i: storage.save(f'bench_{i}.jpg', ContentFile(payload)))
+                            for i in range(count)
+                        )
+
+                    serial_ms = measure(serial, options['repeat'], warmup=1)
+                    concurrent_ms = measure(concurrent, options['repeat'], warmup=1)
+                    results.append((count, serial_ms, concurrent_ms))
+
+        megabytes = len(payload) / (1024 * 1024)
+        for count, serial_ms, concurrent_ms in results:
+            self.stdout.write(
+                f'{count:>3} изобр.: по очереди {serial_ms:8.1f} мс ({count * megabytes / serial_ms * 1000:6.1f} МБ/с), '
+                f'одновременно {concurrent_ms:8.1f} мс ({count * megabytes / concurrent_ms * 1000:6.1f} МБ/с), '
+                f'x{serial_ms / concurrent_ms:.1f}'
+            )
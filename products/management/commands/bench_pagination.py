@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+
+from accounts.models import User
+from fruitsite.bench import measure, rolled_back
+from products.models import Product
+from products.pagination import KeysetPaginator
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время выборки первой и глубокой страницы каталога (OFFSET и курсор)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=500, help='Номер глубокой страницы')
+        parser.add_argument('--per-page', type=int, default=20, help='Товаров на страницу')
+        parser.add_argument('--repeat', type=int, default=20, help='Количество замеров')
+
+    def handle(self, *args, **options):
+        pages = options['pages']
+        per_page = options['per_page']
+        repeat = options['repeat']
+
+        with rolled_back():
+            master = User.objects.create_user(username='bench_pagination_master', role='master')
+            Product.objects.bulk_create(
+                [
+                    Product(master=master, name=f'Товар {i}', description='', price=1)
+                    for i in range(pages * per_page + per_page)
+                ],
+                batch_size=1000,
+            )
+            queryset = Product.objects.select_related('category').filter(master=master)
+
+            # Доходим до нужной страницы по курсорам один раз
+            paginator = KeysetPaginator(queryset, per_page)
+            cursor = None
+            for _ in range(pages - 1):
+                cursor = paginator.get_page(cursor).next_cursor
+
+            def keyset_page(page_cursor):
+                return lambda: list(KeysetPaginator(queryset, per_page).get_page(page_cursor))
+
+            def offset_page(number):
+                return lambda: list(Paginator(queryset.order_by('-created_at', '-id'), per_page).get_page(number))
+
+            results = [
+                ('keyset', 1, measure(keyset_page(None), repeat)),
+                ('keyset', pages, measure(keyset_page(cursor), repeat)),
+                ('offset', 1, measure(offset_page(1), repeat)),
+                ('offset', pages, measure(offset_page(pages), repeat)),
+            ]
+
+        for mode, page, ms in results:
+            self.stdout.write(f'{mode:<7} страница {page:>5}: {ms:8.2f} мс')
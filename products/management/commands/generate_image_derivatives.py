@@ -0,0 +1,67 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from products.images import generate_derivatives
+from products.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии (AVIF/WebP/JPEG) для уже загруженных изображений товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2) * 2,
+            help='Количество потоков обработки',
+        )
+        parser.add_argument('--force', action='store_true', help='Пересоздать копии, даже если они уже есть')
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер порции чтения из базы')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        images = (
+            ProductImage.objects.exclude(image='')
+            .only('id', 'image', 'derivatives')
+            .order_by('id')
+            .iterator(chunk_size=options['batch_size'])
+        )
+        done = failed = skipped = 0
+
+        def process(image):
+            try:
+                generate_derivatives(image)
+                return None
+            except Exception as e:
+                return f'{image.pk}: {e}'
+            finally:
+                connections.close_all()
+
+        # Количество задач в очереди ограничено, чтобы не держать в памяти весь список изображений
+        pending = set()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-derivatives') as executor:
+            for image in images:
+                if image.has_derivatives and not options['force']:
+                    skipped += 1
+                    continue
+                pending.add(executor.submit(process, image))
+                if len(pending) >= workers * 4:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    done, failed = self._collect(finished, done, failed)
+            finished, _ = wait(pending)
+            done, failed = self._collect(finished, done, failed)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {done}, пропущено (копии уже есть): {skipped}, с ошибками: {failed}'
+        ))
+
+    def _collect(self, finished, done, failed):
+        for future in finished:
+            error = future.result()
+            if error:
+                failed += 1
+                self.stderr.write(f'Ошибка: {error}')
+            else:
+                done += 1
+        return done, failed
@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from products.caching import invalidate_categories
 from products.models import Category
 
 
@@ -17,6 +18,8 @@ class Command(BaseCommand):
         
         # Делаем их глобальными
         updated_count = old_categories.update(is_global=True)
+        # update() не отправляет сигналы, сбрасываем кэш категорий вручную
+        invalidate_categories()
         
         self.stdout.write(
             self.style.SUCCESS(
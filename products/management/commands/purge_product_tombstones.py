@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from products.sync import TOMBSTONE_RETENTION, purge_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Удаляет записи об удалённых товарах, которые уже не нужны синхронизации офлайн-каталога'
+
+    def handle(self, *args, **options):
+        deleted = purge_tombstones()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено записей: {deleted} (старше {TOMBSTONE_RETENTION.days} дней)'
+        ))
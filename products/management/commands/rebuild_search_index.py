@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from products.caching import invalidate_catalog
+from products.models import Product
+from products.search import refresh_search_vectors, uses_postgres_search
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы всех товаров'
+
+    def handle(self, *args, **options):
+        if uses_postgres_search():
+            refresh_search_vectors(Product.objects.all())
+            self.stdout.write(self.style.SUCCESS('Поисковые векторы товаров пересчитаны.'))
+        else:
+            invalidate_catalog()
+            self.stdout.write(self.style.SUCCESS('Резервный поисковый индекс будет перестроен при следующем поиске.'))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:04
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_indexes(apps, schema_editor):
+    # Поиск через tsvector и pg_trgm доступен только на PostgreSQL,
+    # на остальных СУБД используется резервный индекс в памяти
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_search_vector_gin '
+        'ON products_product USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS product_name_trgm_gin '
+        'ON products_product USING gin (name gin_trgm_ops)'
+    )
+    schema_editor.execute("""
+        UPDATE products_product AS p SET search_vector =
+            setweight(to_tsvector('russian', coalesce(p.name, '')), 'A')
+            || setweight(to_tsvector('russian',
+                coalesce((SELECT c.name FROM products_category AS c WHERE c.id = p.category_id), '')
+                || ' ' || coalesce(p.package_type, '')), 'B')
+            || setweight(to_tsvector('russian', coalesce(p.description, '')), 'C')
+    """)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS product_search_vector_gin')
+    schema_editor.execute('DROP INDEX IF EXISTS product_name_trgm_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
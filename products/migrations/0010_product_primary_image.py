@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:06
+
+from urllib.parse import quote
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def direct_url(name):
+    # Та же схема, что и в ProductImage.get_direct_s3_url
+    base = getattr(settings, 'SELECTEL_DIRECT_STORAGE_URL', None)
+    if not name or not base:
+        return ''
+    if name.startswith('product_images/'):
+        name = name[len('product_images/'):]
+    return f"{base}/product_images/{quote(name)}"
+
+
+def fill_primary_images(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductImage = apps.get_model('products', 'ProductImage')
+    seen = set()
+    for image in ProductImage.objects.order_by('product_id', 'uploaded_at', 'id').iterator():
+        if image.product_id in seen:
+            continue
+        seen.add(image.product_id)
+        Product.objects.filter(pk=image.product_id).update(
+            primary_image=image,
+            primary_image_url=direct_url(image.image.name),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.productimage', verbose_name='Основное изображение'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image_url',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(fill_primary_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_productimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageAudit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Начата')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлена')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершена')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Всего изображений')),
+                ('last_image_id', models.PositiveBigIntegerField(default=0, verbose_name='Последнее проверенное изображение')),
+                ('checked', models.PositiveIntegerField(default=0, verbose_name='Проверено')),
+                ('missing', models.PositiveIntegerField(default=0, verbose_name='Недоступно')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Ошибки проверки')),
+            ],
+            options={
+                'verbose_name': 'Проверка изображений S3',
+                'verbose_name_plural': 'Проверки изображений S3',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageAuditIssue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(blank=True, default='', max_length=500)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='HTTP-статус')),
+                ('error', models.CharField(blank=True, default='', max_length=255, verbose_name='Ошибка')),
+                ('audit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='issues', to='products.imageaudit')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.productimage')),
+            ],
+            options={
+                'verbose_name': 'Проблема изображения',
+                'verbose_name_plural': 'Проблемы изображений',
+                'constraints': [models.UniqueConstraint(fields=('audit', 'image'), name='imageauditissue_audit_image_uniq')],
+            },
+        ),
+    ]
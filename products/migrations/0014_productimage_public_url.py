@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_public_urls(apps, schema_editor):
+    # URL строит хранилище поля (ProductImagesStorage.url), как и ProductImage.save()
+    ProductImage = apps.get_model('products', 'ProductImage')
+    batch = []
+    for image in ProductImage.objects.exclude(image='').only('id', 'image').iterator(chunk_size=BATCH_SIZE):
+        image.public_url = image.image.url
+        batch.append(image)
+        if len(batch) >= BATCH_SIZE:
+            ProductImage.objects.bulk_update(batch, ['public_url'])
+            batch = []
+    if batch:
+        ProductImage.objects.bulk_update(batch, ['public_url'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_image_audit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='public_url',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(fill_public_urls, migrations.RunPython.noop),
+    ]
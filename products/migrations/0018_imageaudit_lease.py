@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0017_product_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageaudit',
+            name='lease_token',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='imageaudit',
+            name='lease_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
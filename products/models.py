@@ -4,7 +4,10 @@ from django.db import models
 from accounts.models import User
 from django.db.models.signals import post_migrate
 from django.dispatch import receiver
+from django.utils import timezone
+from django.contrib.postgres.search import SearchVectorField
 from fruitsite.storage_backends import ProductImagesStorage
+from .images import FORMATS, derivative_url
 
 class Category(models.Model):
     name = models.CharField(max_length=255)
@@ -23,6 +26,7 @@ class Category(models.Model):
         help_text='Глобальные категории доступны всем пользователям'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменена')
 
     class Meta:
         verbose_name = 'Категория'
@@ -41,6 +45,9 @@ class Product(models.Model):
     )
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     name = models.CharField(max_length=255, verbose_name='Наименование продукции')
+    # Артикул продавца: ключ для импорта из таблиц; без артикула хранится NULL,
+    # поэтому уникальность по (master, sku) не мешает товарам без артикула
+    sku = models.CharField(max_length=64, null=True, blank=True, verbose_name='Артикул')
     description = models.TextField()
     
     # Новые поля для таблицы Excel
@@ -56,6 +63,45 @@ class Product(models.Model):
     stock = models.PositiveIntegerField(default=1)
     
     created_at = models.DateTimeField(auto_now_add=True)
+    # Меняется при каждом изменении товара, в том числе при списании остатка
+    # UPDATE-ом (cart.reservations); используется в ETag страницы товара
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
+
+    # Поисковый вектор (только PostgreSQL), обновляется в save(); GIN-индекс создаётся миграцией
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
+    # Основное изображение и его публичный URL, чтобы карточки каталога
+    # не запрашивали изображения для каждого товара; поддерживаются сигналами ProductImage
+    primary_image = models.ForeignKey(
+        'ProductImage',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Основное изображение'
+    )
+    primary_image_url = models.CharField(max_length=500, blank=True, default='', editable=False)
+
+    # Копия агрегатов отзывов (reviews.ProductRating) для карточек и сортировки
+    # каталога без AVG() по отзывам; обновляется вместе с каждым отзывом (reviews.ratings)
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False, verbose_name='Рейтинг')
+    rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Отзывов')
+
+    class Meta:
+        indexes = [
+            # Курсорная пагинация каталога и списка "Мои товары" по (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_cat_created_id_idx'),
+            models.Index(fields=['master', '-created_at', '-id'], name='product_master_created_id_idx'),
+            # Изменения каталога для синхронизации PWA (products.sync)
+            models.Index(fields=['updated_at'], name='product_updated_at_idx'),
+            # Сортировка каталога по рейтингу с курсорной пагинацией
+            models.Index(fields=['-rating_average', '-rating_count', '-id'], name='product_rating_idx'),
+            models.Index(fields=['category', '-rating_average', '-rating_count', '-id'], name='product_cat_rating_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['master', 'sku'], name='product_master_sku_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.master.username}"
@@ -71,80 +117,171 @@ class Product(models.Model):
             self.price = self.price_per_unit
         super().save(*args, **kwargs)
 
+        from .search import update_search_vector
+        update_search_vector(self)
+
+    def refresh_primary_image(self):
+        """
+        Назначает основным выбранное изображение товара (или первое загруженное,
+        если выбранного нет) и сохраняет его публичный URL.
+        """
+        image = None
+        if self.primary_image_id:
+            image = self.images.filter(pk=self.primary_image_id).first()
+        if image is None:
+            image = self.images.order_by('uploaded_at', 'id').first()
+        url = image.public_url if image else ''
+        Product.objects.filter(pk=self.pk).update(primary_image=image, primary_image_url=url, updated_at=timezone.now())
+        self.primary_image = image
+        self.primary_image_url = url
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='product_images/', storage=ProductImagesStorage())
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Перечень уменьшенных копий {'source': имя оригинала, 'widths': [...], 'formats': [...]},
+    # заполняется фоновым пулом из products.images
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    # Публичный URL оригинала, вычисляется один раз при сохранении (см. save())
+    public_url = models.CharField(max_length=500, blank=True, default='', editable=False)
 
     def __str__(self):
         return f"Image for {self.product.name}"
+
+    @property
+    def has_derivatives(self):
+        return bool(self.image) and self.derivatives.get('source') == self.image.name
+
+    def srcset_for(self, fmt):
+        """Значение srcset для копий в формате fmt или пустая строка, если копий нет"""
+        if not self.has_derivatives or fmt not in self.derivatives.get('formats', ()):
+            return ''
+        return ', '.join(
+            f'{derivative_url(self.image.name, width, fmt)} {width}w'
+            for width in self.derivatives['widths']
+        )
+
+    @property
+    def picture_sources(self):
+        """Пары (MIME-тип, srcset) для <source> в <picture>, от лучшего сжатия к худшему"""
+        sources = []
+        for fmt in ('avif', 'webp'):
+            srcset = self.srcset_for(fmt)
+            if srcset:
+                sources.append((FORMATS[fmt][1], srcset))
+        return sources
+
+    @property
+    def srcset(self):
+        """srcset для обычного <img>: WebP, а если его нет — JPEG"""
+        return self.srcset_for('webp') or self.srcset_for('jpeg')
+
+    @property
+    def jpeg_srcset(self):
+        return self.srcset_for('jpeg')
+
+    @property
+    def thumbnail_url(self):
+        """Самая маленькая копия (для мини-превью) или оригинал, пока копий нет"""
+        if self.has_derivatives:
+            formats = self.derivatives.get('formats', ())
+            fmt = 'webp' if 'webp' in formats else 'jpeg'
+            if fmt in formats:
+                return derivative_url(self.image.name, self.derivatives['widths'][0], fmt)
+        return self.public_url
         
+    def save(self, *args, **kwargs):
+        # Файл загружается до вычисления URL: окончательное имя выдаёт хранилище при загрузке
+        if self.image and not self.image._committed:
+            self.image.save(self.image.name, self.image.file, save=False)
+        self.public_url = self.image.url if self.image else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'image' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'public_url'}
+        super().save(*args, **kwargs)
+
     def get_s3_url(self):
         """
         Получить корректный URL для изображения из S3
         """
-        if not self.image:
-            return None
-            
-        url = self.image.url
-        
-        # Убедимся, что URL начинается с https://
-        if not url.startswith(('http://', 'https://')):
-            url = f"https://{url}"
-            
-        return url
+        return self.get_direct_s3_url()
 
     def get_direct_s3_url(self):
         """
-        Получить прямой URL к изображению в S3 Selectel без использования Django Storage
+        Публичный URL изображения в S3 Selectel: сохранённый при загрузке,
+        а для ещё не сохранённых строк — вычисленный хранилищем.
         """
-        from django.conf import settings
-        from urllib.parse import quote
-        import logging
-        
-        logger = logging.getLogger(__name__)
-        
+        if self.public_url:
+            return self.public_url
         if not self.image or not self.image.name:
-            logger.warning(f"Image for product {self.product_id} is None or has no name")
             return None
-            
-        # Используем прямой URL формата Selectel Storage
-        direct_storage_url = getattr(settings, 'SELECTEL_DIRECT_STORAGE_URL', None)
-        
-        # Если настроен прямой URL Selectel, используем его
-        if direct_storage_url:
-            try:
-                # Получаем имя файла
-                filename = self.image.name
-                
-                # Удаляем 'product_images/' если оно есть в имени файла
-                if filename.startswith('product_images/'):
-                    filename = filename[len('product_images/'):]
-                
-                # Кодируем имя файла для URL (обрабатываем спецсимволы)
-                encoded_filename = quote(filename)
-                
-                # Формируем прямой URL в формате Selectel
-                url = f"{direct_storage_url}/product_images/{encoded_filename}"
-                
-                logger.debug(f"Generated direct S3 URL: {url}")
-                return url
-            except Exception as e:
-                logger.error(f"Error generating direct S3 URL: {str(e)}")
-                # Если что-то пошло не так, пробуем стандартный метод
-                try:
-                    return self.image.url
-                except Exception as e2:
-                    logger.error(f"Error getting standard URL: {str(e2)}")
-                    return None
-        else:
-            # Запасной вариант - используем обычный URL
-            try:
-                return self.image.url
-            except Exception as e:
-                logger.error(f"Error getting image URL: {str(e)}")
-                return None
-                return None
+        return self.image.url
+
+class ProductTombstone(models.Model):
+    """
+    Запись об удалённом товаре: по ней офлайн-каталог PWA узнаёт
+    об удалении (products.sync). Старые записи удаляет команда
+    purge_product_tombstones.
+    """
+    product_id = models.BigIntegerField(verbose_name='Товар')
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Удалён')
+
+    class Meta:
+        verbose_name = 'Удалённый товар'
+        verbose_name_plural = 'Удалённые товары'
+
+    def __str__(self):
+        return f"Товар {self.product_id} удалён {self.deleted_at:%d.%m.%Y %H:%M}"
+
+
+class ImageAudit(models.Model):
+    """
+    Проверка доступности всех изображений товаров в S3 (products.image_audit).
+    Изображения проверяются по возрастанию id; last_image_id — контрольная
+    точка, с которой прерванная проверка продолжается. Выполняет проверку
+    один процесс — владелец аренды lease_token, пока не истёк lease_until.
+    """
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name='Начата')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлена')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершена')
+    total = models.PositiveIntegerField(default=0, verbose_name='Всего изображений')
+    last_image_id = models.PositiveBigIntegerField(default=0, verbose_name='Последнее проверенное изображение')
+    checked = models.PositiveIntegerField(default=0, verbose_name='Проверено')
+    missing = models.PositiveIntegerField(default=0, verbose_name='Недоступно')
+    failed = models.PositiveIntegerField(default=0, verbose_name='Ошибки проверки')
+    lease_token = models.CharField(max_length=32, blank=True, default='', editable=False)
+    lease_until = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        verbose_name = 'Проверка изображений S3'
+        verbose_name_plural = 'Проверки изображений S3'
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Проверка изображений от {self.started_at:%d.%m.%Y %H:%M}"
+
+    @property
+    def is_finished(self):
+        return self.finished_at is not None
+
+
+class ImageAuditIssue(models.Model):
+    """Недоступное изображение или ошибка проверки; доступные изображения не сохраняются"""
+    audit = models.ForeignKey(ImageAudit, on_delete=models.CASCADE, related_name='issues')
+    image = models.ForeignKey(ProductImage, on_delete=models.CASCADE, related_name='+')
+    url = models.CharField(max_length=500, blank=True, default='')
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='HTTP-статус')
+    error = models.CharField(max_length=255, blank=True, default='', verbose_name='Ошибка')
+
+    class Meta:
+        verbose_name = 'Проблема изображения'
+        verbose_name_plural = 'Проблемы изображений'
+        constraints = [
+            models.UniqueConstraint(fields=['audit', 'image'], name='imageauditissue_audit_image_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.url}: {self.status_code or self.error}"
 
 # Для добавления категорий по умолчанию (только администратором через команду manage.py)
 
@@ -0,0 +1,98 @@
+"""
+Кэш целых страниц каталога для анонимных посетителей.
+
+Для анонимного посетителя страница каталога зависит только от
+параметров запроса и содержимого каталога, поэтому готовый HTML
+хранится в общем кэше под ключом из имени страницы, версии каталога
+(products.caching.get_catalog_version) и используемых страницей
+параметров запроса. Пространство pages не кэшируется в памяти
+процесса (fruitsite.cache): LRU процесса ограничен числом записей, и
+тысяча страниц HTML заняла бы в каждом процессе десятки мегабайт.
+Любое сохранение или удаление товара, категории или изображения
+меняет версию, и следующие запросы рендерят страницу заново.
+
+Данные конкретного посетителя (CSRF-токен, счётчик корзины, сообщения)
+в закэшированную страницу не попадают: контекстный процессор
+products.context_processors.cached_page убирает CSRF-токен, а base.html
+загружает их отдельным запросом к page_fragment.
+
+Остатки на складе, списанные резервированием корзины или заказом
+(UPDATE без сигналов), версию не меняют, но меняют Product.updated_at,
+поэтому в ключ входит и время последнего изменения товаров
+(catalog_state): после изменения остатка страница рендерится заново.
+"""
+
+import hashlib
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import HttpResponse
+
+from .caching import get_catalog_version
+from .models import Product
+
+PAGE_TIMEOUT = 60
+
+CACHE_STATUS_HEADER = 'X-Page-Cache'
+
+
+def catalog_state(request):
+    """
+    Состояние каталога для ключей страниц и ETag: версия каталога и
+    MAX(updated_at) товаров (один запрос по индексу product_updated_at_idx).
+    Вычисляется один раз за запрос.
+    """
+    state = getattr(request, '_catalog_state', None)
+    if state is None:
+        last_modified = Product.objects.aggregate(last=Max('updated_at'))['last']
+        state = f"{get_catalog_version()}:{last_modified.isoformat() if last_modified else ''}"
+        request._catalog_state = state
+    return state
+
+
+def page_query(request, params):
+    """Нормализованная строка параметров params из запроса (пустые отбрасываются)"""
+    return urlencode([(param, request.GET[param]) for param in params if request.GET.get(param)])
+
+
+def page_cache_key(request, name, params):
+    """
+    Ключ страницы name для запроса или None, если страницу кэшировать нельзя.
+    В ключ входят только параметры params, остальные (метки рекламы и т. п.)
+    не плодят копии страницы.
+    """
+    if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+        return None
+    digest = hashlib.md5(f'{catalog_state(request)}:{page_query(request, params)}'.encode()).hexdigest()
+    return f'pages:{name}:{digest}'
+
+
+def cache_anonymous_page(name, params, timeout=PAGE_TIMEOUT):
+    """Декоратор представления: анонимные GET-запросы обслуживаются из кэша страниц"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = page_cache_key(request, name, params)
+            if key is None:
+                return view(request, *args, **kwargs)
+
+            cached = cache.get(key)
+            if cached is not None:
+                response = HttpResponse(cached['content'], content_type=cached['content_type'])
+                response[CACHE_STATUS_HEADER] = 'hit'
+                return response
+
+            request.cached_page = True
+            response = view(request, *args, **kwargs)
+            # Страницы с cookie ответа относятся к конкретному посетителю
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                cache.set(key, {'content': response.content, 'content_type': response['Content-Type']}, timeout)
+                response[CACHE_STATUS_HEADER] = 'miss'
+            return response
+
+        return wrapper
+
+    return decorator
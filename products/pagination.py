@@ -0,0 +1,215 @@
+"""
+Курсорная (keyset) пагинация для списков товаров.
+
+Вместо ``OFFSET`` страница выбирается условием по ключу сортировки
+(по умолчанию ``(created_at, id)``), поэтому время выборки не зависит от
+номера страницы, а вместо точного ``COUNT(*)`` показывается оценка
+количества строк.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+# Ниже этого порога точный COUNT(*) дешевле и полезнее оценки планировщика
+EXACT_COUNT_THRESHOLD = 10000
+
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'dec': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+        raise ValueError('Неизвестный тип значения курсора')
+    return value
+
+
+def encode_cursor(direction, values):
+    """Кодирует позицию в списке в строку для URL"""
+    raw = json.dumps({'d': direction, 'v': [_encode_value(v) for v in values]}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Декодирует курсор. Возвращает (direction, values)
+    или None, если курсор пустой или повреждён.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded))
+        direction = data['d']
+        values = [_decode_value(v) for v in data['v']]
+    except (binascii.Error, UnicodeDecodeError, ValueError, InvalidOperation, KeyError, TypeError):
+        return None
+    if direction not in ('next', 'prev') or len(values) != size:
+        return None
+    return direction, values
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества строк в queryset.
+
+    На PostgreSQL берётся оценка планировщика из EXPLAIN, что не требует
+    сканирования таблицы; для небольших выборок и других СУБД выполняется
+    обычный COUNT(*).
+    """
+    queryset = queryset.order_by()
+    if connection.vendor == 'postgresql':
+        try:
+            plan = json.loads(queryset.explain(format='json'))
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+        except (ValueError, KeyError, IndexError, TypeError):
+            estimate = None
+        if estimate is not None and estimate >= EXACT_COUNT_THRESHOLD:
+            return estimate
+    return queryset.count()
+
+
+def _reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+def _keyset_filter(ordering, values):
+    """
+    Условие "строго после позиции values" для заданной сортировки:
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+    """
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
+
+
+class KeysetPage:
+    """Страница результатов курсорной пагинации"""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return None
+        return encode_cursor('next', self.paginator.key_values(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return None
+        return encode_cursor('prev', self.paginator.key_values(self.object_list[0]))
+
+    @property
+    def estimated_total(self):
+        return self.paginator.estimated_total
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по ключу сортировки (по умолчанию (created_at, id) по убыванию).
+
+    Ожидает queryset с уже применёнными фильтрами; его собственная
+    сортировка будет заменена на ordering. Последним полем ordering должно
+    быть уникальное поле, чтобы ключ однозначно задавал позицию.
+    Для queryset.values() поля ordering должны входить в выборку.
+    """
+
+    def __init__(self, queryset, per_page, ordering=DEFAULT_ORDERING):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self._estimated_total = None
+
+    @property
+    def estimated_total(self):
+        if self._estimated_total is None:
+            self._estimated_total = estimate_count(self.queryset)
+        return self._estimated_total
+
+    def key_values(self, obj):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(obj, dict):
+            # Строки queryset.values()
+            return [obj[name] for name in names]
+        return [getattr(obj, name) for name in names]
+
+    def _rows_after(self, ordering, values):
+        first = ordering[0]
+        # Нестрогое условие по первому полю помогает планировщику
+        # использовать диапазонное сканирование индекса
+        lookup = 'lte' if first.startswith('-') else 'gte'
+        return (
+            self.queryset
+            .filter(**{f'{first.lstrip("-")}__{lookup}': values[0]})
+            .filter(_keyset_filter(ordering, values))
+            .order_by(*ordering)
+        )
+
+    def get_page(self, cursor=None):
+        position = decode_cursor(cursor, len(self.ordering))
+        if position is not None:
+            direction, values = position
+            ordering = self.ordering if direction == 'next' else _reverse_ordering(self.ordering)
+            try:
+                queryset = self._rows_after(ordering, values)
+            except (ValidationError, ValueError, TypeError):
+                # Значения подделанного курсора не подходят к полям сортировки
+                position = None
+
+        if position is None:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, False)
+
+        rows = list(queryset[:self.per_page + 1])
+        if direction == 'next':
+            return KeysetPage(rows[:self.per_page], self, len(rows) > self.per_page, True)
+
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return KeysetPage(rows, self, True, has_previous)
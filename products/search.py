@@ -0,0 +1,252 @@
+"""
+Полнотекстовый поиск по товарам.
+
+На PostgreSQL используется поле ``Product.search_vector`` (tsvector с
+русской морфологией) с GIN-индексом и триграммное сходство по названию
+для опечаток. На остальных СУБД используется инвертированный индекс
+в памяти процесса с упрощённым стеммингом и триграммами.
+
+Вес полей: название (A), категория и вид упаковки (B), описание (C).
+"""
+
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'russian'
+
+# Минимальное триграммное сходство, при котором слово считается опечаткой
+TRIGRAM_THRESHOLD = 0.3
+
+# Сколько лучших совпадений возвращает резервный индекс
+FALLBACK_RESULTS_LIMIT = 1000
+
+# Резервный индекс перестраивается не реже, чем раз в это число секунд,
+# даже если сигнал об изменении не дошёл до текущего процесса
+FALLBACK_INDEX_MAX_AGE = 300
+
+FIELD_WEIGHTS = {
+    'name': 1.0,
+    'category': 0.4,
+    'package_type': 0.4,
+    'description': 0.1,
+}
+
+
+def uses_postgres_search():
+    return connection.vendor == 'postgresql'
+
+
+# --- PostgreSQL ---------------------------------------------------------------
+
+def _search_vector_expression(category_name):
+    from django.contrib.postgres.search import SearchVector
+
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Value(category_name or ''), 'package_type', weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(product):
+    """Пересчитывает поисковый вектор одного товара (вызывается из Product.save)"""
+    if not uses_postgres_search():
+        return
+    from .models import Product
+
+    category_name = product.category.name if product.category_id else ''
+    Product.objects.filter(pk=product.pk).update(search_vector=_search_vector_expression(category_name))
+
+
+def refresh_search_vectors(queryset):
+    """
+    Пересчитывает поисковые векторы для набора товаров.
+    Выполняет по одному UPDATE на каждую категорию в выборке.
+    """
+    if not uses_postgres_search():
+        return
+    from .models import Category
+
+    category_ids = set(queryset.order_by().values_list('category_id', flat=True).distinct())
+    names = dict(Category.objects.filter(id__in=category_ids).values_list('id', 'name'))
+    for category_id in category_ids:
+        queryset.filter(category_id=category_id).update(
+            search_vector=_search_vector_expression(names.get(category_id, ''))
+        )
+
+
+def _postgres_search(queryset, query):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    rank = SearchRank(F('search_vector'), search_query) + TrigramSimilarity('name', query)
+    # Оператор % (trigram_similar) использует GIN-индекс по названию;
+    # порог задаётся pg_trgm.similarity_threshold (по умолчанию 0.3)
+    return (
+        queryset
+        .filter(Q(search_vector=search_query) | Q(name__trigram_similar=query))
+        # float8, чтобы значение без потерь проходило через курсор пагинации
+        .annotate(search_rank=Cast(rank, FloatField()))
+    )
+
+
+# --- Резервный индекс в памяти ------------------------------------------------
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Наиболее частые окончания русских слов, от длинных к коротким
+_RUSSIAN_SUFFIXES = sorted([
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ых', 'их',
+    'ией', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ую', 'юю',
+    'ов', 'ев', 'ей', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ию', 'ия', 'ье', 'ья',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+], key=len, reverse=True)
+
+
+def stem(token):
+    """Упрощённый стемминг: отбрасывает типичное окончание, оставляя основу от 3 букв"""
+    for suffix in _RUSSIAN_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def tokenize(text):
+    return [stem(token) for token in _TOKEN_RE.findall((text or '').lower().replace('ё', 'е'))]
+
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex:
+    """Инвертированный индекс: основа слова -> {id товара: вес}"""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.trigram_terms = defaultdict(set)
+
+    def add(self, product_id, fields):
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for term in tokenize(text):
+                postings = self.postings[term]
+                postings[product_id] = postings.get(product_id, 0.0) + weight
+
+    def finalize(self):
+        for term in self.postings:
+            for trigram in trigrams(term):
+                self.trigram_terms[trigram].add(term)
+
+    def _similar_terms(self, term):
+        """Термы словаря, похожие на term по триграммам (для опечаток)"""
+        term_trigrams = trigrams(term)
+        candidates = defaultdict(int)
+        for trigram in term_trigrams:
+            for candidate in self.trigram_terms.get(trigram, ()):
+                candidates[candidate] += 1
+        similar = []
+        for candidate, shared in candidates.items():
+            union = len(term_trigrams) + len(trigrams(candidate)) - shared
+            similarity = shared / union
+            if similarity >= TRIGRAM_THRESHOLD:
+                similar.append((candidate, similarity))
+        return similar
+
+    def search(self, query, limit=FALLBACK_RESULTS_LIMIT):
+        """Возвращает список (id товара, релевантность) по убыванию релевантности"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        scores = None
+        for term in terms:
+            term_scores = defaultdict(float)
+            matches = [(term, 1.0)] if term in self.postings else self._similar_terms(term)
+            for matched, similarity in matches:
+                for product_id, weight in self.postings[matched].items():
+                    term_scores[product_id] = max(term_scores[product_id], weight * similarity)
+            # Все слова запроса должны найтись (как AND в websearch)
+            if scores is None:
+                scores = dict(term_scores)
+            else:
+                scores = {pid: score + term_scores[pid] for pid, score in scores.items() if pid in term_scores}
+            if not scores:
+                return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[:limit]
+
+
+_fallback_lock = threading.Lock()
+_fallback_state = {'index': None, 'version': None, 'built_at': 0.0}
+
+
+def _build_fallback_index():
+    from .models import Product
+
+    index = InvertedIndex()
+    rows = Product.objects.values_list('id', 'name', 'description', 'package_type', 'category__name')
+    for product_id, name, description, package_type, category_name in rows.iterator(chunk_size=2000):
+        index.add(product_id, {
+            'name': name,
+            'description': description,
+            'package_type': package_type,
+            'category': category_name,
+        })
+    index.finalize()
+    return index
+
+
+def get_fallback_index():
+    """Индекс текущего процесса; перестраивается при смене версии каталога"""
+    from .caching import get_catalog_version
+
+    version = get_catalog_version()
+    state = _fallback_state
+    fresh = (
+        state['index'] is not None
+        and state['version'] == version
+        and time.monotonic() - state['built_at'] < FALLBACK_INDEX_MAX_AGE
+    )
+    if fresh:
+        return state['index']
+    with _fallback_lock:
+        if state['index'] is None or state['version'] != version or time.monotonic() - state['built_at'] >= FALLBACK_INDEX_MAX_AGE:
+            state['index'] = _build_fallback_index()
+            state['version'] = version
+            state['built_at'] = time.monotonic()
+        return state['index']
+
+
+def _fallback_search(queryset, query):
+    ranked = get_fallback_index().search(query)
+    if not ranked:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+    rank = Case(
+        *[When(id=product_id, then=Value(score)) for product_id, score in ranked],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return queryset.filter(id__in=[product_id for product_id, _ in ranked]).annotate(search_rank=rank)
+
+
+# --- Общий интерфейс ----------------------------------------------------------
+
+def search_products(queryset, query):
+    """
+    Фильтрует queryset товаров по поисковому запросу и добавляет
+    аннотацию search_rank (чем больше, тем релевантнее).
+    Сортировку задаёт вызывающий код, например ('-search_rank', '-created_at', '-id').
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    if uses_postgres_search():
+        return _postgres_search(queryset, query)
+    return _fallback_search(queryset, query)
@@ -0,0 +1,71 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import invalidate_catalog, invalidate_categories
+from .images import schedule_derivatives
+from .models import Category, Product, ProductImage, ProductTombstone
+from .search import refresh_search_vectors
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    # Офлайн-каталог PWA узнаёт об удалении по этой записи (products.sync)
+    ProductTombstone.objects.create(product_id=instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    # Название категории входит в поисковый вектор товаров
+    if not created:
+        refresh_search_vectors(Product.objects.filter(category=instance))
+    invalidate_categories()
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # После удаления у товаров будет category=NULL, запоминаем их заранее
+    instance._product_ids = list(Product.objects.filter(category=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    product_ids = getattr(instance, '_product_ids', None)
+    if product_ids:
+        # category=NULL проставлен без save(), отмечаем изменение товаров вручную
+        Product.objects.filter(id__in=product_ids).update(updated_at=timezone.now())
+        refresh_search_vectors(Product.objects.filter(id__in=product_ids))
+    invalidate_categories()
+
+
+@receiver(post_save, sender=ProductImage)
+def product_image_saved(sender, instance, created, **kwargs):
+    url = instance.public_url
+    if created:
+        # Первое загруженное изображение становится основным
+        Product.objects.filter(pk=instance.product_id, primary_image__isnull=True).update(
+            primary_image=instance, primary_image_url=url, updated_at=timezone.now()
+        )
+    else:
+        Product.objects.filter(pk=instance.product_id, primary_image=instance).update(
+            primary_image_url=url, updated_at=timezone.now()
+        )
+    # Уменьшенные копии создаются в фоне для нового или заменённого файла
+    if instance.image and not instance.has_derivatives:
+        schedule_derivatives(instance)
+    invalidate_catalog()
+
+
+@receiver(post_delete, sender=ProductImage)
+def product_image_deleted(sender, instance, **kwargs):
+    # Если удалено основное изображение (ссылка уже обнулена SET_NULL), выбираем следующее
+    product = Product.objects.filter(pk=instance.product_id, primary_image__isnull=True).first()
+    if product is not None:
+        product.refresh_primary_image()
+    invalidate_catalog()
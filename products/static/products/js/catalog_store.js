@@ -0,0 +1,120 @@
+// Офлайн-копия каталога в IndexedDB (серверная часть — products/sync.py).
+// Первый раз загружается снимок каталога, затем только изменения
+// с версии последней синхронизации.
+(function () {
+  const DB_NAME = 'osimifood-catalog';
+  const DB_VERSION = 1;
+  const SNAPSHOT_URL = '/products/api/sync/snapshot/';
+  const CHANGES_URL = '/products/api/sync/changes/';
+
+  let dbPromise = null;
+
+  function openDb() {
+    if (!dbPromise) {
+      dbPromise = new Promise((resolve, reject) => {
+        const request = indexedDB.open(DB_NAME, DB_VERSION);
+        request.onupgradeneeded = () => {
+          const db = request.result;
+          db.createObjectStore('products', {keyPath: 'id'});
+          db.createObjectStore('categories', {keyPath: 'id'});
+          db.createObjectStore('meta');
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+      });
+    }
+    return dbPromise;
+  }
+
+  function done(tx) {
+    return new Promise((resolve, reject) => {
+      tx.oncomplete = () => resolve();
+      tx.onerror = tx.onabort = () => reject(tx.error);
+    });
+  }
+
+  function result(request) {
+    return new Promise((resolve, reject) => {
+      request.onsuccess = () => resolve(request.result);
+      request.onerror = () => reject(request.error);
+    });
+  }
+
+  async function getMeta(key) {
+    const db = await openDb();
+    return result(db.transaction('meta').objectStore('meta').get(key));
+  }
+
+  // Применяет снимок (replace) или изменения одной транзакцией
+  async function apply(data, replace) {
+    const db = await openDb();
+    const tx = db.transaction(['products', 'categories', 'meta'], 'readwrite');
+    const products = tx.objectStore('products');
+    const categories = tx.objectStore('categories');
+    if (replace) {
+      products.clear();
+    }
+    categories.clear();
+    data.categories.forEach(category => categories.put(category));
+    data.products.forEach(product => products.put(product));
+    (data.deleted || []).forEach(id => products.delete(id));
+    tx.objectStore('meta').put(data.version, 'version');
+    tx.objectStore('meta').put(Date.now(), 'synced_at');
+    return done(tx);
+  }
+
+  async function fetchJson(url) {
+    const response = await fetch(url, {credentials: 'same-origin'});
+    if (!response.ok) {
+      throw new Error(`${url}: HTTP ${response.status}`);
+    }
+    return response.json();
+  }
+
+  // Синхронизирует копию; при minInterval (мс) не чаще, чем раз в этот интервал
+  async function sync(minInterval = 0) {
+    const syncedAt = await getMeta('synced_at');
+    if (minInterval && syncedAt && Date.now() - syncedAt < minInterval) {
+      return false;
+    }
+    const version = await getMeta('version');
+    if (version) {
+      const changes = await fetchJson(`${CHANGES_URL}?since=${encodeURIComponent(version)}`);
+      if (!changes.reset) {
+        await apply(changes, false);
+        return true;
+      }
+    }
+    await apply(await fetchJson(SNAPSHOT_URL), true);
+    return true;
+  }
+
+  // Товары из копии с фильтрами как у таблицы товаров, новые первыми
+  async function query({search = '', category = ''} = {}) {
+    const db = await openDb();
+    const tx = db.transaction(['products', 'categories']);
+    const [products, categories] = await Promise.all([
+      result(tx.objectStore('products').getAll()),
+      result(tx.objectStore('categories').getAll()),
+    ]);
+    const categoryNames = new Map(categories.map(item => [item.id, item.name]));
+    const words = search.toLowerCase().split(/\s+/).filter(Boolean);
+
+    const rows = products
+      .map(product => ({...product, category_name: categoryNames.get(product.category_id) || ''}))
+      .filter(product => !category || String(product.category_id) === String(category))
+      .filter(product => {
+        const text = `${product.name} ${product.category_name} ${product.package_type}`.toLowerCase();
+        return words.every(word => text.includes(word));
+      });
+    rows.sort((a, b) => (a.created_at < b.created_at ? 1 : a.created_at > b.created_at ? -1 : b.id - a.id));
+    categories.sort((a, b) => a.name.localeCompare(b.name));
+    return {products: rows, categories};
+  }
+
+  window.OsimiCatalog = {
+    sync,
+    query,
+    syncedAt: () => getMeta('synced_at'),
+  };
+})();
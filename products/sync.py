@@ -0,0 +1,106 @@
+"""
+Синхронизация офлайн-каталога PWA.
+
+Клиент один раз загружает снимок каталога (get_snapshot), а затем
+запрашивает только изменения с версии предыдущего ответа
+(get_changes): товары с более поздним Product.updated_at (он
+обновляется и при списании остатка UPDATE-ом) и id удалённых товаров
+из ProductTombstone.
+
+Версия — время сервера перед выборкой. Транзакция, начатая раньше,
+может зафиксировать изменение с меньшим updated_at уже после ответа,
+поэтому изменения выбираются с запасом SYNC_OVERLAP, а клиент
+применяет их идемпотентно (замена записи по id). Записи об удалении
+хранятся TOMBSTONE_RETENTION; клиенту с более старой версией
+возвращается reset, и он загружает снимок заново.
+"""
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .caching import SNAPSHOT_TIMEOUT, get_catalog_version, get_categories
+from .models import Product, ProductTombstone
+
+SYNC_OVERLAP = timedelta(minutes=1)
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+# Поля товара в офлайн-каталоге: то, что показывает таблица товаров
+SYNC_COLUMNS = (
+    'id', 'name', 'category_id', 'volume', 'package_type', 'quantity_in_package',
+    'price', 'price_per_unit', 'price_per_package', 'stock', 'created_at',
+)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_version(moment):
+    """Версия для клиента: микросекунды с начала эпохи в виде строки"""
+    return str((moment - _EPOCH) // timedelta(microseconds=1))
+
+
+def decode_version(version):
+    """Момент времени из версии клиента или None, если версия повреждена"""
+    if not version or not version.isdigit():
+        return None
+    try:
+        return _EPOCH + timedelta(microseconds=int(version))
+    except OverflowError:
+        return None
+
+
+def _product_rows(queryset):
+    return list(queryset.values(*SYNC_COLUMNS))
+
+
+def _category_rows():
+    return [{'id': category.id, 'name': category.name} for category in get_categories()]
+
+
+def build_snapshot():
+    version = timezone.now()
+    return {
+        'version': encode_version(version),
+        'products': _product_rows(Product.objects.order_by('-created_at', '-id')),
+        'categories': _category_rows(),
+    }
+
+
+def get_snapshot():
+    """
+    Снимок каталога из общего кэша (пересобирается при смене версии каталога).
+    Версия внутри снимка — время его сборки, поэтому изменения остатков,
+    не меняющие версию каталога, клиент получит следующим запросом изменений.
+    """
+    key = f'products:sync_snapshot:{get_catalog_version()}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build_snapshot()
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def get_changes(since):
+    """Изменения после момента since: {'version', 'products', 'deleted', 'categories'} или {'reset': True}"""
+    now = timezone.now()
+    if since < now - TOMBSTONE_RETENTION or since > now + SYNC_OVERLAP:
+        return {'reset': True}
+    start = since - SYNC_OVERLAP
+    return {
+        'version': encode_version(now),
+        'products': _product_rows(Product.objects.filter(updated_at__gte=start)),
+        'deleted': list(
+            ProductTombstone.objects.filter(deleted_at__gte=start)
+            .values_list('product_id', flat=True)
+            .distinct()
+        ),
+        'categories': _category_rows(),
+    }
+
+
+def purge_tombstones(now=None):
+    """Удаляет записи об удалении старше TOMBSTONE_RETENTION; возвращает их количество"""
+    now = now or timezone.now()
+    deleted, _ = ProductTombstone.objects.filter(deleted_at__lt=now - TOMBSTONE_RETENTION).delete()
+    return deleted
@@ -1,3 +1,795 @@
-from django.test import TestCase
+import importlib
+import io
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from PIL import Image
+
+from accounts.models import User
+from cart.models import CartItem
+from cart.reservations import reserve
+from fruitsite.local_s3 import LocalS3Server
+from fruitsite.s3 import commit_files
+from fruitsite.storage_backends import ProductImageDerivativesStorage, ProductImagesStorage
+from . import images, search
+from .image_audit import AuditInProgress, claim_audit, run_audit, start_audit, start_in_background, unfinished_audit
+from .caching import get_categories, get_categories_with_products
+from .models import Category, ImageAudit, Product, ProductImage
+from .pagination import KeysetPaginator, encode_cursor, estimate_count
+from .sync import TOMBSTONE_RETENTION, encode_version, purge_tombstones
+
+
+class CatalogQueryCountTests(TestCase):
+    """Число запросов каталога не должно зависеть от количества товаров и изображений"""
+
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.client.force_login(self.buyer)
+
+    def create_products(self, count, images_per_product=2):
+        products = []
+        for i in range(count):
+            product = Product.objects.create(master=self.master, name=f'Товар {i}', description='', price=1)
+            for j in range(images_per_product):
+                ProductImage.objects.create(product=product, image=f'product_images/{product.pk}_{j}.jpg')
+            products.append(product)
+        return products
+
+    def test_primary_image_is_first_upload(self):
+        product = self.create_products(1)[0]
+        product.refresh_from_db()
+        first = product.images.order_by('uploaded_at', 'id').first()
+        self.assertEqual(product.primary_image_id, first.pk)
+        self.assertTrue(product.primary_image_url.endswith(f'/product_images/{product.pk}_0.jpg'))
+
+    def test_primary_image_moves_to_next_on_delete(self):
+        product = self.create_products(1)[0]
+        product.refresh_from_db()
+        product.primary_image.delete()
+        product.refresh_from_db()
+        self.assertTrue(product.primary_image_url.endswith(f'/product_images/{product.pk}_1.jpg'))
+
+    def test_public_url_is_stored_and_backfilled(self):
+        product = self.create_products(1, images_per_product=1)[0]
+        image = product.images.get()
+        self.assertTrue(image.public_url.endswith(f'/product_images/{product.pk}_0.jpg'))
+        # Шаблоны читают сохранённый URL и не обращаются к хранилищу
+        with mock.patch.object(ProductImagesStorage, 'url', side_effect=AssertionError('url() вызван')):
+            response = self.client.get(reverse('products:product_detail', args=[product.pk]))
+        self.assertContains(response, image.public_url)
+
+        ProductImage.objects.update(public_url='')
+        migration = importlib.import_module('products.migrations.0014_productimage_public_url')
+        migration.fill_public_urls(apps, None)
+        image.refresh_from_db()
+        self.assertTrue(image.public_url.endswith(f'/product_images/{product.pk}_0.jpg'))
+
+    def test_product_list_query_count_is_constant(self):
+        self.create_products(2)
+        self.client.get(reverse('products:product_list'))  # прогрев кэша категорий и корзины
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('products:product_list'))
+        self.assertContains(response, '_0.jpg', count=2)
+
+        self.create_products(20)
+        self.client.get(reverse('products:product_list'))
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('products:product_list'))
+        self.assertContains(response, '_0.jpg', count=22)
+
+    def test_product_detail_query_count_is_constant(self):
+        few = self.create_products(1, images_per_product=1)[0]
+        many = self.create_products(1, images_per_product=5)[0]
+        self.client.get(reverse('products:product_detail', args=[few.pk]))
+        # Один из запросов — выборка updated_at для ETag (products.conditional),
+        # ещё два — страница отзывов и отзыв самого покупателя
+        with self.assertNumQueries(7):
+            self.client.get(reverse('products:product_detail', args=[few.pk]))
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('products:product_detail', args=[many.pk]))
+        self.assertContains(response, 'class="mini-thumb"', count=5)
+
+
+class CatalogImportExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.category = Category.objects.create(name='Фрукты', created_by=self.master)
+        self.client.force_login(self.master)
+
+    def upload(self, name, content):
+        return self.client.post(reverse('products:product_import'), {'file': SimpleUploadedFile(name, content)})
+
+    def test_csv_import_upserts_by_sku_and_reports_errors(self):
+        Product.objects.create(master=self.master, sku='A-1', name='Старое', description='-', price=1)
+        content = (
+            'Артикул;Наименование продукции;Категория;Описание;Цена за единицу;Количество в упаковке\n'
+            'A-1;Яблоки;Фрукты;Сладкие;12.50;10\n'
+            'A-2;Груши;фрукты;Сочные;20;5\n'
+            'A-3;Сливы;Овощи;-;5;1\n'
+            'A-4;Вишня;;-;-3;1\n'
+            'A-2;Повтор;;-;1;1\n'
+        ).encode()
+        report = self.upload('products.csv', content).context['report']
+        self.assertEqual((report.created, report.updated, report.error_count), (1, 1, 3))
+        self.assertEqual([row for row, _ in report.errors], [4, 5, 6])
+        self.assertEqual(report.errors[0][1], 'Категория: Категория «Овощи» не найдена среди ваших категорий')
+
+        apples = Product.objects.get(master=self.master, sku='A-1')
+        self.assertEqual(apples.name, 'Яблоки')
+        self.assertEqual(apples.category, self.category)
+        self.assertEqual(apples.price, Decimal('12.50'))
+        # Цена за упаковку рассчитывается по правилам ProductForm
+        pears = Product.objects.get(master=self.master, sku='A-2')
+        self.assertEqual(pears.price_per_package, Decimal('100.00'))
+
+    def test_export_round_trip(self):
+        Product.objects.create(master=self.master, sku='B-1', name='Бананы', description='-', price=3,
+                               price_per_unit=3, category=self.category)
+        response = self.client.get(reverse('products:product_export'), {'format': 'xlsx'})
+        exported = b''.join(response.streaming_content)
+        self.assertEqual(load_workbook(io.BytesIO(exported)).active['B2'].value, 'Бананы')
+
+        report = self.upload('products.xlsx', exported).context['report']
+        self.assertEqual((report.created, report.updated, report.error_count), (0, 1, 0))
+
+        response = self.client.get(reverse('products:product_export'), {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertTrue(lines[1].startswith('B-1;Бананы;Фрукты;'))
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.product = Product.objects.create(master=self.master, name='Товар', description='', price=1)
+        # Вместо S3 оригиналы и копии хранятся в памяти
+        self.storage = InMemoryStorage(base_url='/media/')
+        patchers = [
+            mock.patch.object(ProductImage._meta.get_field('image'), 'storage', self.storage),
+            mock.patch.object(images, '_storage', self.storage),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def photo(self, width=1200, height=800):
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), 'orange').save(buffer, format='JPEG')
+        return ContentFile(buffer.getvalue(), name='photo.jpg')
+
+    def test_render_derivatives_widths(self):
+        widths, results = images.render_derivatives(self.photo().read(), formats=['webp', 'jpeg'])
+        self.assertEqual(widths, [160, 320, 640, 1024])
+        self.assertEqual(len(results), 8)
+        for width, fmt, content in results:
+            with Image.open(io.BytesIO(content)) as rendered:
+                self.assertEqual(rendered.width, width)
+                self.assertEqual(rendered.format, fmt.upper())
+
+        # Маленький оригинал не увеличивается
+        widths, _ = images.render_derivatives(self.photo(100, 80).read(), formats=['jpeg'])
+        self.assertEqual(widths, [100])
+
+    def test_generate_derivatives_and_srcset(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            image = ProductImage.objects.create(product=self.product, image=self.photo())
+        # Копии создаются в фоновом пуле после фиксации транзакции
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(image.srcset, '')
+        self.assertEqual(image.thumbnail_url, image.get_direct_s3_url())
+
+        manifest = images.generate_derivatives(image)
+        self.assertEqual(manifest['widths'], [160, 320, 640, 1024])
+        self.assertIn('jpeg', manifest['formats'])
+        for fmt in manifest['formats']:
+            for width in manifest['widths']:
+                self.assertTrue(self.storage.exists(images.derivative_name(image.image.name, width, fmt)))
+
+        image.refresh_from_db()
+        self.assertTrue(image.has_derivatives)
+        self.assertEqual(image.jpeg_srcset.count('w, '), 3)
+        self.assertTrue(image.thumbnail_url.endswith('_160w.webp'))
+
+        # Повторное сохранение без замены файла не ставит новую задачу
+        with self.captureOnCommitCallbacks() as callbacks:
+            image.save()
+        self.assertEqual(len(callbacks), 0)
+
+        response = self.client.get(reverse('products:product_list'))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, '_1024w.jpg 1024w')
+
+
+class PooledS3StorageTests(TestCase):
+    def setUp(self):
+        self.server = LocalS3Server()
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        overrides = override_settings(
+            AWS_S3_ENDPOINT_URL=self.server.url, AWS_S3_USE_SSL=False,
+            S3_MULTIPART_THRESHOLD=5 * 1024 * 1024, S3_MULTIPART_CHUNKSIZE=5 * 1024 * 1024,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.storage = ProductImagesStorage()
+        patcher = mock.patch.object(ProductImage._meta.get_field('image'), 'storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_images_are_uploaded_concurrently_once(self):
+        master = User.objects.create_user(username='master', role='master')
+        product = Product.objects.create(master=master, name='Товар', description='', price=1)
+        images = [
+            ProductImage(product=product, image=ContentFile(b'image %d' % i, name=f'photo_{i}.jpg'))
+            for i in range(5)
+        ]
+        commit_files(image.image for image in images)
+        self.assertEqual(len(self.server.objects), 5)
+        for image in images:
+            image.save()
+        # Файлы уже загружены и при сохранении строк повторно не отправляются
+        self.assertEqual(len(self.server.objects), 5)
+        self.assertEqual(self.storage.open(images[3].image.name).read(), b'image 3')
+
+    def test_names_are_unique_without_existence_checks(self):
+        with mock.patch.object(self.storage, 'exists', side_effect=AssertionError('exists() вызван')):
+            first = self.storage.save('photo.jpg', ContentFile(b'first'))
+            second = self.storage.save('photo.jpg', ContentFile(b'second'))
+        self.assertNotEqual(first, second)
+        self.assertRegex(first, r'^\d{8}_[0-9a-f]{8}\.jpg$')
+        self.assertEqual(self.storage.open(second).read(), b'second')
+        # Уменьшенные копии сохраняются под исходным именем и перезаписываются
+        derivatives = ProductImageDerivativesStorage()
+        self.assertEqual(derivatives.save('1_thumb.webp', ContentFile(b'old')), '1_thumb.webp')
+        self.assertEqual(derivatives.save('1_thumb.webp', ContentFile(b'new')), '1_thumb.webp')
+        self.assertEqual(derivatives.open('1_thumb.webp').read(), b'new')
+
+    def test_large_file_uses_multipart_upload(self):
+        name = self.storage.save('large.jpg', ContentFile(b'x' * (12 * 1024 * 1024)))
+        self.assertEqual(self.server.multipart_uploads, 1)
+        self.assertEqual(self.storage.size(name), 12 * 1024 * 1024)
+
+
+class ImageAuditTests(TestCase):
+    def setUp(self):
+        self.server = LocalS3Server()
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        overrides = override_settings(SELECTEL_DIRECT_STORAGE_URL=self.server.url)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        master = User.objects.create_user(username='master', role='master')
+        product = Product.objects.create(master=master, name='Товар', description='', price=1)
+        self.images = [ProductImage.objects.create(product=product, image=f'{i}.jpg') for i in range(25)]
+        # Прямой URL имеет вид <SELECTEL_DIRECT_STORAGE_URL>/product_images/<имя>; каждого пятого файла нет
+        for i, image in enumerate(self.images):
+            if i % 5:
+                self.server.objects[('product_images', image.image.name)] = b'image'
+
+    def test_audit_resumes_after_interruption(self):
+        audit = start_audit()
+
+        def interrupt(audit):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            run_audit(audit, workers=4, batch_size=10, progress=interrupt)
+        audit = unfinished_audit()
+        self.assertEqual((audit.checked, audit.last_image_id), (10, self.images[9].pk))
+
+        audit = run_audit(audit, workers=4, batch_size=10)
+        self.assertTrue(audit.is_finished)
+        self.assertEqual((audit.total, audit.checked, audit.missing, audit.failed), (25, 25, 5, 0))
+        self.assertEqual(
+            sorted(audit.issues.values_list('image_id', flat=True)),
+            [image.pk for image in self.images[::5]],
+        )
+        self.assertEqual(set(audit.issues.values_list('status_code', flat=True)), {404})
+
+    def test_only_lease_holder_runs_audit(self):
+        audit = start_audit()
+        self.assertIsNotNone(claim_audit(audit))
+        # Другой воркер видит ту же незавершённую проверку, но аренда уже занята
+        self.assertEqual(start_in_background(), (audit, False))
+        with self.assertRaises(AuditInProgress):
+            run_audit(audit, workers=4)
+        audit.refresh_from_db()
+        self.assertEqual(audit.checked, 0)
+
+        # Аренда процесса, остановившегося без её освобождения, истекает
+        ImageAudit.objects.filter(pk=audit.pk).update(lease_until=timezone.now() - timedelta(seconds=1))
+        audit = run_audit(audit, workers=4)
+        self.assertEqual((audit.checked, audit.missing), (25, 5))
+
+    def test_image_deleted_during_audit(self):
+        rows = list(ProductImage.objects.order_by('pk').values_list('pk', 'public_url'))
+        # Файла первого изображения нет, оно попало бы в проблемы
+        self.images[0].delete()
+        with mock.patch('products.image_audit._image_batches', return_value=iter([rows])):
+            audit = run_audit(start_audit(), workers=4)
+        self.assertTrue(audit.is_finished)
+        self.assertEqual((audit.checked, audit.missing), (25, 4))
+        self.assertNotIn(self.images[0].pk, audit.issues.values_list('image_id', flat=True))
+
+    def test_status_endpoint_reads_stored_results(self):
+        run_audit(start_audit(), workers=4)
+        staff = User.objects.create_user(username='admin', is_staff=True)
+        self.client.force_login(staff)
+        with self.assertNumQueries(4):
+            data = self.client.get(reverse('products:check_s3_images'), {'format': 'json'}).json()
+        self.assertEqual(data['audit']['missing'], 5)
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(ImageAudit.objects.count(), 1)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.category = Category.objects.create(name='Фрукты')
+        # Одинаковые created_at и цены: позицию в списке задаёт только id
+        created_at = timezone.now()
+        for i in range(7):
+            Product.objects.create(
+                master=self.master, name=f'Товар {i}', description='', price=i % 2,
+                category=self.category if i % 2 else None,
+            )
+        Product.objects.update(created_at=created_at)
+        self.ids = list(Product.objects.order_by('-id').values_list('id', flat=True))
+
+    def walk(self, paginator):
+        """Проходит список вперёд, затем назад; возвращает id страниц"""
+        forward, backward = [], []
+        page = paginator.get_page()
+        self.assertFalse(page.has_previous())
+        forward.append([p.pk for p in page])
+        while page.next_cursor:
+            page = paginator.get_page(page.next_cursor)
+            forward.append([p.pk for p in page])
+        self.assertFalse(page.has_next())
+        backward.append([p.pk for p in page])
+        while page.previous_cursor:
+            page = paginator.get_page(page.previous_cursor)
+            backward.append([p.pk for p in page])
+        return forward, backward[::-1]
+
+    def test_pages_with_ties_on_sort_key(self):
+        forward, backward = self.walk(KeysetPaginator(Product.objects.all(), 3))
+        self.assertEqual(forward, [self.ids[:3], self.ids[3:6], self.ids[6:]])
+        self.assertEqual(backward, forward)
+
+        forward, _ = self.walk(KeysetPaginator(Product.objects.all(), 2, ordering=('-price', '-id')))
+        expected = sorted(self.ids, key=lambda pk: (-Product.objects.get(pk=pk).price, -pk))
+        self.assertEqual(sum(forward, []), expected)
+
+    def test_filters_are_kept_across_pages(self):
+        products = Product.objects.filter(category=self.category)
+        forward, _ = self.walk(KeysetPaginator(products, 2))
+        self.assertEqual(sum(forward, []), list(products.order_by('-id').values_list('id', flat=True)))
+
+        # Ссылки на соседние страницы таблицы сохраняют фильтры
+        response = self.client.get(reverse('products:product_table'), {'category': self.category.pk, 'sort': 'rating'})
+        self.assertEqual(len(response.context['products']), 3)
+        self.assertEqual(response.context['filter_query'], f'category={self.category.pk}&sort=rating')
+
+    def test_tampered_cursor_returns_first_page(self):
+        paginator = KeysetPaginator(Product.objects.all(), 3)
+        first = [p.pk for p in paginator.get_page()]
+        for cursor in ('не base64', 'e30', encode_cursor('up', [1, 2]), encode_cursor('next', [1]),
+                       encode_cursor('next', ['junk', 'x']), encode_cursor('prev', [None, 1]),
+                       encode_cursor('next', [{'tz': 1}, 1])):
+            page = paginator.get_page(cursor)
+            self.assertEqual([p.pk for p in page], first, cursor)
+            self.assertFalse(page.has_previous())
+        self.assertEqual(self.client.get(reverse('products:product_table'), {'cursor': encode_cursor('next', ['junk', 'x'])}).status_code, 200)
+
+    def test_estimate_count(self):
+        products = Product.objects.all()
+        self.assertEqual(estimate_count(products), 7)
+        plan = lambda rows: f'[{{"Plan": {{"Plan Rows": {rows}}}}}]'
+        with mock.patch('products.pagination.connection') as connection:
+            connection.vendor = 'postgresql'
+            # Большая оценка планировщика берётся как есть, маленькая уточняется COUNT(*)
+            with mock.patch.object(type(products), 'explain', return_value=plan(50000)):
+                self.assertEqual(estimate_count(products), 50000)
+            with mock.patch.object(type(products), 'explain', return_value=plan(5)):
+                self.assertEqual(estimate_count(products), 7)
+            with mock.patch.object(type(products), 'explain', return_value='[]'):
+                self.assertEqual(estimate_count(products), 7)
+
+
+class FallbackSearchTests(TestCase):
+    """Поиск без PostgreSQL: инвертированный индекс в памяти процесса"""
+
+    def setUp(self):
+        cache.clear()
+        search._fallback_state.update(index=None, version=None, built_at=0.0)
+        self.master = User.objects.create_user(username='master', role='master')
+        self.category = Category.objects.create(name='Ягоды')
+        self.apples = Product.objects.create(
+            master=self.master, name='Красные яблоки', description='Сладкие', price=1, package_type='ящик'
+        )
+        self.pears = Product.objects.create(
+            master=self.master, name='Груши', description='Хороши с яблоком', price=1
+        )
+        self.berries = Product.objects.create(
+            master=self.master, name='Клубника', description='', price=1, category=self.category
+        )
+
+    def search(self, query):
+        products = search.search_products(Product.objects.all(), query)
+        return list(products.order_by('-search_rank', '-id').values_list('name', flat=True))
+
+    def test_uses_fallback_outside_postgres(self):
+        self.assertFalse(search.uses_postgres_search())
+        with mock.patch.object(search, 'uses_postgres_search', return_value=True), \
+                mock.patch.object(search, '_postgres_search', return_value='pg') as postgres_search:
+            self.assertEqual(search.search_products(Product.objects.all(), 'яблоки'), 'pg')
+        postgres_search.assert_called_once()
+        # Пустой запрос не фильтрует выборку
+        self.assertEqual(search.search_products(Product.objects.all(), '  ').count(), 3)
+
+    def test_stemmer(self):
+        self.assertEqual(search.stem('яблоки'), search.stem('яблоком'))
+        self.assertEqual(search.tokenize('Зелёные ЯБЛОКИ'), ['зелен', 'яблок'])
+        # Основа короче трёх букв не обрезается
+        self.assertEqual(search.stem('лук'), 'лук')
+
+    def test_word_forms_and_field_weights(self):
+        # Совпадение в названии весит больше, чем в описании
+        self.assertEqual(self.search('яблоко'), ['Красные яблоки', 'Груши'])
+        self.assertEqual(self.search('ягоды'), ['Клубника'])
+        self.assertEqual(self.search('ящик'), ['Красные яблоки'])
+        # Все слова запроса должны найтись
+        self.assertEqual(self.search('красные яблоки'), ['Красные яблоки'])
+        self.assertEqual(self.search('красные груши'), [])
+
+    def test_typo_matches_by_trigrams(self):
+        self.assertEqual(self.search('яблко'), ['Красные яблоки', 'Груши'])
+        self.assertEqual(self.search('клубнеке'), ['Клубника'])
+        self.assertEqual(self.search('ананас'), [])
+
+    def test_results_are_capped(self):
+        index = search.InvertedIndex()
+        for product_id in range(1, search.FALLBACK_RESULTS_LIMIT + 11):
+            index.add(product_id, {'name': 'яблоко', 'description': 'яблоко' if product_id == 5 else ''})
+        index.finalize()
+        ranked = index.search('яблоко')
+        self.assertEqual(len(ranked), search.FALLBACK_RESULTS_LIMIT)
+        self.assertEqual(ranked[0][0], 5)
+
+    def test_index_is_rebuilt_on_catalog_change(self):
+        index = search.get_fallback_index()
+        self.assertIs(search.get_fallback_index(), index)
+        self.assertEqual(self.search('слива'), [])
+
+        Product.objects.create(master=self.master, name='Слива', description='', price=1)
+        self.assertIsNot(search.get_fallback_index(), index)
+        self.assertEqual(self.search('слива'), ['Слива'])
+
+        # Без сигнала индекс перестраивается по возрасту
+        index = search.get_fallback_index()
+        search._fallback_state['built_at'] -= search.FALLBACK_INDEX_MAX_AGE
+        self.assertIsNot(search.get_fallback_index(), index)
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.fruits = Category.objects.create(name='Фрукты')
+        self.berries = Category.objects.create(name='Ягоды')
+        self.product = Product.objects.create(master=self.master, name='Яблоко', description='', price=1, category=self.fruits)
+
+    def names(self, categories):
+        return sorted(category.name for category in categories)
+
+    def test_snapshots_are_served_from_cache(self):
+        self.assertEqual(self.names(get_categories()), ['Фрукты', 'Ягоды'])
+        self.assertEqual(self.names(get_categories_with_products()), ['Фрукты'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(get_categories()), ['Фрукты', 'Ягоды'])
+            self.assertEqual(self.names(get_categories_with_products()), ['Фрукты'])
+        # Другой процесс с пустым кэшем в памяти читает снимок из общего кэша
+        cache.clear_local()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(get_categories()), ['Фрукты', 'Ягоды'])
+
+    def test_category_changes_invalidate_snapshots(self):
+        get_categories(), get_categories_with_products()
+        self.berries.name = 'Лесные ягоды'
+        self.berries.save()
+        self.assertEqual(self.names(get_categories()), ['Лесные ягоды', 'Фрукты'])
+
+        self.fruits.name = 'Сады'
+        self.fruits.save()
+        self.assertEqual(self.names(get_categories_with_products()), ['Сады'])
+
+        self.fruits.delete()
+        self.assertEqual(self.names(get_categories()), ['Лесные ягоды'])
+        self.assertEqual(get_categories_with_products(), [])
+
+    def test_product_changes_invalidate_snapshots(self):
+        self.assertEqual(self.names(get_categories_with_products()), ['Фрукты'])
+        berry = Product.objects.create(master=self.master, name='Малина', description='', price=1, category=self.berries)
+        self.assertEqual(self.names(get_categories_with_products()), ['Фрукты', 'Ягоды'])
+
+        self.product.category = None
+        self.product.save()
+        self.assertEqual(self.names(get_categories_with_products()), ['Ягоды'])
+
+        berry.delete()
+        self.assertEqual(get_categories_with_products(), [])
+
+
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cache.reset_stats()
+        self.shared = caches['shared']
+
+    def test_local_tier_serves_repeated_reads(self):
+        cache.set('products:test', [1, 2])
+        cache.clear_local()
+        self.assertEqual(cache.get('products:test'), [1, 2])
+        self.assertEqual(cache.get('products:test'), [1, 2])
+        self.assertEqual(cache.get('products:absent'), None)
+        stats = cache.stats()['products']
+        self.assertEqual((stats['local_hits'], stats['shared_hits'], stats['misses']), (1, 1, 1))
+
+    def test_other_process_writes(self):
+        cache.set('products:value', 1)
+        # Запись другого процесса видна после истечения копии в памяти процесса
+        self.shared.set('products:value', 2)
+        self.assertEqual(cache.get('products:value'), 1)
+        cache.clear_local()
+        self.assertEqual(cache.get('products:value'), 2)
+        # Пространство cart не кэшируется в процессе и всегда читается из общего кэша
+        cache.set('cart:summary:buyer:1', {'count': 1})
+        self.shared.set('cart:summary:buyer:1', {'count': 2})
+        self.assertEqual(cache.get('cart:summary:buyer:1'), {'count': 2})
+
+    def test_incr_and_delete_update_both_tiers(self):
+        cache.set('products:version', 1)
+        self.assertEqual(cache.incr('products:version'), 2)
+        self.assertEqual(self.shared.get('products:version'), 2)
+        self.assertEqual(cache.get('products:version'), 2)
+        cache.delete('products:version')
+        self.assertIsNone(cache.get('products:version'))
+
+    def test_namespace_timeouts(self):
+        with mock.patch.object(self.shared, 'set', wraps=self.shared.set) as shared_set:
+            cache.set('cart:summary:buyer:1', 1)
+            cache.set('other:key', 1)
+            cache.set('products:key', 1, 10)
+        self.assertEqual([call.args[2] for call in shared_set.call_args_list], [3600, 300, 10])
+
+    def test_cached_values_are_copies(self):
+        value = cache.get_or_set('products:list', lambda: [1])
+        value.append(2)
+        self.assertEqual(cache.get('products:list'), [1])
+
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.product = Product.objects.create(master=self.master, name='Яблоко', description='', price=1, stock=10)
+        self.url = reverse('products:product_table')
+
+    def test_anonymous_page_is_shared_and_has_no_visitor_data(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        self.assertNotContains(first, 'name="csrfmiddlewaretoken" value=')
+        self.assertContains(first, reverse('page_fragment'))
+        # Единственный запрос — время последнего изменения товаров (catalog_state)
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url, {'utm_source': 'ad'})
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+        # HTML страниц не занимает LRU процесса
+        self.assertFalse([key for key in cache._local._data if ':pages:' in key])
+        self.assertEqual(cache.stats()['pages']['local_hits'], 0)
+        self.assertEqual(self.client.get(self.url, {'search': 'груша'})['X-Page-Cache'], 'miss')
+
+    def test_catalog_change_renders_page_again(self):
+        self.client.get(self.url)
+        self.product.name = 'Груша'
+        self.product.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Груша')
+
+    def test_authenticated_pages_are_not_cached(self):
+        self.client.force_login(User.objects.create_user(username='buyer', role='buyer'))
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'name="csrfmiddlewaretoken" value=')
+
+    def test_fragment_returns_visitor_data(self):
+        response = self.client.get(reverse('page_fragment'))
+        data = response.json()
+        self.assertTrue(data['csrf_token'])
+        self.assertEqual((data['cart_count'], data['messages']), (0, []))
+        self.assertIn('no-cache', response['Cache-Control'])
+        # Ради пустой корзины сессия не создаётся
+        self.assertNotIn('sessionid', response.cookies)
+
+        self.client.post(reverse('cart:add_to_cart', args=[self.product.pk]), {'quantity': 2})
+        data = self.client.get(reverse('page_fragment')).json()
+        self.assertEqual(data['cart_count'], 2)
+        self.assertEqual([message['tags'] for message in data['messages']], ['success'])
+
+
+class ConditionalGetTests(TestCase):
+    """Повторный запрос с If-None-Match получает 304 без рендеринга шаблона"""
+
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.buyer = User.objects.create_user(username='buyer', role='buyer')
+        self.product = Product.objects.create(master=self.master, name='Яблоко', description='', price=1, stock=10)
+
+    def revalidate(self, url, etag):
+        with mock.patch('products.views.render', side_effect=AssertionError('шаблон отрендерен')):
+            return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_product_detail(self):
+        url = reverse('products:product_detail', args=[self.product.pk])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate(url, etag).status_code, 304)
+
+        # Списание остатка UPDATE-ом тоже меняет ETag
+        item = CartItem(buyer=self.buyer, product=self.product, quantity=0)
+        reserve(item, 3)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_product_table(self):
+        url = reverse('products:product_table')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {'search': 'груша'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # Резерв списывает остаток UPDATE-ом без сигналов, но страница с остатком меняется
+        reserve(CartItem(buyer=self.buyer, product=self.product, quantity=0), 3)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'max="7"')
+        etag = response['ETag']
+
+        # Страница вошедшего пользователя не совпадает с анонимной
+        self.client.force_login(self.buyer)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.revalidate(url, response['ETag']).status_code, 304)
+
+        Category.objects.create(name='Фрукты')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_updated_at_tracks_queryset_updates(self):
+        before = self.product.updated_at
+        reserve(CartItem(buyer=self.buyer, product=self.product, quantity=0), 1)
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.updated_at, before)
+
+
+class CatalogApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.category = Category.objects.create(name='Фрукты')
+        for i in range(5):
+            Product.objects.create(
+                master=self.master, category=self.category, name=f'Товар {i}', description='', price=i + 1
+            )
+
+    def test_pages_are_built_from_values_without_models(self):
+        url = reverse('products:api_products')
+        names = []
+        cursor = None
+        with mock.patch.object(Product, 'from_db', side_effect=AssertionError('создан экземпляр модели')):
+            while True:
+                params = {'limit': 2, 'fields': 'name,category_name,price'}
+                if cursor:
+                    params['cursor'] = cursor
+                data = self.client.get(url, params).json()
+                self.assertEqual(set(data['results'][0]), {'name', 'category_name', 'price'})
+                names += [row['name'] for row in data['results']]
+                cursor = data['next']
+                if not cursor:
+                    break
+        self.assertEqual(names, [f'Товар {i}' for i in reversed(range(5))])
+        self.assertEqual(data['results'][0]['category_name'], 'Фрукты')
+
+    def test_invalid_parameters(self):
+        url = reverse('products:api_products')
+        response = self.client.get(url, {'fields': 'name,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['message'])
+        self.assertEqual(self.client.get(url, {'limit': 1000}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'category': 'x'}).status_code, 400)
+
+    def test_gzip_and_categories(self):
+        response = self.client.get(reverse('products:api_products'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        data = self.client.get(reverse('products:api_categories'), {'fields': 'id,name'}).json()
+        self.assertEqual(data['results'], [{'id': self.category.pk, 'name': 'Фрукты'}])
+
+
+class CatalogSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.category = Category.objects.create(name='Фрукты')
+        self.products = [
+            Product.objects.create(master=self.master, category=self.category, name=f'Товар {i}', description='', price=1)
+            for i in range(3)
+        ]
+
+    def changes(self, version):
+        return self.client.get(reverse('products:api_sync_changes'), {'since': version}).json()
+
+    # Без запаса на поздние фиксации транзакций, чтобы в ответ попадали только новые изменения
+    @mock.patch('products.sync.SYNC_OVERLAP', timedelta(0))
+    def test_snapshot_then_changes(self):
+        snapshot = self.client.get(reverse('products:api_sync_snapshot')).json()
+        self.assertEqual(len(snapshot['products']), 3)
+        self.assertEqual(snapshot['categories'], [{'id': self.category.pk, 'name': 'Фрукты'}])
+        self.assertEqual(self.changes(snapshot['version'])['products'], [])
+
+        changed, deleted, _ = self.products
+        changed.name = 'Новое название'
+        changed.save()
+        deleted_pk = deleted.pk
+        deleted.delete()
+        data = self.changes(snapshot['version'])
+        self.assertEqual([row['name'] for row in data['products']], ['Новое название'])
+        self.assertEqual(data['deleted'], [deleted_pk])
+        self.assertEqual(self.changes(data['version'])['deleted'], [])
+
+    @mock.patch('products.sync.SYNC_OVERLAP', timedelta(0))
+    def test_stock_and_category_changes_are_included(self):
+        version = self.client.get(reverse('products:api_sync_snapshot')).json()['version']
+        reserve(CartItem(session_key='s', product=self.products[0], quantity=0), 1)
+        self.assertEqual([row['id'] for row in self.changes(version)['products']], [self.products[0].pk])
+        self.category.delete()
+        self.assertEqual(len(self.changes(version)['products']), 3)
+
+    def test_stale_or_invalid_version(self):
+        stale = encode_version(timezone.now() - TOMBSTONE_RETENTION - timedelta(days=1))
+        self.assertEqual(self.changes(stale), {'reset': True})
+        self.assertEqual(self.client.get(reverse('products:api_sync_changes'), {'since': 'x'}).status_code, 400)
+
+        Product.objects.all().delete()
+        self.assertEqual(purge_tombstones(), 0)
+        self.assertEqual(purge_tombstones(now=timezone.now() + TOMBSTONE_RETENTION * 2), 3)
+
+    def test_offline_shell_and_service_worker(self):
+        self.client.force_login(self.master)
+        response = self.client.get(reverse('products:product_table_offline'))
+        # Оболочку сохраняет service worker, данных посетителя в ней нет
+        self.assertNotContains(response, 'name="csrfmiddlewaretoken" value=')
+        self.assertNotContains(response, reverse('accounts:logout'))
+        self.assertContains(response, 'catalog_store.js')
+        response = self.client.get('/serviceworker.js')
+        self.assertEqual(response['Content-Type'], 'application/javascript')
+        self.assertIn(b'/products/table/offline/', response.content)
@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from . import views_api
 from . import views_debug
 
 app_name = 'products'
@@ -7,7 +8,10 @@ app_name = 'products'
 urlpatterns = [
     path('', views.product_list, name='product_list'),
     path('table/', views.product_table, name='product_table'),
+    path('table/offline/', views.product_table_offline, name='product_table_offline'),
     path('my-products/', views.my_products, name='my_products'),
+    path('my-products/import/', views.product_import, name='product_import'),
+    path('my-products/export/', views.product_export, name='product_export'),
     path('add/', views.product_add, name='product_add'),
     path('<int:pk>/', views.product_detail, name='product_detail'),
     path('<int:pk>/edit/', views.product_edit, name='product_edit'),
@@ -20,6 +24,12 @@ urlpatterns = [
     path('categories/<int:pk>/edit/', views.category_edit, name='category_edit'),
     path('categories/<int:pk>/delete/', views.category_delete, name='category_delete'),
     
+    # JSON API каталога (только чтение)
+    path('api/products/', views_api.product_list, name='api_products'),
+    path('api/categories/', views_api.category_list, name='api_categories'),
+    path('api/sync/snapshot/', views_api.sync_snapshot, name='api_sync_snapshot'),
+    path('api/sync/changes/', views_api.sync_changes, name='api_sync_changes'),
+
     # Диагностические URL (только для администраторов)
     path('debug/check-s3-images/', views_debug.check_s3_images, name='check_s3_images'),
     path('debug/test-s3-images/', views_debug.test_s3_images, name='test_s3_images'),
@@ -1,13 +1,31 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from .models import Product, Category
 from cart.models import CartItem
 from .forms import ProductForm, CategoryForm
-from django.core.paginator import Paginator
+from .pagination import DEFAULT_ORDERING, KeysetPaginator
+from .search import search_products
+from .caching import get_categories, get_categories_with_products
+from .conditional import catalog_page_etag, product_etag
+from .page_cache import cache_anonymous_page
+from reviews.forms import ReviewForm
+from reviews.models import Review
+from .catalog_io import (
+    HEADERS, OPENPYXL_AVAILABLE, XLSX_CONTENT_TYPE as CATALOG_XLSX_CONTENT_TYPE,
+    CatalogImportError, export_xlsx, import_products, stream_csv,
+)
+from urllib.parse import urlencode
 
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import AnonymousUser
+from django.views.decorators.http import condition
 from django.contrib import messages
 
+# Параметры запроса, от которых зависит страница каталога
+PRODUCT_TABLE_PARAMS = ('search', 'category', 'sort', 'cursor')
+RATING_ORDERING = ('-rating_average', '-rating_count', '-id')
+REVIEWS_PER_PAGE = 10
+
 @login_required
 def my_products(request):
     """Отображение товаров текущего пользователя (продавца/мастера)"""
@@ -16,12 +34,11 @@ def my_products(request):
         return redirect('products:product_list')
     
     # Получаем товары текущего пользователя
-    products = Product.objects.filter(master=request.user).order_by('-created_at')
+    products = Product.objects.select_related('category').filter(master=request.user)
     
-    # Пагинация
-    paginator = Paginator(products, 10)  # 10 товаров на страницу
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Курсорная пагинация по (created_at, id)
+    paginator = KeysetPaginator(products, 10)  # 10 товаров на страницу
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'products': page_obj,
@@ -30,13 +47,56 @@ def my_products(request):
     }
     return render(request, 'products/my_products.html', context)
 
+@login_required
+def product_import(request):
+    """Импорт товаров продавца из файла xlsx/csv с обновлением по артикулу"""
+    if not hasattr(request.user, 'role') or request.user.role != 'master':
+        return redirect('products:product_list')
+
+    report = None
+    if request.method == 'POST':
+        uploaded_file = request.FILES.get('file')
+        if not uploaded_file:
+            messages.error(request, 'Выберите файл для импорта.')
+            return redirect('products:product_import')
+        try:
+            report = import_products(request.user, uploaded_file)
+        except CatalogImportError as error:
+            messages.error(request, str(error))
+            return redirect('products:product_import')
+        messages.success(
+            request,
+            f'Импорт завершён: создано {report.created}, обновлено {report.updated}, ошибок {report.error_count}.'
+        )
+
+    return render(request, 'products/product_import.html', {
+        'report': report,
+        'headers': HEADERS,
+    })
+
+@login_required
+def product_export(request):
+    """Выгрузка товаров продавца в CSV (потоком) или Excel"""
+    if not hasattr(request.user, 'role') or request.user.role != 'master':
+        return redirect('products:product_list')
+
+    if request.GET.get('format') == 'xlsx' and OPENPYXL_AVAILABLE:
+        return FileResponse(
+            export_xlsx(request.user),
+            as_attachment=True,
+            filename='products.xlsx',
+            content_type=CATALOG_XLSX_CONTENT_TYPE,
+        )
+
+    response = StreamingHttpResponse(stream_csv(request.user), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="products.csv"'
+    return response
+
 def product_list(request):
     category_id = request.GET.get('category')
-    products = Product.objects.all().order_by('-created_at')
+    products = Product.objects.select_related('primary_image').order_by('-created_at')
     # Показываем только категории, в которых есть товары
-    categories = Category.objects.filter(
-        id__in=Product.objects.exclude(category__isnull=True).values_list('category_id', flat=True).distinct()
-    ).order_by('name')
+    categories = get_categories_with_products()
 
     if category_id:
         products = products.filter(category_id=category_id)
@@ -48,9 +108,30 @@ def product_list(request):
     }
     return render(request, 'products/product_list.html', context)
 
+@condition(etag_func=product_etag)
 def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-    return render(request, 'products/product_detail.html', {'product': product})
+    product = get_object_or_404(
+        Product.objects.select_related('category', 'master', 'primary_image', 'rating_stats').prefetch_related('images'),
+        pk=pk
+    )
+
+    # Отзывы — курсорная пагинация по (created_at, id); средняя оценка и
+    # гистограмма берутся из агрегатов, без подсчёта по отзывам
+    reviews = KeysetPaginator(
+        Review.objects.filter(product=product).select_related('author'), REVIEWS_PER_PAGE
+    ).get_page(request.GET.get('reviews'))
+
+    own_review = None
+    if request.user.is_authenticated and product.master_id != request.user.pk:
+        own_review = Review.objects.filter(product=product, author=request.user).first()
+
+    return render(request, 'products/product_detail.html', {
+        'product': product,
+        'reviews': reviews,
+        'rating_stats': getattr(product, 'rating_stats', None),
+        'own_review': own_review,
+        'review_form': ReviewForm(instance=own_review) if request.user.is_authenticated else None,
+    })
 
 # Функция add_to_cart перемещена в cart/views.py для поддержки анонимных пользователей
 
@@ -121,35 +202,64 @@ def product_delete(request, pk):
         return redirect('products:my_products')
     return redirect('products:my_products')
 
+@condition(etag_func=catalog_page_etag(PRODUCT_TABLE_PARAMS))
+@cache_anonymous_page('product_table', params=PRODUCT_TABLE_PARAMS)
 def product_table(request):
     """Отображение товаров в виде таблицы Excel"""
     search_query = request.GET.get('search', '')
     category_id = request.GET.get('category')
     
-    products = Product.objects.select_related('category').all().order_by('-created_at')
-    categories = Category.objects.all()
+    products = Product.objects.select_related('category').all()
+    categories = get_categories()
 
-    # Фильтрация по поиску
-    if search_query:
-        products = products.filter(name__icontains=search_query)
-    
     # Фильтрация по категории
     if category_id:
         products = products.filter(category_id=category_id)
 
-    # Пагинация
-    paginator = Paginator(products, 20)  # 20 товаров на страницу
-    page_number = request.GET.get('page')
-    products = paginator.get_page(page_number)
+    # Полнотекстовый поиск, результаты сортируются по релевантности
+    ordering = DEFAULT_ORDERING
+    if search_query:
+        products = search_products(products, search_query)
+        ordering = ('-search_rank',) + DEFAULT_ORDERING
+
+    # Сортировка по рейтингу (вместо релевантности) идёт по индексу
+    # product_rating_idx / product_cat_rating_idx, без агрегации отзывов
+    sort = request.GET.get('sort', '')
+    if sort == 'rating':
+        ordering = RATING_ORDERING
+
+    # Курсорная пагинация по ключу сортировки
+    paginator = KeysetPaginator(products, 20, ordering=ordering)  # 20 товаров на страницу
+    products = paginator.get_page(request.GET.get('cursor'))
+
+    # Параметры фильтров, которые нужно сохранить в ссылках пагинации
+    filter_params = {}
+    if search_query:
+        filter_params['search'] = search_query
+    if category_id:
+        filter_params['category'] = category_id
+    if sort == 'rating':
+        filter_params['sort'] = sort
 
     context = {
         'products': products,
         'categories': categories,
         'search_query': search_query,
+        'sort': sort,
+        'filter_query': urlencode(filter_params),
         'selected_category': int(category_id) if category_id else None,
     }
     return render(request, 'products/product_table.html', context)
 
+def product_table_offline(request):
+    """
+    Оболочка каталога, которую service worker сохраняет для работы без сети:
+    товары выводятся скриптом из IndexedDB. Страница одинакова для всех
+    посетителей, данные посетителя подгружаются как у кэшированных страниц.
+    """
+    request.cached_page = True
+    return render(request, 'products/product_table_offline.html', {'user': AnonymousUser()})
+
 @login_required
 def category_add(request):
     """Создание новой категории продавцом"""
@@ -0,0 +1,154 @@
+"""
+JSON API каталога только для чтения (PWA и внутренние инструменты).
+
+Строки выбираются через values(), без создания экземпляров моделей;
+параметр fields= задаёт набор полей ответа, страницы товаров выбираются
+курсором (products.pagination.KeysetPaginator). Ответы сжимаются gzip,
+если клиент передал Accept-Encoding: gzip.
+"""
+
+from django.db.models import F
+from django.http import JsonResponse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET
+
+from .caching import get_categories
+from .models import Product
+from .pagination import DEFAULT_ORDERING, KeysetPaginator
+from .search import search_products
+from .sync import decode_version, get_changes, get_snapshot
+
+# Поле ответа -> поле модели (строка) или выражение
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'sku': 'sku',
+    'description': 'description',
+    'category_id': 'category_id',
+    'category_name': F('category__name'),
+    'volume': 'volume',
+    'package_type': 'package_type',
+    'quantity_in_package': 'quantity_in_package',
+    'price': 'price',
+    'price_per_unit': 'price_per_unit',
+    'price_per_package': 'price_per_package',
+    'old_price': 'old_price',
+    'stock': 'stock',
+    'image': F('primary_image_url'),
+    'rating_average': 'rating_average',
+    'rating_count': 'rating_count',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+DEFAULT_PRODUCT_FIELDS = (
+    'id', 'name', 'category_id', 'price_per_unit', 'price_per_package', 'quantity_in_package', 'stock', 'image',
+)
+
+CATEGORY_FIELDS = ('id', 'name', 'description', 'is_global')
+
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+
+# Кириллица без \uXXXX-последовательностей и без пробелов между элементами
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+class ApiError(ValueError):
+    pass
+
+
+def api_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params=JSON_PARAMS)
+
+
+def parse_fields(request, allowed, default):
+    """Поля из параметра fields= (через запятую) в порядке запроса"""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(default)
+    fields = list(dict.fromkeys(field.strip() for field in raw.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}. Доступные: {", ".join(allowed)}')
+    return fields
+
+
+def parse_limit(request):
+    raw = request.GET.get('limit')
+    if not raw:
+        return API_PAGE_SIZE
+    if not raw.isdigit() or not 1 <= int(raw) <= API_MAX_PAGE_SIZE:
+        raise ApiError(f'limit должен быть числом от 1 до {API_MAX_PAGE_SIZE}')
+    return int(raw)
+
+
+@gzip_page
+@require_GET
+def product_list(request):
+    """
+    Страница товаров: {'results': [...], 'next': курсор, 'previous': курсор}.
+    Параметры: fields, limit, cursor, category, search.
+    """
+    try:
+        fields = parse_fields(request, PRODUCT_FIELDS, DEFAULT_PRODUCT_FIELDS)
+        limit = parse_limit(request)
+        category_id = request.GET.get('category')
+        if category_id and not category_id.isdigit():
+            raise ApiError('category должен быть числом')
+    except ApiError as e:
+        return api_response({'success': False, 'message': str(e)}, status=400)
+
+    products = Product.objects.all()
+    if category_id:
+        products = products.filter(category_id=category_id)
+    ordering = DEFAULT_ORDERING
+    search_query = request.GET.get('search', '').strip()
+    if search_query:
+        products = search_products(products, search_query)
+        ordering = ('-search_rank',) + DEFAULT_ORDERING
+
+    # Поля ключа сортировки нужны курсору, даже если их нет в ответе
+    columns = [PRODUCT_FIELDS[field] for field in fields if isinstance(PRODUCT_FIELDS[field], str)]
+    expressions = {field: PRODUCT_FIELDS[field] for field in fields if not isinstance(PRODUCT_FIELDS[field], str)}
+    columns += [key for key in (field.lstrip('-') for field in ordering) if key not in columns]
+    rows = products.values(*columns, **expressions)
+
+    page = KeysetPaginator(rows, limit, ordering=ordering).get_page(request.GET.get('cursor'))
+    return api_response({
+        'results': [{field: row[field] for field in fields} for row in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+@gzip_page
+@require_GET
+def category_list(request):
+    """Все категории (из общего кэша): {'results': [...]}. Параметр: fields"""
+    try:
+        fields = parse_fields(request, CATEGORY_FIELDS, CATEGORY_FIELDS)
+    except ApiError as e:
+        return api_response({'success': False, 'message': str(e)}, status=400)
+    return api_response({
+        'results': [{field: getattr(category, field) for field in fields} for category in get_categories()],
+    })
+
+
+@gzip_page
+@require_GET
+def sync_snapshot(request):
+    """Снимок каталога для офлайн-копии PWA: {'version', 'products', 'categories'}"""
+    return api_response(get_snapshot())
+
+
+@gzip_page
+@require_GET
+def sync_changes(request):
+    """
+    Изменения каталога с версии since: {'version', 'products', 'deleted', 'categories'};
+    {'reset': true}, если клиенту нужно заново загрузить снимок.
+    """
+    since = decode_version(request.GET.get('since'))
+    if since is None:
+        return api_response({'success': False, 'message': 'since должен быть версией из предыдущего ответа'}, status=400)
+    return api_response(get_changes(since))
@@ -6,49 +6,60 @@ from django.http import JsonResponse
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
 from django.conf import settings
-from .models import ProductImage
-from .templatetags.s3_helpers import check_s3_file_exists
+from .image_audit import start_in_background
+from .models import ImageAudit
+
+# Сколько проблемных изображений возвращается в ответе
+AUDIT_ISSUES_LIMIT = 200
+
 
 @staff_member_required
 def check_s3_images(request):
     """
-    Проверяет доступность всех изображений продуктов в S3.
+    Проверка доступности всех изображений продуктов в S3.
     Доступно только для администраторов.
+
+    POST запускает (или продолжает прерванную) проверку в фоне,
+    GET с format=json возвращает состояние последней проверки и
+    найденные проблемы из таблицы результатов, без запросов к S3.
     """
+    if request.method == 'POST':
+        audit, started = start_in_background()
+        if started:
+            message = f'Проверка #{audit.pk} запущена'
+        else:
+            message = 'Проверка уже выполняется'
+        return JsonResponse({'success': started, 'message': message, 'audit_id': audit.pk if audit else None})
+
     # Если запрос на страницу HTML
     if request.GET.get('format') != 'json':
         return render(request, 'products/debug_s3_images.html')
-        
+
+    audit = ImageAudit.objects.first()
     results = []
-    
-    # Получаем все изображения продуктов
-    images = ProductImage.objects.all()[:20]  # Ограничиваем 20 для быстрого ответа
-    
-    for img in images:
-        try:
-            # Получаем URL
-            direct_url = img.get_direct_s3_url()
-            
-            # Проверяем доступность
-            exists = check_s3_file_exists(direct_url)
-            
-            results.append({
-                'product_id': img.product_id,
-                'product_name': img.product.name,
-                'image_id': img.id,
-                'image_name': img.image.name,
-                'direct_url': direct_url,
-                'exists': exists
-            })
-        except Exception as e:
+    if audit is not None:
+        issues = audit.issues.select_related('image__product').order_by('image_id')[:AUDIT_ISSUES_LIMIT]
+        for issue in issues:
             results.append({
-                'product_id': img.product_id,
-                'image_id': img.id,
-                'error': str(e)
+                'product_id': issue.image.product_id,
+                'product_name': issue.image.product.name,
+                'image_id': issue.image_id,
+                'image_name': issue.image.image.name,
+                'direct_url': issue.url,
+                'status_code': issue.status_code,
+                'error': issue.error,
             })
-    
-    # Возвращаем информацию в JSON
+
     return JsonResponse({
+        'audit': None if audit is None else {
+            'id': audit.pk,
+            'started_at': audit.started_at.isoformat(),
+            'finished_at': audit.finished_at.isoformat() if audit.finished_at else None,
+            'total': audit.total,
+            'checked': audit.checked,
+            'missing': audit.missing,
+            'failed': audit.failed,
+        },
         'count': len(results),
         'results': results,
         'bucket': settings.AWS_STORAGE_BUCKET_NAME,
@@ -1,3 +1,33 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ProductRating, Review
+from .ratings import delete_review
+
+
+@admin.register(Review)
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ['product', 'author', 'rating', 'created_at']
+    list_filter = ['rating', 'created_at']
+    search_fields = ['product__name', 'author__username', 'text']
+    # Отзывы пишут покупатели; в админке их можно только просматривать и удалять
+    readonly_fields = ['product', 'author', 'rating', 'text', 'created_at', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    # Удаление через reviews.ratings, чтобы обновились агрегаты товара
+    def delete_model(self, request, obj):
+        delete_review(obj)
+
+    def delete_queryset(self, request, queryset):
+        for review in queryset:
+            delete_review(review)
+
+
+@admin.register(ProductRating)
+class ProductRatingAdmin(admin.ModelAdmin):
+    list_display = ['product', 'count', 'total', 'stars_5', 'stars_4', 'stars_3', 'stars_2', 'stars_1']
+    readonly_fields = ['product', 'count', 'total', 'stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5']
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,17 @@
+from django import forms
+
+from .models import Review
+
+
+class ReviewForm(forms.ModelForm):
+    class Meta:
+        model = Review
+        fields = ['rating', 'text']
+        labels = {
+            'rating': 'Оценка',
+            'text': 'Отзыв',
+        }
+        widgets = {
+            'rating': forms.RadioSelect,
+            'text': forms.Textarea(attrs={'rows': 3, 'placeholder': 'Расскажите о товаре (необязательно)'}),
+        }
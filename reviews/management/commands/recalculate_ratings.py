@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from reviews.ratings import recalculate_ratings
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает агрегаты рейтинга товаров по отзывам (например, после удаления пользователей)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', type=int, nargs='*', help='id товаров; без них — все товары с отзывами')
+
+    def handle(self, *args, **options):
+        updated = recalculate_ratings(options['product_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано товаров: {updated}'))
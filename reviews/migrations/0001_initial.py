@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:57
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('products', '0017_product_rating'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to='products.product', verbose_name='Товар')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Отзывов')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('stars_1', models.PositiveIntegerField(default=0, verbose_name='Оценок 1')),
+                ('stars_2', models.PositiveIntegerField(default=0, verbose_name='Оценок 2')),
+                ('stars_3', models.PositiveIntegerField(default=0, verbose_name='Оценок 3')),
+                ('stars_4', models.PositiveIntegerField(default=0, verbose_name='Оценок 4')),
+                ('stars_5', models.PositiveIntegerField(default=0, verbose_name='Оценок 5')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг товара',
+                'verbose_name_plural': 'Рейтинги товаров',
+            },
+        ),
+        migrations.CreateModel(
+            name='Review',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.PositiveSmallIntegerField(choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5')], validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)], verbose_name='Оценка')),
+                ('text', models.TextField(blank=True, verbose_name='Текст отзыва')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создан')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменён')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='products.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Отзыв',
+                'verbose_name_plural': 'Отзывы',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'author'), name='review_product_author_uniq'), models.CheckConstraint(condition=models.Q(('rating__gte', 1), ('rating__lte', 5)), name='review_rating_range')],
+            },
+        ),
+    ]
@@ -1,3 +1,80 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
-# Create your models here.
+from accounts.models import User
+from products.models import Product
+
+RATING_CHOICES = [(stars, str(stars)) for stars in range(1, 6)]
+
+
+class Review(models.Model):
+    """
+    Отзыв покупателя о товаре: один на пару (товар, автор).
+    Создаётся, изменяется и удаляется только через reviews.ratings,
+    чтобы агрегаты ProductRating оставались согласованными.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews', verbose_name='Товар')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews', verbose_name='Автор')
+    rating = models.PositiveSmallIntegerField(
+        choices=RATING_CHOICES,
+        validators=[MinValueValidator(1), MaxValueValidator(5)],
+        verbose_name='Оценка'
+    )
+    text = models.TextField(blank=True, verbose_name='Текст отзыва')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создан')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
+
+    class Meta:
+        verbose_name = 'Отзыв'
+        verbose_name_plural = 'Отзывы'
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Курсорная пагинация отзывов на странице товара
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'author'], name='review_product_author_uniq'),
+            models.CheckConstraint(condition=models.Q(rating__gte=1, rating__lte=5), name='review_rating_range'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name}: {self.rating} от {self.author.username}"
+
+
+class ProductRating(models.Model):
+    """
+    Агрегаты отзывов товара: количество, сумма оценок и число оценок
+    каждого значения. Изменяются на величину изменения при каждой записи
+    отзыва в той же транзакции, поэтому средняя оценка и гистограмма
+    не требуют агрегации по отзывам.
+    """
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rating_stats',
+        verbose_name='Товар'
+    )
+    count = models.PositiveIntegerField(default=0, verbose_name='Отзывов')
+    total = models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')
+    stars_1 = models.PositiveIntegerField(default=0, verbose_name='Оценок 1')
+    stars_2 = models.PositiveIntegerField(default=0, verbose_name='Оценок 2')
+    stars_3 = models.PositiveIntegerField(default=0, verbose_name='Оценок 3')
+    stars_4 = models.PositiveIntegerField(default=0, verbose_name='Оценок 4')
+    stars_5 = models.PositiveIntegerField(default=0, verbose_name='Оценок 5')
+
+    class Meta:
+        verbose_name = 'Рейтинг товара'
+        verbose_name_plural = 'Рейтинги товаров'
+
+    def __str__(self):
+        return f"{self.product_id}: {self.count} отзывов"
+
+    @property
+    def histogram(self):
+        """Строки гистограммы от 5 до 1: (оценка, количество, доля в процентах)"""
+        return [
+            (stars, getattr(self, f'stars_{stars}'),
+             round(getattr(self, f'stars_{stars}') * 100 / self.count) if self.count else 0)
+            for stars in range(5, 0, -1)
+        ]
@@ -0,0 +1,120 @@
+"""
+Запись отзывов и поддержка агрегатов рейтинга.
+
+Каждая запись отзыва блокирует строку ProductRating товара, изменяет
+агрегаты на величину изменения и копирует среднюю оценку и количество
+отзывов в товар (Product.rating_average, Product.rating_count) — всё
+в одной транзакции. Блокировка упорядочивает параллельные отзывы
+одного товара, поэтому агрегаты не расходятся с отзывами. После
+фиксации меняется версия каталога: рейтинг виден в его страницах.
+Изменение одного текста отзыва агрегаты не трогает, но тоже отмечает
+изменение товара.
+
+Отзывы, удалённые каскадом (вместе с пользователем), агрегаты не
+меняют; их пересчитывает команда recalculate_ratings.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from products.caching import invalidate_catalog
+from products.models import Product
+from .models import ProductRating, Review
+
+
+def _locked_stats(product_id):
+    stats, _ = ProductRating.objects.select_for_update().get_or_create(product_id=product_id)
+    return stats
+
+
+def average(count, total):
+    if not count:
+        return Decimal('0')
+    return (Decimal(total) / count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def _apply(stats, added=None, removed=None):
+    """Изменяет агрегаты на добавленную и/или удалённую оценку и обновляет товар"""
+    for rating, sign in ((added, 1), (removed, -1)):
+        if rating is None:
+            continue
+        stats.count += sign
+        stats.total += sign * rating
+        field = f'stars_{rating}'
+        setattr(stats, field, getattr(stats, field) + sign)
+    stats.save()
+    _touch_product(
+        stats.product_id,
+        rating_average=average(stats.count, stats.total),
+        rating_count=stats.count,
+    )
+
+
+def _touch_product(product_id, **fields):
+    """Отмечает изменение товара: отзывы видны на его странице и в каталоге"""
+    # updated_at меняет ETag страницы товара (products.conditional)
+    Product.objects.filter(pk=product_id).update(updated_at=timezone.now(), **fields)
+    transaction.on_commit(invalidate_catalog)
+
+
+def save_review(product, author, rating, text=''):
+    """
+    Создаёт отзыв автора о товаре или изменяет уже оставленный.
+    Возвращает (review, created).
+    """
+    with transaction.atomic():
+        stats = _locked_stats(product.pk)
+        review = Review.objects.filter(product=product, author=author).first()
+        if review is None:
+            review = Review.objects.create(product=product, author=author, rating=rating, text=text)
+            _apply(stats, added=rating)
+            return review, True
+
+        previous = review.rating
+        review.rating = rating
+        review.text = text
+        review.save(update_fields=['rating', 'text', 'updated_at'])
+        if previous != rating:
+            _apply(stats, added=rating, removed=previous)
+        else:
+            # Изменился только текст: агрегаты те же, но страница товара другая
+            _touch_product(product.pk)
+    return review, False
+
+
+def delete_review(review):
+    with transaction.atomic():
+        stats = _locked_stats(review.product_id)
+        # Оценка читается под блокировкой: параллельный запрос мог изменить или удалить отзыв
+        rating = Review.objects.filter(pk=review.pk).values_list('rating', flat=True).first()
+        if rating is None:
+            return False
+        Review.objects.filter(pk=review.pk).delete()
+        _apply(stats, removed=rating)
+    return True
+
+
+def recalculate_ratings(product_ids=None):
+    """
+    Пересчитывает агрегаты по отзывам (после каскадных удалений или
+    ручных правок базы). Возвращает количество обработанных товаров.
+    """
+    products = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=product_ids)
+    products = products.filter(Q(reviews__isnull=False) | Q(rating_count__gt=0) | Q(rating_stats__isnull=False)).distinct()
+    updated = 0
+    for product_id in products.values_list('pk', flat=True).iterator():
+        with transaction.atomic():
+            stats = _locked_stats(product_id)
+            aggregates = Review.objects.filter(product_id=product_id).aggregate(
+                count=Count('id'),
+                total=Sum('rating', default=0),
+                **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)},
+            )
+            for field, value in aggregates.items():
+                setattr(stats, field, value)
+            _apply(stats)
+        updated += 1
+    return updated
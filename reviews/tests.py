@@ -1,3 +1,107 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import User
+from products.models import Product
+from .models import ProductRating, Review
+from .ratings import delete_review, recalculate_ratings, save_review
+
+
+class RatingAggregateTests(TestCase):
+    """Агрегаты рейтинга меняются вместе с каждым отзывом, без пересчёта по отзывам"""
+
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.product = Product.objects.create(master=self.master, name='Яблоки', description='', price=10)
+        self.buyers = [User.objects.create_user(username=f'buyer_{i}', role='buyer') for i in range(3)]
+
+    def assertAggregates(self, count, total, histogram, average):
+        stats = ProductRating.objects.get(product=self.product)
+        self.assertEqual((stats.count, stats.total), (count, total))
+        self.assertEqual([stats.stars_1, stats.stars_2, stats.stars_3, stats.stars_4, stats.stars_5], histogram)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_average), (count, Decimal(average)))
+
+    def test_create_update_delete(self):
+        save_review(self.product, self.buyers[0], 5)
+        save_review(self.product, self.buyers[1], 4)
+        self.assertAggregates(2, 9, [0, 0, 0, 1, 1], '4.50')
+
+        review, created = save_review(self.product, self.buyers[1], 1, 'Кислые')
+        self.assertFalse(created)
+        self.assertAggregates(2, 6, [1, 0, 0, 0, 1], '3.00')
+
+        self.assertTrue(delete_review(review))
+        self.assertFalse(delete_review(review))
+        self.assertAggregates(1, 5, [0, 0, 0, 0, 1], '5.00')
+
+    def test_write_does_not_aggregate_reviews(self):
+        for buyer in self.buyers[:2]:
+            save_review(self.product, buyer, 3)
+        with CaptureQueriesContext(connection) as queries:
+            save_review(self.product, self.buyers[2], 5)
+        self.assertFalse([query for query in queries if 'AVG(' in query['sql'] or 'COUNT(' in query['sql']])
+
+    def test_recalculate_repairs_cascade_deletes(self):
+        save_review(self.product, self.buyers[0], 2)
+        save_review(self.product, self.buyers[1], 4)
+        # Каскадное удаление вместе с пользователем агрегаты не меняет
+        self.buyers[1].delete()
+        self.assertEqual(recalculate_ratings(), 1)
+        self.assertAggregates(1, 2, [0, 1, 0, 0, 0], '2.00')
+
+
+class ReviewViewsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.master = User.objects.create_user(username='master', role='master')
+        self.product = Product.objects.create(master=self.master, name='Груши', description='', price=10)
+        self.buyer = User.objects.create_user(username='buyer', role='buyer')
+
+    def test_submit_and_seller_cannot_review_own_product(self):
+        self.client.force_login(self.buyer)
+        url = reverse('reviews:review_submit', args=[self.product.pk])
+        self.client.post(url, {'rating': 4, 'text': 'Сочные'})
+        self.client.post(url, {'rating': 6})
+        self.assertEqual(list(Review.objects.values_list('rating', flat=True)), [4])
+
+        self.client.force_login(self.master)
+        self.client.post(url, {'rating': 1})
+        self.assertEqual(Review.objects.count(), 1)
+
+    def test_detail_reviews_keyset_pages(self):
+        for i in range(13):
+            save_review(self.product, User.objects.create_user(username=f'reviewer_{i}'), 1 + i % 5, f'Отзыв {i}')
+        url = reverse('products:product_detail', args=[self.product.pk])
+        first = self.client.get(url).context['reviews']
+        self.assertEqual([review.text for review in first], [f'Отзыв {i}' for i in range(12, 2, -1)])
+        self.assertTrue(first.has_next())
+        second = self.client.get(url, {'reviews': first.next_cursor}).context['reviews']
+        self.assertEqual([review.text for review in second], ['Отзыв 2', 'Отзыв 1', 'Отзыв 0'])
+        self.assertFalse(second.has_next())
+
+    def test_text_edit_changes_detail_etag(self):
+        save_review(self.product, self.buyer, 4, 'Сочные')
+        url = reverse('products:product_detail', args=[self.product.pk])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            save_review(self.product, self.buyer, 4, 'Сочные и сладкие')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Сочные и сладкие')
 
-# Create your tests here.
+    def test_product_table_sorts_by_stored_rating(self):
+        other = Product.objects.create(master=self.master, name='Сливы', description='', price=10)
+        unrated = Product.objects.create(master=self.master, name='Айва', description='', price=10)
+        save_review(self.product, self.buyer, 3)
+        save_review(other, self.buyer, 5)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products:product_table'), {'sort': 'rating'})
+        self.assertEqual(list(response.context['products']), [other, self.product, unrated])
+        self.assertFalse([query for query in queries if 'reviews_' in query['sql']])
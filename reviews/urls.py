@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'reviews'
+
+urlpatterns = [
+    path('product/<int:product_id>/', views.review_submit, name='review_submit'),
+    path('product/<int:product_id>/delete/', views.review_delete, name='review_delete'),
+]
@@ -1,3 +1,50 @@
-from django.shortcuts import render
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 
-# Create your views here.
+from products.models import Product
+from .forms import ReviewForm
+from .models import Review
+from .ratings import delete_review, save_review
+
+
+def _product_reviews_url(product):
+    return reverse('products:product_detail', args=[product.pk]) + '#reviews'
+
+
+@login_required
+@require_POST
+def review_submit(request, product_id):
+    """
+    Отзыв о товаре: создаёт новый или изменяет уже оставленный пользователем
+    """
+    product = get_object_or_404(Product, pk=product_id)
+
+    if product.master_id == request.user.pk:
+        messages.error(request, "Нельзя оставить отзыв о своём товаре.")
+        return redirect(_product_reviews_url(product))
+
+    form = ReviewForm(request.POST)
+    if form.is_valid():
+        _, created = save_review(product, request.user, form.cleaned_data['rating'], form.cleaned_data['text'])
+        messages.success(request, "Спасибо за отзыв!" if created else "Отзыв обновлён.")
+    else:
+        for field, errors in form.errors.items():
+            for error in errors:
+                messages.error(request, f"Ошибка в поле {field}: {error}")
+
+    return redirect(_product_reviews_url(product))
+
+
+@login_required
+@require_POST
+def review_delete(request, product_id):
+    """
+    Удаление своего отзыва о товаре
+    """
+    review = get_object_or_404(Review.objects.select_related('product'), product_id=product_id, author=request.user)
+    if delete_review(review):
+        messages.success(request, "Отзыв удалён.")
+    return redirect(_product_reviews_url(review.product))